@@ -0,0 +1,126 @@
+"""Concurrent buyers hammering a single product through ``buy_product``.
+
+Run against a disposable database:
+
+    python -m benchmarks.bench_buy --buyers 32 --buys-per-buyer 50 --target 200
+
+Exits with status 1 if throughput falls below ``--target`` purchases/sec or if
+the final stock and balances do not add up.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+import uuid
+
+from sqlalchemy import delete
+
+from src.app.products.products_service import buy_product
+from src.core.db import AsyncSessionLocal, SessionLocal
+from src.core.models import Product, User, user_products
+
+
+def seed(buyers: int, stock: int, balance: int, price: int):
+    tag = uuid.uuid4().hex[:8]
+    db = SessionLocal()
+    try:
+        seller = User(username=f"bench-seller-{tag}", password="x", role="seller")
+        db.add(seller)
+        db.flush()
+        product = Product(
+            title=f"bench-product-{tag}", price=price, quantity=stock, owner_id=seller.id
+        )
+        users = [
+            User(username=f"bench-buyer-{tag}-{i}", password="x", balance=balance)
+            for i in range(buyers)
+        ]
+        db.add(product)
+        db.add_all(users)
+        db.commit()
+        return seller.id, product.id, [user.id for user in users]
+    finally:
+        db.close()
+
+
+async def buyer(product_id: int, user_id: int, buys: int):
+    latencies = []
+    succeeded = 0
+    async with AsyncSessionLocal() as db:
+        for _ in range(buys):
+            start = time.perf_counter()
+            if await buy_product(product_id, 1, user_id, db):
+                succeeded += 1
+            latencies.append(time.perf_counter() - start)
+    return succeeded, latencies
+
+
+async def run_buyers(product_id: int, user_ids: list[int], buys: int):
+    return await asyncio.gather(
+        *(buyer(product_id, user_id, buys) for user_id in user_ids)
+    )
+
+
+def cleanup(seller_id: int, user_ids: list[int]):
+    db = SessionLocal()
+    try:
+        db.execute(delete(user_products).where(user_products.c.user_id.in_(user_ids)))
+        db.execute(delete(Product).where(Product.owner_id == seller_id))
+        db.execute(delete(User).where(User.id.in_(user_ids + [seller_id])))
+        db.commit()
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--buyers", type=int, default=16)
+    parser.add_argument("--buys-per-buyer", type=int, default=50)
+    parser.add_argument("--stock", type=int, default=None)
+    parser.add_argument("--price", type=int, default=5)
+    parser.add_argument("--target", type=float, default=0.0)
+    args = parser.parse_args()
+
+    attempts = args.buyers * args.buys_per_buyer
+    stock = args.stock if args.stock is not None else attempts
+    balance = args.buys_per_buyer * args.price
+    seller_id, product_id, user_ids = seed(args.buyers, stock, balance, args.price)
+    try:
+        start = time.perf_counter()
+        results = asyncio.run(run_buyers(product_id, user_ids, args.buys_per_buyer))
+        elapsed = time.perf_counter() - start
+
+        db = SessionLocal()
+        try:
+            remaining = db.get(Product, product_id).quantity
+            balances = [
+                balance
+                for (balance,) in db.query(User.balance).filter(User.id.in_(user_ids))
+            ]
+        finally:
+            db.close()
+    finally:
+        cleanup(seller_id, user_ids)
+
+    succeeded = sum(result[0] for result in results)
+    latencies = sorted(latency for result in results for latency in result[1])
+    report = {
+        "buyers": args.buyers,
+        "attempts": attempts,
+        "succeeded": succeeded,
+        "elapsed_s": round(elapsed, 3),
+        "purchases_per_s": round(succeeded / elapsed, 1),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 2),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99)] * 1000, 2),
+        "oversold": stock - remaining != succeeded or remaining < 0,
+        "negative_balances": len([balance for balance in balances if balance < 0]),
+    }
+    print(json.dumps(report))
+    if report["oversold"] or report["negative_balances"]:
+        sys.exit(1)
+    if report["purchases_per_s"] < args.target:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Buy latency for a customer with a long purchase history.
+
+Seeds one buyer with ``--history`` past purchases spread over ``--products``
+products, then times sequential buys for that buyer and for a fresh buyer:
+
+    python -m benchmarks.bench_buy_history --history 100000 --buys 200
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+from sqlalchemy import delete, text
+
+from src.app.products.products_service import buy_product
+from src.core.db import AsyncSessionLocal, SessionLocal
+from src.core.models import Product, User, user_products
+
+
+def seed(products: int, history: int, buys: int):
+    tag = uuid.uuid4().hex[:8]
+    db = SessionLocal()
+    try:
+        seller = User(username=f"bench-seller-{tag}", password="x", role="seller")
+        db.add(seller)
+        db.flush()
+        catalog = [
+            Product(
+                title=f"bench-product-{tag}-{i}",
+                price=5,
+                quantity=history + 2 * buys,
+                owner_id=seller.id,
+            )
+            for i in range(products)
+        ]
+        buyers = [
+            User(username=f"bench-buyer-{tag}-{i}", password="x", balance=5 * buys)
+            for i in range(2)
+        ]
+        db.add_all(catalog + buyers)
+        db.flush()
+        product_ids = [product.id for product in catalog]
+        db.execute(
+            text(
+                """
+                INSERT INTO user_products (user_id, product_id, quantity, unit_price)
+                SELECT :user_id, (:product_ids)[1 + n % :products], 1, 5
+                FROM generate_series(1, :history) AS n
+                """
+            ),
+            {
+                "user_id": buyers[0].id,
+                "product_ids": product_ids,
+                "products": products,
+                "history": history,
+            },
+        )
+        db.execute(
+            text(
+                """
+                INSERT INTO user_product_totals
+                    (user_id, product_id, total_quantity, total_spent)
+                SELECT user_id, product_id, SUM(quantity), SUM(quantity) * 5
+                FROM user_products
+                WHERE user_id = :user_id
+                GROUP BY user_id, product_id
+                """
+            ),
+            {"user_id": buyers[0].id},
+        )
+        db.commit()
+        return seller.id, product_ids, [buyer.id for buyer in buyers]
+    finally:
+        db.close()
+
+
+def cleanup(seller_id: int, user_ids: list[int]):
+    db = SessionLocal()
+    try:
+        db.execute(delete(user_products).where(user_products.c.user_id.in_(user_ids)))
+        db.execute(delete(Product).where(Product.owner_id == seller_id))
+        db.execute(delete(User).where(User.id.in_(user_ids + [seller_id])))
+        db.commit()
+    finally:
+        db.close()
+
+
+async def time_buys(product_ids: list[int], user_id: int, buys: int):
+    latencies = []
+    async with AsyncSessionLocal() as db:
+        for i in range(buys):
+            start = time.perf_counter()
+            assert await buy_product(product_ids[i % len(product_ids)], 1, user_id, db)
+            latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return {
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 2),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99)] * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--history", type=int, default=100_000)
+    parser.add_argument("--products", type=int, default=50)
+    parser.add_argument("--buys", type=int, default=200)
+    args = parser.parse_args()
+
+    seller_id, product_ids, user_ids = seed(args.products, args.history, args.buys)
+    try:
+        fresh = asyncio.run(time_buys(product_ids, user_ids[1], args.buys))
+        with_history = asyncio.run(time_buys(product_ids, user_ids[0], args.buys))
+    finally:
+        cleanup(seller_id, user_ids)
+
+    print(
+        json.dumps(
+            {
+                "history": args.history,
+                "products": args.products,
+                "fresh_buyer": fresh,
+                "buyer_with_history": with_history,
+            }
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
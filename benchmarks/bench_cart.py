@@ -0,0 +1,157 @@
+"""Checkout latency for a cart, one POST /products/buy vs one buy per line.
+
+Seeds ``--cart-size`` products and ``--buyers`` buyers, then each buyer checks
+out ``--checkouts`` carts either as a single cart request or as a sequence of
+single-product buys:
+
+    python -m benchmarks.bench_cart --cart-size 10 --buyers 8 --checkouts 20
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+import httpx
+from sqlalchemy import delete
+
+from src.app.users.auth import create_token
+from src.core.config import settings
+from src.core.db import SessionLocal
+from src.core.models import Product, User, user_products
+from src.main import app
+
+
+def seed(cart_size: int, buyers: int, checkouts: int):
+    tag = uuid.uuid4().hex[:8]
+    db = SessionLocal()
+    try:
+        seller = User(username=f"bench-seller-{tag}", password="x", role="seller")
+        db.add(seller)
+        db.flush()
+        catalog = [
+            Product(
+                title=f"bench-product-{tag}-{i}",
+                price=5,
+                quantity=2 * buyers * checkouts,
+                owner_id=seller.id,
+            )
+            for i in range(cart_size)
+        ]
+        users = [
+            User(
+                username=f"bench-buyer-{tag}-{i}",
+                password="x",
+                balance=2 * 5 * cart_size * checkouts,
+            )
+            for i in range(buyers)
+        ]
+        db.add_all(catalog + users)
+        db.commit()
+        tokens = [
+            create_token({"sub": user.username, "role": "buyer", "id": user.id})
+            for user in users
+        ]
+        return seller.id, [p.id for p in catalog], [u.id for u in users], tokens
+    finally:
+        db.close()
+
+
+def cleanup(seller_id: int, user_ids: list[int]):
+    db = SessionLocal()
+    try:
+        db.execute(delete(user_products).where(user_products.c.user_id.in_(user_ids)))
+        db.execute(delete(Product).where(Product.owner_id == seller_id))
+        db.execute(delete(User).where(User.id.in_(user_ids + [seller_id])))
+        db.commit()
+    finally:
+        db.close()
+
+
+async def checkout_cart(client, product_ids, token):
+    r = await client.post(
+        f"{settings.API_V1_STR}/products/buy",
+        json={"lines": [{"product_id": id, "quantity": 1} for id in product_ids]},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    return r.status_code == 200
+
+
+async def checkout_singles(client, product_ids, token):
+    ok = True
+    for product_id in product_ids:
+        r = await client.get(
+            f"{settings.API_V1_STR}/products/buy/{product_id}?quantity=1",
+            headers={"Authorization": f"Bearer {token}"},
+        )
+        ok = ok and r.status_code == 200
+    return ok
+
+
+async def buyer_loop(client, checkout, product_ids, token, checkouts):
+    latencies = []
+    errors = 0
+    for _ in range(checkouts):
+        start = time.perf_counter()
+        if not await checkout(client, product_ids, token):
+            errors += 1
+        latencies.append(time.perf_counter() - start)
+    return latencies, errors
+
+
+async def run(checkout, orders, tokens, checkouts):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        results = await asyncio.gather(
+            *(
+                buyer_loop(client, checkout, product_ids, token, checkouts)
+                for product_ids, token in zip(orders, tokens)
+            )
+        )
+    latencies = sorted(latency for result in results for latency in result[0])
+    return {
+        "checkouts": len(latencies),
+        "errors": sum(result[1] for result in results),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 2),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99)] * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cart-size", type=int, default=10)
+    parser.add_argument("--buyers", type=int, default=8)
+    parser.add_argument("--checkouts", type=int, default=20)
+    args = parser.parse_args()
+    # Measure the handlers, not the per-client rate limits
+    app.state.limiter.enabled = False
+
+    seller_id, product_ids, user_ids, tokens = seed(
+        args.cart_size, args.buyers, args.checkouts
+    )
+    try:
+        # Alternate the line order between buyers so the cart path exercises
+        # the deterministic lock ordering.
+        orders = [product_ids if i % 2 else product_ids[::-1] for i in range(len(tokens))]
+        cart = asyncio.run(run(checkout_cart, orders, tokens, args.checkouts))
+        singles = asyncio.run(run(checkout_singles, orders, tokens, args.checkouts))
+    finally:
+        cleanup(seller_id, user_ids)
+
+    failed = cart["errors"] or singles["errors"]
+    print(
+        json.dumps(
+            {
+                "cart_size": args.cart_size,
+                "buyers": args.buyers,
+                "cart": cart,
+                "single_buys": singles,
+            }
+        )
+    )
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Catalog paging latency at increasing depth, OFFSET vs cursor.
+
+Seeds ``--products`` in-stock products (a tenth of them out of stock) and
+times fetching pages at several depths with ``pagenum`` and with ``after``:
+
+    python -m benchmarks.bench_catalog_paging --products 1000000
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+from sqlalchemy import delete, select, text
+
+from src.app.products.products_service import get_all_available_products
+from src.core.db import AsyncSessionLocal, SessionLocal
+from src.core.models import Product, User
+
+
+def seed(products: int):
+    tag = uuid.uuid4().hex[:8]
+    db = SessionLocal()
+    try:
+        seller = User(username=f"bench-seller-{tag}", password="x", role="seller")
+        db.add(seller)
+        db.flush()
+        db.execute(
+            text(
+                """
+                INSERT INTO products (title, price, quantity, description, owner_id)
+                SELECT :tag || '-' || n, 5, CASE WHEN n % 10 = 0 THEN 0 ELSE 1 END,
+                    'description', :owner_id
+                FROM generate_series(1, :products) AS n
+                """
+            ),
+            {"tag": f"bench-product-{tag}", "owner_id": seller.id, "products": products},
+        )
+        db.commit()
+        db.execute(text("ANALYZE products"))
+        db.commit()
+        return seller.id
+    finally:
+        db.close()
+
+
+def cleanup(seller_id: int):
+    db = SessionLocal()
+    try:
+        db.execute(delete(Product).where(Product.owner_id == seller_id))
+        db.execute(delete(User).where(User.id == seller_id))
+        db.commit()
+    finally:
+        db.close()
+
+
+async def time_pages(depths: list[int], page_size: int, repeats: int):
+    report = {}
+    async with AsyncSessionLocal() as db:
+        for depth in depths:
+            after = await db.scalar(
+                select(Product.id)
+                .filter(Product.quantity > 0)
+                .order_by(Product.id)
+                .offset(depth * page_size - 1)
+                .limit(1)
+            ) if depth else 0
+            offset_times, cursor_times = [], []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                by_offset = await get_all_available_products(
+                    depth + 1, db, page_size=page_size
+                )
+                offset_times.append(time.perf_counter() - start)
+                start = time.perf_counter()
+                by_cursor = await get_all_available_products(
+                    1, db, after={"id": after}, page_size=page_size
+                )
+                cursor_times.append(time.perf_counter() - start)
+            assert [p.id for p in by_offset] == [p.id for p in by_cursor]
+            report[f"page_{depth + 1}"] = {
+                "offset_ms": round(sorted(offset_times)[repeats // 2] * 1000, 2),
+                "cursor_ms": round(sorted(cursor_times)[repeats // 2] * 1000, 2),
+            }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--products", type=int, default=1_000_000)
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    pages = args.products * 9 // 10 // args.page_size
+    depths = sorted({0, pages // 100, pages // 10, pages // 2, pages - 1})
+    seller_id = seed(args.products)
+    try:
+        report = asyncio.run(time_pages(depths, args.page_size, args.repeats))
+    finally:
+        cleanup(seller_id)
+
+    print(json.dumps({"products": args.products, "page_size": args.page_size, **report}))
+
+
+if __name__ == "__main__":
+    main()
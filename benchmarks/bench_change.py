@@ -0,0 +1,61 @@
+"""Change-making latency for large balances.
+
+Times ``make_change`` for balances from 1 to ``--max-balance`` coins' worth,
+with an unlimited supply and against machine inventories that are plentiful,
+short of the large coins, or unable to pay at all:
+
+    python -m benchmarks.bench_change --calls 2000 --target-ms 1
+
+Needs no database. Exits with status 1 if any p99 is above ``--target-ms``.
+"""
+import argparse
+import json
+import random
+import sys
+import time
+
+from src.app.util.change import CHANGE_DENOMINATIONS, make_change
+
+INVENTORIES = {
+    "unlimited": None,
+    "plentiful": {coin: 10**9 for coin in CHANGE_DENOMINATIONS},
+    "few_large_coins": {100: 3, 50: 1, 20: 10**9, 10: 2, 5: 10**9},
+    "no_small_coins": {100: 10**9, 50: 10**6, 20: 50, 10: 3, 5: 0},
+    "short": {100: 10**4, 50: 10**4, 20: 10**4, 10: 10**4, 5: 10**4},
+}
+
+
+def time_calls(amounts: list[int], inventory):
+    latencies = []
+    paid = 0
+    for amount in amounts:
+        start = time.perf_counter()
+        change = make_change(amount, inventory)
+        latencies.append(time.perf_counter() - start)
+        paid += change is not None
+    latencies.sort()
+    return {
+        "paid": paid,
+        "p50_us": round(latencies[len(latencies) // 2] * 1e6, 1),
+        "p99_us": round(latencies[int(len(latencies) * 0.99)] * 1e6, 1),
+        "max_us": round(latencies[-1] * 1e6, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=2000)
+    parser.add_argument("--max-balance", type=int, default=10**9)
+    parser.add_argument("--target-ms", type=float, default=1.0)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    amounts = [5 * rng.randint(1, args.max_balance // 5) for _ in range(args.calls)]
+    report = {name: time_calls(amounts, inventory) for name, inventory in INVENTORIES.items()}
+    print(json.dumps({"calls": args.calls, "max_balance": args.max_balance, **report}))
+    if any(result["p99_us"] > args.target_ms * 1000 for result in report.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""Deposit throughput over HTTP with concurrent buyers.
+
+Each of ``--clients`` buyers posts ``--deposits-per-client`` coins to
+POST /users/deposit on one in-process event loop. Every deposit also counts
+its coin into machine_coins; ``--shards 1`` puts all of them on one row:
+
+    python -m benchmarks.bench_deposit --clients 16 --deposits-per-client 50 --shards 16
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+import httpx
+from sqlalchemy import delete, func, select
+
+from src.app.users.auth import create_token
+from src.core.config import settings
+from src.core.db import SessionLocal
+from src.core.models import User, machine_coins
+from src.main import app
+
+
+def seed(clients: int):
+    tag = uuid.uuid4().hex[:8]
+    db = SessionLocal()
+    try:
+        buyers = [
+            User(username=f"bench-buyer-{tag}-{i}", password="x") for i in range(clients)
+        ]
+        db.add_all(buyers)
+        db.commit()
+        tokens = [
+            create_token({"sub": buyer.username, "role": "buyer", "id": buyer.id})
+            for buyer in buyers
+        ]
+        return [buyer.id for buyer in buyers], tokens
+    finally:
+        db.close()
+
+
+def coins_held(coin: int) -> int:
+    db = SessionLocal()
+    try:
+        return db.scalar(
+            select(func.coalesce(func.sum(machine_coins.c.count), 0))
+            .where(machine_coins.c.denomination == coin)
+        )
+    finally:
+        db.close()
+
+
+def cleanup(user_ids: list[int]):
+    db = SessionLocal()
+    try:
+        balances = db.query(User.balance).filter(User.id.in_(user_ids)).all()
+        db.execute(delete(User).where(User.id.in_(user_ids)))
+        db.commit()
+        return [balance for balance, in balances]
+    finally:
+        db.close()
+
+
+async def client_loop(client: httpx.AsyncClient, token: str, deposits: int):
+    headers = {"Authorization": f"Bearer {token}"}
+    latencies = []
+    errors = 0
+    for _ in range(deposits):
+        start = time.perf_counter()
+        r = await client.post(
+            f"{settings.API_V1_STR}/users/deposit",
+            json={"denomination": 5},
+            headers=headers,
+        )
+        latencies.append(time.perf_counter() - start)
+        if r.status_code != 200:
+            errors += 1
+    return latencies, errors
+
+
+async def run(tokens: list[str], deposits: int):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        start = time.perf_counter()
+        results = await asyncio.gather(
+            *(client_loop(client, token, deposits) for token in tokens)
+        )
+        elapsed = time.perf_counter() - start
+    return elapsed, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--deposits-per-client", type=int, default=50)
+    parser.add_argument("--shards", type=int, default=settings.COIN_INVENTORY_SHARDS)
+    args = parser.parse_args()
+    # Measure the handlers, not the per-client rate limits
+    app.state.limiter.enabled = False
+    settings.COIN_INVENTORY_SHARDS = args.shards
+
+    user_ids, tokens = seed(args.clients)
+    coins_before = coins_held(5)
+    try:
+        elapsed, results = asyncio.run(run(tokens, args.deposits_per_client))
+    finally:
+        coins_counted = coins_held(5) - coins_before
+        balances = cleanup(user_ids)
+
+    latencies = sorted(latency for result in results for latency in result[0])
+    errors = sum(result[1] for result in results)
+    expected = [5 * args.deposits_per_client] * args.clients
+    print(
+        json.dumps(
+            {
+                "clients": args.clients,
+                "shards": args.shards,
+                "deposits": len(latencies),
+                "errors": errors,
+                "requests_per_s": round(len(latencies) / elapsed, 1),
+                "p50_ms": round(latencies[len(latencies) // 2] * 1000, 2),
+                "p99_ms": round(latencies[int(len(latencies) * 0.99)] * 1000, 2),
+            }
+        )
+    )
+    if errors or balances != expected or coins_counted != len(latencies):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Bulk product import throughput against one create per product.
+
+Imports ``--products`` new products for a seller through ``import_products``,
+then imports them again so every row is an update, and times ``--single``
+products created one at a time through ``add_product``, a commit each, as
+``POST /products/`` does. The per-product rate is extrapolated to the full
+catalog.
+
+    python -m benchmarks.bench_import --products 50000
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+from sqlalchemy import delete
+
+from src.app.products.product_schema import ProductCreate
+from src.app.products.products_service import add_product, import_products
+from src.app.util.bulk_import import json_records
+from src.core.db import AsyncSessionLocal, SessionLocal
+from src.core.models import Product, User
+
+PRICES = (5, 10, 20, 50, 100)
+
+
+def catalog(tag: str, products: int) -> list[dict]:
+    return [
+        {
+            "title": f"bench-import-{tag}-{n}",
+            "price": PRICES[n % len(PRICES)],
+            "quantity": 1 + n % 20,
+            "description": "imported in bulk",
+        }
+        for n in range(products)
+    ]
+
+
+def create_seller(tag: str) -> int:
+    db = SessionLocal()
+    try:
+        seller = User(username=f"bench-seller-{tag}", password="x", role="seller")
+        db.add(seller)
+        db.commit()
+        return seller.id
+    finally:
+        db.close()
+
+
+def cleanup(seller_id: int):
+    db = SessionLocal()
+    try:
+        db.execute(delete(Product).where(Product.owner_id == seller_id))
+        db.execute(delete(User).where(User.id == seller_id))
+        db.commit()
+    finally:
+        db.close()
+
+
+async def time_import(rows: list[dict], seller_id: int) -> tuple[float, dict]:
+    async with AsyncSessionLocal() as db:
+        start = time.perf_counter()
+        report = await import_products(json_records(rows), seller_id, db)
+        return time.perf_counter() - start, report
+
+
+def time_single(rows: list[dict], seller_id: int) -> float:
+    db = SessionLocal()
+    try:
+        start = time.perf_counter()
+        for row in rows:
+            add_product(ProductCreate(**row), seller_id, db)
+        return time.perf_counter() - start
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--products", type=int, default=50_000)
+    parser.add_argument("--single", type=int, default=1000, help="products created one at a time")
+    args = parser.parse_args()
+
+    tag = uuid.uuid4().hex[:8]
+    rows = catalog(tag, args.products)
+    seller_id = create_seller(tag)
+    try:
+        created_seconds, created = asyncio.run(time_import(rows, seller_id))
+        updated_seconds, updated = asyncio.run(time_import(rows, seller_id))
+        single_seconds = time_single(catalog(f"{tag}-single", args.single), seller_id)
+    finally:
+        cleanup(seller_id)
+
+    assert created.created == updated.updated == args.products, (created, updated)
+    single_rate = args.single / single_seconds
+    print(
+        json.dumps(
+            {
+                "products": args.products,
+                "import_create_seconds": round(created_seconds, 2),
+                "import_create_rows_per_second": round(args.products / created_seconds),
+                "import_update_seconds": round(updated_seconds, 2),
+                "import_update_rows_per_second": round(args.products / updated_seconds),
+                "single_rows_per_second": round(single_rate),
+                "single_estimated_seconds": round(args.products / single_rate, 2),
+            }
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
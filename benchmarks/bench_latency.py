@@ -0,0 +1,140 @@
+"""Request latency of the buy and catalog endpoints under concurrent load.
+
+Drives the ASGI app in-process on a single event loop, the same way one
+uvicorn worker would, so a handler that blocks the loop shows up as latency
+on every other in-flight request:
+
+    python -m benchmarks.bench_latency --clients 32 --requests-per-client 25
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+import httpx
+from sqlalchemy import delete
+
+from src.app.users.auth import create_token
+from src.core.config import settings
+from src.core.db import SessionLocal
+from src.core.models import Product, User, user_products
+from src.main import app
+
+
+def seed(clients: int, requests: int):
+    tag = uuid.uuid4().hex[:8]
+    db = SessionLocal()
+    try:
+        seller = User(username=f"bench-seller-{tag}", password="x", role="seller")
+        db.add(seller)
+        db.flush()
+        product = Product(
+            title=f"bench-product-{tag}",
+            price=5,
+            quantity=clients * requests,
+            owner_id=seller.id,
+        )
+        buyers = [
+            User(username=f"bench-buyer-{tag}-{i}", password="x", balance=5 * requests)
+            for i in range(clients)
+        ]
+        db.add(product)
+        db.add_all(buyers)
+        db.commit()
+        tokens = [
+            create_token({"sub": buyer.username, "role": "buyer", "id": buyer.id})
+            for buyer in buyers
+        ]
+        return seller.id, product.id, [buyer.id for buyer in buyers], tokens
+    finally:
+        db.close()
+
+
+def cleanup(seller_id: int, user_ids: list[int]):
+    db = SessionLocal()
+    try:
+        db.execute(delete(user_products).where(user_products.c.user_id.in_(user_ids)))
+        db.execute(delete(Product).where(Product.owner_id == seller_id))
+        db.execute(delete(User).where(User.id.in_(user_ids + [seller_id])))
+        db.commit()
+    finally:
+        db.close()
+
+
+async def client_loop(client: httpx.AsyncClient, requests: int, url: str, token=None):
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    latencies = []
+    errors = 0
+    for _ in range(requests):
+        start = time.perf_counter()
+        r = await client.get(url, headers=headers)
+        latencies.append(time.perf_counter() - start)
+        if r.status_code != 200:
+            errors += 1
+    return latencies, errors
+
+
+def summarize(results: list[tuple[list[float], int]]):
+    latencies = sorted(latency for result in results for latency in result[0])
+    return {
+        "requests": len(latencies),
+        "errors": sum(result[1] for result in results),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 2),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95)] * 1000, 2),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99)] * 1000, 2),
+    }
+
+
+async def run(product_id: int, tokens: list[str], requests: int):
+    prefix = settings.API_V1_STR + "/products"
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        start = time.perf_counter()
+        buys = [
+            client_loop(client, requests, f"{prefix}/buy/{product_id}?quantity=1", token)
+            for token in tokens
+        ]
+        reads = [
+            client_loop(client, requests, f"{prefix}/{product_id}") for _ in tokens
+        ]
+        results = await asyncio.gather(*buys, *reads)
+        elapsed = time.perf_counter() - start
+    return elapsed, results[: len(tokens)], results[len(tokens) :]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--requests-per-client", type=int, default=25)
+    args = parser.parse_args()
+    # Measure the handlers, not the per-client rate limits
+    app.state.limiter.enabled = False
+
+    seller_id, product_id, user_ids, tokens = seed(
+        args.clients, args.requests_per_client
+    )
+    try:
+        elapsed, buy_results, read_results = asyncio.run(
+            run(product_id, tokens, args.requests_per_client)
+        )
+    finally:
+        cleanup(seller_id, user_ids)
+
+    print(
+        json.dumps(
+            {
+                "clients": args.clients,
+                "elapsed_s": round(elapsed, 3),
+                "requests_per_s": round(
+                    2 * args.clients * args.requests_per_client / elapsed, 1
+                ),
+                "buy": summarize(buy_results),
+                "product_lookup": summarize(read_results),
+            }
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Password verification throughput by hash pool size, plus end-to-end logins.
+
+For each worker count up to the number of cores, verifies ``--verifies``
+passwords through a dedicated PasswordHashPool, then runs ``--logins``
+concurrent POST /users/login requests against the configured pool:
+
+    python -m benchmarks.bench_login --verifies 64 --logins 64
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+import uuid
+
+import httpx
+from sqlalchemy import delete
+
+from src.app.users.auth import PasswordHashPool, pwd_context
+from src.core.config import settings
+from src.core.db import SessionLocal
+from src.core.models import User
+from src.main import app
+
+
+def verify_throughput(password_hash: str, workers: int, verifies: int):
+    pool = PasswordHashPool(workers, max_pending=verifies)
+    start = time.perf_counter()
+    futures = [
+        pool.submit(pwd_context.verify, "password", password_hash)
+        for _ in range(verifies)
+    ]
+    assert all(future.result() for future in futures)
+    return round(verifies / (time.perf_counter() - start), 1)
+
+
+async def login_throughput(username: str, logins: int):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        start = time.perf_counter()
+        responses = await asyncio.gather(
+            *(
+                client.post(
+                    f"{settings.API_V1_STR}/users/login",
+                    json={"username": username, "password": "password"},
+                )
+                for _ in range(logins)
+            )
+        )
+        elapsed = time.perf_counter() - start
+    statuses = [r.status_code for r in responses]
+    return {
+        "logins_per_s": round(statuses.count(200) / elapsed, 1),
+        "rejected_503": statuses.count(503),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--verifies", type=int, default=64)
+    parser.add_argument("--logins", type=int, default=64)
+    args = parser.parse_args()
+    # Measure the handlers, not the per-client rate limits
+    app.state.limiter.enabled = False
+
+    password_hash = pwd_context.hash("password")
+    cores = os.cpu_count() or 1
+    workers = sorted({1, 2, 4, 8, 16, cores} & set(range(1, cores + 1)))
+    verifies = {
+        str(count): verify_throughput(password_hash, count, args.verifies)
+        for count in workers
+    }
+
+    username = f"bench-login-{uuid.uuid4().hex[:8]}"
+    db = SessionLocal()
+    try:
+        db.add(User(username=username, password=password_hash))
+        db.commit()
+        logins = asyncio.run(login_throughput(username, args.logins))
+    finally:
+        db.execute(delete(User).where(User.username == username))
+        db.commit()
+        db.close()
+
+    print(
+        json.dumps(
+            {
+                "cores": cores,
+                "bcrypt_rounds": settings.BCRYPT_ROUNDS,
+                "verifies_per_s_by_workers": verifies,
+                "login": {
+                    "workers": settings.PASSWORD_HASH_WORKERS,
+                    "queue_size": settings.PASSWORD_HASH_QUEUE_SIZE,
+                    **logins,
+                },
+            }
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""Purchase history on the monthly-partitioned user_products vs a plain table.
+
+Seeds ``--rows`` purchases spread over ``--months`` months for ``--users``
+buyers into both user_products and an unpartitioned copy with the same
+indexes, then times purchase inserts, a buyer's recent and year-old history,
+and retiring the oldest month (DROP of a partition vs DELETE plus VACUUM):
+
+    python -m benchmarks.bench_partitions --rows 2000000 --months 36
+"""
+import argparse
+import json
+import random
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, text
+
+from src.app.products.products_service import PURCHASE_HISTORY_QUERY
+from src.core.db import SessionLocal, engine
+from src.core.models import Product, User, user_products
+from src.core.partitions import (
+    add_months,
+    ensure_purchase_partitions,
+    month_start,
+    partition_name,
+)
+
+PLAIN_TABLE = "bench_user_products_plain"
+
+SEED_ROWS = """
+    INSERT INTO {table} (user_id, product_id, quantity, unit_price, created_at)
+    SELECT :first_user + n % :users, :product_id, 1, 5,
+        :start + (random() * (:end - :start))
+    FROM generate_series(1, :rows) AS n
+"""
+
+
+def seed(users: int, rows: int, months: int):
+    tag = uuid.uuid4().hex[:8]
+    now = datetime.now(timezone.utc)
+    first_month = add_months(month_start(now), -months + 1)
+    db = SessionLocal()
+    try:
+        created = ensure_purchase_partitions(db, months + 1, first_month)
+        seller = User(username=f"bench-seller-{tag}", password="x", role="seller")
+        db.add(seller)
+        db.flush()
+        product = Product(title=f"bench-product-{tag}", price=5, quantity=1, owner_id=seller.id)
+        db.add(product)
+        db.flush()
+        user_ids = db.execute(
+            text(
+                """
+                INSERT INTO users (username, password, role, balance)
+                SELECT :tag || '-' || n, 'x', 'buyer', 0
+                FROM generate_series(1, :users) AS n
+                RETURNING id
+                """
+            ),
+            {"tag": f"bench-buyer-{tag}", "users": users},
+        ).scalars().all()
+        db.execute(text(f"CREATE TABLE {PLAIN_TABLE} (LIKE user_products INCLUDING DEFAULTS)"))
+        db.execute(text(f"ALTER TABLE {PLAIN_TABLE} ADD PRIMARY KEY (id, created_at)"))
+        db.execute(text(f"ALTER TABLE {PLAIN_TABLE} ADD FOREIGN KEY (user_id) REFERENCES users (id)"))
+        db.execute(text(f"ALTER TABLE {PLAIN_TABLE} ADD FOREIGN KEY (product_id) REFERENCES products (id)"))
+        db.execute(text(f"CREATE INDEX ON {PLAIN_TABLE} (created_at)"))
+        db.execute(text(f"CREATE INDEX ON {PLAIN_TABLE} (user_id, created_at)"))
+        db.commit()
+
+        params = {
+            "first_user": min(user_ids),
+            "users": users,
+            "product_id": product.id,
+            "start": datetime.combine(first_month, datetime.min.time(), timezone.utc),
+            "end": now,
+            "rows": rows,
+        }
+        seeding = {}
+        for table in ("user_products", PLAIN_TABLE):
+            start = time.perf_counter()
+            db.execute(text(SEED_ROWS.format(table=table)), params)
+            db.commit()
+            seeding[table] = round(rows / (time.perf_counter() - start))
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text("VACUUM ANALYZE user_products"))
+            conn.execute(text(f"VACUUM ANALYZE {PLAIN_TABLE}"))
+        return seller.id, product.id, user_ids, created, first_month, seeding
+    finally:
+        db.close()
+
+
+def cleanup(seller_id: int, user_ids: list[int], created: list[str]):
+    db = SessionLocal()
+    try:
+        db.execute(text(f"DROP TABLE IF EXISTS {PLAIN_TABLE}"))
+        db.execute(delete(user_products).where(user_products.c.user_id.in_(user_ids)))
+        for partition in created:
+            db.execute(text(f"DROP TABLE IF EXISTS {partition}"))
+        db.execute(delete(Product).where(Product.owner_id == seller_id))
+        db.execute(delete(User).where(User.id.in_(user_ids + [seller_id])))
+        db.commit()
+    finally:
+        db.close()
+
+
+def time_inserts(table: str, user_ids: list[int], product_id: int, inserts: int):
+    db = SessionLocal()
+    try:
+        start = time.perf_counter()
+        for i in range(inserts):
+            db.execute(
+                text(
+                    f"INSERT INTO {table} (user_id, product_id, quantity, unit_price) "
+                    "VALUES (:user_id, :product_id, 1, 5)"
+                ),
+                {"user_id": user_ids[i % len(user_ids)], "product_id": product_id},
+            )
+            db.commit()
+        return round(inserts / (time.perf_counter() - start), 1)
+    finally:
+        db.close()
+
+
+def time_history(table: str, user_ids: list[int], since: datetime, until: datetime, queries: int):
+    query = text(PURCHASE_HISTORY_QUERY.text.replace("FROM user_products up", f"FROM {table} up"))
+    latencies = []
+    db = SessionLocal()
+    try:
+        rng = random.Random(0)
+        for _ in range(queries):
+            start = time.perf_counter()
+            db.execute(
+                query,
+                {
+                    "user_id": rng.choice(user_ids),
+                    "since": since,
+                    "until": until,
+                    "before_created_at": until,
+                    "before_id": 2**31 - 1,
+                    "limit": 20,
+                },
+            ).fetchall()
+            latencies.append(time.perf_counter() - start)
+    finally:
+        db.close()
+    latencies.sort()
+    return {
+        "queries_per_s": round(queries / sum(latencies), 1),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 2),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99)] * 1000, 2),
+    }
+
+
+def time_retire_month(month):
+    lower = datetime.combine(month, datetime.min.time(), timezone.utc)
+    upper = datetime.combine(add_months(month, 1), datetime.min.time(), timezone.utc)
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        start = time.perf_counter()
+        conn.execute(text(f"DROP TABLE {partition_name(month)}"))
+        dropped = time.perf_counter() - start
+
+        start = time.perf_counter()
+        conn.execute(
+            text(f"DELETE FROM {PLAIN_TABLE} WHERE created_at >= :lower AND created_at < :upper"),
+            {"lower": lower, "upper": upper},
+        )
+        deleted = time.perf_counter() - start
+        start = time.perf_counter()
+        conn.execute(text(f"VACUUM {PLAIN_TABLE}"))
+        vacuumed = time.perf_counter() - start
+    return {
+        "partitioned_drop_s": round(dropped, 3),
+        "plain_delete_s": round(deleted, 3),
+        "plain_vacuum_s": round(vacuumed, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--months", type=int, default=36)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--inserts", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=500)
+    args = parser.parse_args()
+
+    seller_id, product_id, user_ids, created, first_month, seeding = seed(
+        args.users, args.rows, args.months
+    )
+    try:
+        now = datetime.now(timezone.utc)
+        windows = {
+            "last_30_days": (now - timedelta(days=30), now),
+            "a_year_ago": (now - timedelta(days=395), now - timedelta(days=365)),
+        }
+        report = {}
+        for name, table in (("partitioned", "user_products"), ("plain", PLAIN_TABLE)):
+            report[name] = {
+                "bulk_insert_rows_per_s": seeding[table],
+                "inserts_per_s": time_inserts(table, user_ids, product_id, args.inserts),
+                **{
+                    f"history_{window}": time_history(table, user_ids, *bounds, args.queries)
+                    for window, bounds in windows.items()
+                },
+            }
+        report["retire_oldest_month"] = time_retire_month(first_month)
+    finally:
+        cleanup(seller_id, user_ids, created)
+
+    print(json.dumps({"rows": args.rows, "months": args.months, "users": args.users, **report}))
+
+
+if __name__ == "__main__":
+    main()
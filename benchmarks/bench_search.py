@@ -0,0 +1,158 @@
+"""Product search latency on a large catalog, prefix and full-text.
+
+Seeds ``--products`` products whose titles and descriptions are drawn from a
+small vocabulary (one in eleven out of stock), then times the first page
+and a page ``--depth`` pages in, following the cursors, for:
+
+- ``prefix_short``: one letter, matching a large share of the titles
+- ``prefix_long``: a whole title word
+- ``fulltext_common``: a word in about one title in 40
+- ``fulltext_rare``: a word in about one product in 10000
+
+    python -m benchmarks.bench_search --products 1000000
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+from sqlalchemy import delete, text
+
+from src.app.products.product_schema import SearchMode
+from src.app.products.products_service import search_products
+from src.core.db import AsyncSessionLocal, SessionLocal
+from src.core.models import Product, User
+
+ADJECTIVES = (
+    "classic", "crunchy", "dark", "diet", "fresh", "golden", "honey", "iced",
+    "light", "mild", "organic", "roasted", "salted", "smoked", "spicy", "sweet",
+    "tangy", "toasted", "wild", "zesty",
+)
+NOUNS = (
+    "almonds", "bagel", "biscuits", "brownie", "candy", "cashews", "chips",
+    "chocolate", "coffee", "cola", "cookies", "crackers", "cupcake", "donut",
+    "espresso", "gum", "jerky", "juice", "lemonade", "licorice", "mints",
+    "muffin", "nougat", "peanuts", "popcorn", "pretzels", "raisins", "soda",
+    "tea", "toffee", "wafers", "water", "granola", "pistachios", "kombucha",
+    "smoothie", "crisps", "caramel", "fudge", "marshmallows",
+)
+DESCRIPTIONS = (
+    "a favourite from the vending machine",
+    "made in small batches",
+    "sealed for freshness",
+    "best enjoyed cold",
+    "a light snack between meetings",
+    "no artificial colours",
+)
+QUERIES = {
+    "prefix_short": ("c", SearchMode.prefix),
+    "prefix_long": ("smoked pretzels", SearchMode.prefix),
+    "fulltext_common": ("pretzels", SearchMode.fulltext),
+    "fulltext_rare": ("limited edition", SearchMode.fulltext),
+}
+
+
+def seed(products: int):
+    tag = uuid.uuid4().hex[:8]
+    db = SessionLocal()
+    try:
+        seller = User(username=f"bench-seller-{tag}", password="x", role="seller")
+        db.add(seller)
+        db.flush()
+        db.execute(
+            text(
+                """
+                INSERT INTO products (title, price, quantity, description, owner_id)
+                SELECT
+                    adjectives[1 + n % cardinality(adjectives)] || ' '
+                        || nouns[1 + (n / 7) % cardinality(nouns)] || ' ' || n,
+                    (ARRAY[5, 10, 20, 50, 100])[1 + n % 5],
+                    CASE WHEN n % 11 = 0 THEN 0 ELSE 1 END,
+                    descriptions[1 + n % cardinality(descriptions)]
+                        || CASE WHEN n % 10000 = 1 THEN ', limited edition' ELSE '' END,
+                    :owner_id
+                FROM generate_series(1, :products) AS n,
+                    CAST(:adjectives AS text[]) AS adjectives,
+                    CAST(:nouns AS text[]) AS nouns,
+                    CAST(:descriptions AS text[]) AS descriptions
+                """
+            ),
+            {
+                "adjectives": list(ADJECTIVES),
+                "nouns": list(NOUNS),
+                "descriptions": list(DESCRIPTIONS),
+                "owner_id": seller.id,
+                "products": products,
+            },
+        )
+        db.commit()
+        db.execute(text("ANALYZE products"))
+        db.commit()
+        return seller.id
+    finally:
+        db.close()
+
+
+def cleanup(seller_id: int):
+    db = SessionLocal()
+    try:
+        db.execute(delete(Product).where(Product.owner_id == seller_id))
+        db.execute(delete(User).where(User.id == seller_id))
+        db.commit()
+    finally:
+        db.close()
+
+
+def percentile(times: list[float], fraction: float) -> float:
+    times = sorted(times)
+    return round(times[min(len(times) - 1, int(len(times) * fraction))] * 1000, 2)
+
+
+async def time_searches(depth: int, page_size: int, repeats: int):
+    report = {}
+    async with AsyncSessionLocal() as db:
+        for name, (q, mode) in QUERIES.items():
+            first_times, deep_times = [], []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                products, last = await search_products(q, mode, db, page_size=page_size)
+                first_times.append(time.perf_counter() - start)
+                pages = 1
+                while last is not None and pages < depth:
+                    start = time.perf_counter()
+                    products, last = await search_products(
+                        q, mode, db, after=last, page_size=page_size
+                    )
+                    pages += 1
+                    if pages == depth and products:
+                        deep_times.append(time.perf_counter() - start)
+            report[name] = {
+                "first_page_p50_ms": percentile(first_times, 0.5),
+                "first_page_p99_ms": percentile(first_times, 0.99),
+            }
+            if deep_times:
+                report[name]["deep_page_p50_ms"] = percentile(deep_times, 0.5)
+                report[name]["deep_page_p99_ms"] = percentile(deep_times, 0.99)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--products", type=int, default=1_000_000)
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--depth", type=int, default=50, help="pages in for the deep page")
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    seller_id = seed(args.products)
+    try:
+        report = asyncio.run(time_searches(args.depth, args.page_size, args.repeats))
+    finally:
+        cleanup(seller_id)
+
+    print(json.dumps({"products": args.products, "page_size": args.page_size, **report}))
+
+
+if __name__ == "__main__":
+    main()
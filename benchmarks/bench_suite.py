@@ -0,0 +1,280 @@
+"""Latency and throughput of the API's hot paths, as a report to diff.
+
+Seeds ``--buyers`` buyers and ``--products`` products, then drives the ASGI
+app in-process with ``--concurrency`` clients on one event loop, the way one
+uvicorn worker would, sending ``--requests`` requests per scenario:
+
+- ``login``: POST /users/login as a random buyer
+- ``deposit``: POST /users/deposit of one coin
+- ``buy``: GET /products/buy/{id} of one random product
+- ``catalog_paging``: GET /products/available-products from a random cursor
+- ``product_lookup``: GET /products/{id} of a random product
+
+The JSON report (``--output``, stdout by default) lists p50/p95/p99 latency
+and throughput per scenario next to the commit and settings it was taken
+with; keys are sorted so two reports diff line by line. ``--compare`` prints
+the change against an earlier report and exits with status 1 when a p99 got
+worse by more than ``--max-regression`` percent:
+
+    python -m benchmarks.bench_suite --buyers 1000 --products 100000 --output before.json
+    python -m benchmarks.bench_suite --buyers 1000 --products 100000 --compare before.json
+
+Only Postgres is supported: the schema relies on partitioned tables,
+``INSERT ... ON CONFLICT`` and advisory locks, which SQLite does not have.
+"""
+import argparse
+import asyncio
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+import uuid
+
+import httpx
+from sqlalchemy import delete, text
+
+from src.app.users.auth import create_token, pwd_context
+from src.app.util.cursor import encode_cursor
+from src.core.cache import caches
+from src.core.config import settings
+from src.core.db import SessionLocal, engine
+from src.core.models import Product, User, user_product_totals, user_products
+from src.main import app
+
+SCENARIOS = ("login", "deposit", "buy", "catalog_paging", "product_lookup")
+PASSWORD = "password"
+
+
+def seed(buyers: int, products: int, balance: int, bcrypt_rounds: int):
+    tag = uuid.uuid4().hex[:8]
+    # One hash for every buyer: each login still pays a full verification
+    password_hash = pwd_context.hash(PASSWORD, rounds=bcrypt_rounds)
+    db = SessionLocal()
+    try:
+        seller = User(username=f"bench-seller-{tag}", password="x", role="seller")
+        db.add(seller)
+        db.flush()
+        rows = db.execute(
+            text(
+                """
+                INSERT INTO users (username, password, role, balance)
+                SELECT :tag || '-' || n, :password, 'buyer', :balance
+                FROM generate_series(1, :buyers) AS n
+                RETURNING id, username
+                """
+            ),
+            {
+                "tag": f"bench-buyer-{tag}",
+                "password": password_hash,
+                "balance": balance,
+                "buyers": buyers,
+            },
+        ).all()
+        product_ids = db.execute(
+            text(
+                """
+                INSERT INTO products (title, price, quantity, description, owner_id)
+                SELECT :tag || '-' || n, 5, 1000000, 'description', :owner_id
+                FROM generate_series(1, :products) AS n
+                RETURNING id
+                """
+            ),
+            {"tag": f"bench-product-{tag}", "owner_id": seller.id, "products": products},
+        ).scalars().all()
+        db.commit()
+        db.execute(text("ANALYZE users, products"))
+        db.commit()
+        buyer_rows = [
+            (
+                username,
+                create_token({"sub": username, "role": "buyer", "id": user_id}),
+            )
+            for user_id, username in rows
+        ]
+        return seller.id, [user_id for user_id, _ in rows], buyer_rows, product_ids
+    finally:
+        db.close()
+
+
+def cleanup(seller_id: int, user_ids: list[int]):
+    db = SessionLocal()
+    try:
+        db.execute(delete(user_products).where(user_products.c.user_id.in_(user_ids)))
+        db.execute(
+            delete(user_product_totals).where(user_product_totals.c.user_id.in_(user_ids))
+        )
+        db.execute(delete(Product).where(Product.owner_id == seller_id))
+        db.execute(delete(User).where(User.id.in_(user_ids + [seller_id])))
+        db.commit()
+    finally:
+        db.close()
+
+
+def make_request(scenario: str, rng: random.Random, buyers, product_ids):
+    """The method, url, body and headers of one request of `scenario`."""
+    prefix = settings.API_V1_STR
+    username, token = rng.choice(buyers)
+    auth = {"Authorization": f"Bearer {token}"}
+    if scenario == "login":
+        body = {"username": username, "password": PASSWORD}
+        return "POST", f"{prefix}/users/login", body, {}
+    if scenario == "deposit":
+        return "POST", f"{prefix}/users/deposit", {"denomination": 5}, auth
+    if scenario == "buy":
+        product_id = rng.choice(product_ids)
+        return "GET", f"{prefix}/products/buy/{product_id}?quantity=1", None, auth
+    if scenario == "catalog_paging":
+        cursor = encode_cursor({"id": rng.choice(product_ids)})
+        return "GET", f"{prefix}/products/available-products?after={cursor}", None, {}
+    return "GET", f"{prefix}/products/{rng.choice(product_ids)}", None, {}
+
+
+def percentile(latencies: list[float], fraction: float) -> float:
+    return round(latencies[min(len(latencies) - 1, int(len(latencies) * fraction))] * 1000, 2)
+
+
+async def run_scenario(
+    scenario: str, requests: int, concurrency: int, rng: random.Random, buyers, product_ids
+):
+    planned = [make_request(scenario, rng, buyers, product_ids) for _ in range(requests)]
+    latencies = []
+    errors = {}
+
+    async def client_loop(client: httpx.AsyncClient):
+        while planned:
+            method, url, body, headers = planned.pop()
+            start = time.perf_counter()
+            r = await client.request(method, url, json=body, headers=headers)
+            latencies.append(time.perf_counter() - start)
+            if r.status_code != 200:
+                errors[str(r.status_code)] = errors.get(str(r.status_code), 0) + 1
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(client_loop(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        # status code -> count of the requests that did not answer 200
+        "errors": errors,
+        "requests_per_s": round((len(latencies) - sum(errors.values())) / elapsed, 1),
+        "p50_ms": percentile(latencies, 0.50),
+        "p95_ms": percentile(latencies, 0.95),
+        "p99_ms": percentile(latencies, 0.99),
+        "max_ms": percentile(latencies, 1.0),
+    }
+
+
+def commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(report: dict, baseline: dict, max_regression: float) -> bool:
+    """Prints the change per scenario; False if a p99 regressed too far."""
+    ok = True
+    for scenario, result in sorted(report["scenarios"].items()):
+        before = baseline.get("scenarios", {}).get(scenario)
+        if before is None:
+            print(f"{scenario}: not in baseline", file=sys.stderr)
+            continue
+        changes = []
+        for key in ("requests_per_s", "p50_ms", "p95_ms", "p99_ms"):
+            change = (result[key] - before[key]) / before[key] * 100 if before[key] else 0.0
+            changes.append(f"{key} {before[key]} -> {result[key]} ({change:+.1f}%)")
+            if key == "p99_ms" and change > max_regression:
+                ok = False
+        print(f"{scenario}: " + ", ".join(changes), file=sys.stderr)
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--buyers", type=int, default=200)
+    parser.add_argument("--products", type=int, default=10000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200, help="per scenario")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--bcrypt-rounds", type=int, default=settings.BCRYPT_ROUNDS)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output")
+    parser.add_argument("--compare", metavar="BASELINE")
+    parser.add_argument("--max-regression", type=float, default=20.0)
+    args = parser.parse_args()
+    scenarios = args.scenarios.split(",")
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    if engine.dialect.name != "postgresql":
+        parser.error(f"{engine.dialect.name} is not supported, point DATABASE_URI at Postgres")
+    # Measure the handlers, not the per-client rate limits
+    app.state.limiter.enabled = False
+
+    rng = random.Random(args.seed)
+    seller_id, user_ids, buyers, product_ids = seed(
+        args.buyers, args.products, 5 * args.requests, args.bcrypt_rounds
+    )
+
+    async def run_all():
+        # One event loop for every scenario: the async pool's wait queue
+        # belongs to the first loop that waits on it
+        results = {}
+        for scenario in scenarios:
+            for cache in caches.values():
+                cache.clear()
+            results[scenario] = await run_scenario(
+                scenario, args.requests, args.concurrency, rng, buyers, product_ids
+            )
+        return results
+
+    try:
+        results = asyncio.run(run_all())
+    finally:
+        cleanup(seller_id, user_ids)
+
+    with engine.connect() as conn:
+        server_version = conn.execute(text("SHOW server_version")).scalar_one()
+    report = {
+        "commit": commit(),
+        "python": platform.python_version(),
+        "postgres": server_version,
+        "settings": {
+            "buyers": args.buyers,
+            "products": args.products,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "bcrypt_rounds": args.bcrypt_rounds,
+            "seed": args.seed,
+            "db_pool_size": settings.DB_POOL_SIZE,
+            "db_max_overflow": settings.DB_MAX_OVERFLOW,
+            "password_hash_workers": settings.PASSWORD_HASH_WORKERS,
+        },
+        "scenarios": results,
+    }
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    errors = sum(sum(result["errors"].values()) for result in results.values())
+    ok = True
+    if args.compare:
+        with open(args.compare) as f:
+            ok = compare(report, json.load(f), args.max_regression)
+    if errors or not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import random
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.core.config import settings
+from src.core.models import machine_coins
+
+# Key of the transaction-level advisory lock taken by resets that pay out of
+# the counted coins and by recounts. Deposits never take it.
+COIN_PAYOUT_LOCK = 0x636F696E
+# A recount folds the shards into this one; deposits and payouts are spread
+# over the others, so they do not all queue on one row per coin
+COUNTED_SHARD = 0
+
+
+def record_coins(coins: dict[int, int], shard: int = None):
+    """The upsert adding `coins` (coin -> count, negative when paid out) to
+    one shard of their counters, or None when there is nothing to add."""
+    if shard is None:
+        shard = random.randint(1, max(1, settings.COIN_INVENTORY_SHARDS))
+    # Rows are upserted in denomination order, so two batches never lock the
+    # same shard's rows in opposite orders
+    counts = sorted((coin, count) for coin, count in coins.items() if coin and count)
+    if not counts:
+        return None
+    statement = insert(machine_coins).values(
+        [{"denomination": coin, "shard": shard, "count": count} for coin, count in counts]
+    )
+    return statement.on_conflict_do_update(
+        index_elements=[machine_coins.c.denomination, machine_coins.c.shard],
+        set_={"count": machine_coins.c.count + statement.excluded.count},
+    )
+
+
+async def lock_coins(db: AsyncSession):
+    await db.execute(select(func.pg_advisory_xact_lock(COIN_PAYOUT_LOCK)))
+
+
+async def count_coins(db: AsyncSession) -> dict[int, int]:
+    rows = await db.execute(
+        select(machine_coins.c.denomination, func.sum(machine_coins.c.count))
+        .group_by(machine_coins.c.denomination)
+    )
+    return {coin: int(count) for coin, count in rows.all()}
+
+
+async def record_payout(change: dict[int, int], db: AsyncSession):
+    statement = record_coins({coin: -count for coin, count in change.items()})
+    if statement is not None:
+        await db.execute(statement)
+
+
+async def get_machine_coins(db: AsyncSession):
+    coins = await count_coins(db)
+    shards = await db.scalar(select(func.count()).select_from(machine_coins))
+    return {
+        "coins": coins,
+        "total": sum(coin * count for coin, count in coins.items()),
+        "shard_rows": shards,
+    }
+
+
+async def reconcile_machine_coins(counted: dict[int, int], db: AsyncSession):
+    # Replaces the recorded coins with a physical count, folding the shards
+    # back into one row per coin. The recorded counts are the rows the DELETE
+    # removed, so a deposit committed before it is both in `recorded` and
+    # replaced by the count; one updating a shard row waits for the DELETE
+    # and then inserts the row again, and one committed later lands in a
+    # fresh shard row on top of the count.
+    try:
+        await lock_coins(db)
+        recorded = {}
+        for coin, count in (
+            await db.execute(
+                delete(machine_coins).returning(machine_coins.c.denomination, machine_coins.c.count)
+            )
+        ).all():
+            recorded[coin] = recorded.get(coin, 0) + count
+        counted = {coin: count for coin, count in counted.items() if coin}
+        if counted:
+            await db.execute(record_coins(counted, COUNTED_SHARD))
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
+    coins = sorted(set(recorded) | set(counted))
+    return {
+        "coins": {coin: counted.get(coin, 0) for coin in coins},
+        "discrepancy": {
+            coin: counted.get(coin, 0) - recorded.get(coin, 0)
+            for coin in coins
+            if counted.get(coin, 0) != recorded.get(coin, 0)
+        },
+    }
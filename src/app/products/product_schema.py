@@ -1,3 +1,5 @@
+from datetime import datetime
+from enum import Enum
 from typing import Union
 
 from pydantic import BaseModel, validator
@@ -29,6 +31,30 @@ class Product(ProductsBase):
         orm_mode = True
 
 
+class CatalogSort(Enum):
+    id = "id"
+    price = "price"
+    title = "title"
+
+
+class SearchMode(Enum):
+    fulltext = "fulltext"
+    prefix = "prefix"
+
+
+class ImportRowError(BaseModel):
+    row: int
+    error: str
+
+
+class ProductImportResponse(BaseModel):
+    created: int
+    updated: int
+    failed: int
+    # The first PRODUCT_IMPORT_MAX_ERRORS of the failed rows
+    errors: list[ImportRowError]
+
+
 class ProductUpdateBody(BaseModel):
     title: Union[str, None] = None
     price: Union[int, None] = None
@@ -55,11 +81,29 @@ class ProductInfo(BaseModel):
     total_spent_on_product: int
     total_quantity_bought: int
 
+class CartLine(BaseModel):
+    product_id: int
+    quantity: int = 1
+
+class CartBuyBody(BaseModel):
+    lines: list[CartLine]
+
 class ProductsBuyResponse(BaseModel):
     user_id: int
     username: str
     balance: int
     products: list[ProductInfo]
 
+class PurchaseRecord(BaseModel):
+    id: int
+    product_id: Union[int, None] = None
+    title: Union[str, None] = None
+    quantity: int
+    unit_price: int
+    created_at: datetime
+
+    class Config:
+        orm_mode = True
+
 class DeletedProductResponse(BaseModel):
     message: str
\ No newline at end of file
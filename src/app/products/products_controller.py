@@ -1,22 +1,28 @@
-from typing import Annotated, Any
+from typing import Annotated, Any, Union
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from sqlalchemy import Row, Sequence
+from sqlalchemy.ext.asyncio import AsyncSession
 from src.app.products.product_schema import (
+    CartBuyBody,
+    CatalogSort,
     DeletedProductResponse,
     ProductCreate,
+    ProductImportResponse,
     Product as Productout,
     ProductInfo,
     ProductsBuyQueryResponse,
     ProductsBuyResponse,
+    SearchMode,
 )
 
-from src.app.users.user_schema import (
-    TokenData,
-)
 from src.app.products.products_service import *
-from src.app.users.auth import RoleChecker
-from src.core.db import get_db
+from src.app.users.auth import Principal, RoleChecker
+from src.app.util.bulk_import import ImportFormat, csv_records, json_records, ndjson_records
+from src.app.util.cursor import decode_cursor, encode_cursor
+from src.app.util.rate_limit import limiter
+from src.core.config import settings
+from src.core.db import get_async_db, get_db
 
 router = APIRouter()
 
@@ -24,26 +30,77 @@ router = APIRouter()
 @router.post("/", response_model=Productout)
 def create(
     product: ProductCreate,
-    user: Annotated[TokenData, Depends(RoleChecker(allowed_roles=["seller"]))],
+    user: Annotated[Principal, Depends(RoleChecker(allowed_roles=["seller"]))],
     db: Session = Depends(get_db),
 ):
   return add_product(product, user.id, db)
 
 
+@router.post("/import", response_model=ProductImportResponse)
+async def import_catalog(
+    request: Request,
+    user: Annotated[Principal, Depends(RoleChecker(allowed_roles=["seller"]))],
+    db: AsyncSession = Depends(get_async_db),
+):
+    # A JSON array is read whole; CSV and NDJSON are read as they arrive
+    contentType = request.headers.get("content-type", "").split(";")[0].strip()
+    try:
+        format = ImportFormat(contentType)
+    except ValueError:
+        raise HTTPException(415, "Send a JSON array, NDJSON or CSV")
+    if format == ImportFormat.json:
+        try:
+            body = await request.json()
+        except ValueError:
+            raise HTTPException(400, "Invalid JSON")
+        if not isinstance(body, list):
+            raise HTTPException(400, "Expected a JSON array of products")
+        records = json_records(body)
+    elif format == ImportFormat.csv:
+        records = csv_records(request.stream())
+    else:
+        records = ndjson_records(request.stream())
+    return await import_products(records, user.id, db)
+
+
 @router.get("/buy/{product_id}", response_model=ProductsBuyResponse)
+@limiter.limit(settings.RATE_LIMIT_BUY)
 async def buy(
+    request: Request,
     product_id: int,
     quantity: str,
-    user: Annotated[TokenData, Depends(RoleChecker(allowed_roles=["buyer"]))],
-    db: Session = Depends(get_db),
+    user: Annotated[Principal, Depends(RoleChecker(allowed_roles=["buyer"]))],
+    db: AsyncSession = Depends(get_async_db),
 ):
 
     quantity = int(quantity)
-    products = buy_product(product_id, quantity, user.id, db)
+    products = await buy_product(product_id, quantity, user.id, db)
     if not products:
         raise HTTPException(
             status_code=404, detail="Product not found or insufficient balance"
         )
+    return buy_response(products)
+
+
+@router.post("/buy", response_model=ProductsBuyResponse)
+@limiter.limit(settings.RATE_LIMIT_BUY)
+async def buy_cart(
+    request: Request,
+    cart: CartBuyBody,
+    user: Annotated[Principal, Depends(RoleChecker(allowed_roles=["buyer"]))],
+    db: AsyncSession = Depends(get_async_db),
+):
+
+    lines = [(line.product_id, line.quantity) for line in cart.lines]
+    products = await buy_products(lines, user.id, db)
+    if not products:
+        raise HTTPException(
+            status_code=404, detail="Product not found or insufficient balance"
+        )
+    return buy_response(products)
+
+
+def buy_response(products):
     productsInfo = []
     for product in products:
         product = product._mapping
@@ -66,21 +123,69 @@ async def buy(
 
 
 @router.get("/available-products", response_model=List[Productout])
-def get_available(
+async def get_available(
+    response: Response,
     pagenum: int = 1,
-    db: Session = Depends(get_db),
+    after: Union[str, None] = None,
+    page_size: Union[int, None] = None,
+    sort: CatalogSort = CatalogSort.id,
+    descending: bool = False,
+    min_price: Union[int, None] = None,
+    max_price: Union[int, None] = None,
+    owner_id: Union[int, None] = None,
+    in_stock: bool = True,
+    db: AsyncSession = Depends(get_async_db),
 ):
 
-    return get_all_available_products(pagenum, db)
+    try:
+        products = await get_all_available_products(
+            pagenum,
+            db,
+            decode_cursor(after) if after is not None else None,
+            page_size,
+            sort,
+            descending,
+            min_price,
+            max_price,
+            owner_id,
+            in_stock,
+        )
+    except (KeyError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if products:
+        response.headers["X-Next-Cursor"] = encode_cursor(catalog_cursor(products[-1], sort))
+    return products
+
+
+# Declared ahead of /{product_id}, which would otherwise match "search"
+@router.get("/search", response_model=List[Productout])
+async def search(
+    response: Response,
+    q: str = Query(min_length=1, max_length=200),
+    mode: SearchMode = SearchMode.fulltext,
+    after: Union[str, None] = None,
+    page_size: Union[int, None] = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+
+    try:
+        products, last = await search_products(
+            q, mode, db, decode_cursor(after) if after else None, page_size
+        )
+    except (KeyError, TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if last:
+        response.headers["X-Next-Cursor"] = encode_cursor(last)
+    return products
 
 
 @router.get("/{product_id}", response_model=Productout)
-def get_by_id(
+async def get_by_id(
     product_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
 
-    product = get_product_by_id(product_id, db)
+    product = await get_product_by_id_async(product_id, db)
     if product:
         return product
     raise HTTPException(status_code=404, detail="Product not found")
@@ -90,7 +195,7 @@ def get_by_id(
 def update(
     product_id: int,
     product: ProductUpdateBody,
-    user: Annotated[TokenData, Depends(RoleChecker(allowed_roles=["seller"]))],
+    user: Annotated[Principal, Depends(RoleChecker(allowed_roles=["seller"]))],
     db: Session = Depends(get_db),
 ):
 
@@ -107,7 +212,7 @@ def update(
 @router.delete("/{product_id}", response_model=DeletedProductResponse)
 def delete(
     product_id: int,
-    user: Annotated[TokenData, Depends(RoleChecker(allowed_roles=["seller"]))],
+    user: Annotated[Principal, Depends(RoleChecker(allowed_roles=["seller"]))],
     db: Session = Depends(get_db),
 ):
 
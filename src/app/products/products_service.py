@@ -1,17 +1,48 @@
 import asyncio
-from typing import List
+from datetime import datetime, time, timezone
+from typing import AsyncIterator, List, Union
 from fastapi import HTTPException
-from sqlalchemy import text
+from pydantic import ValidationError
+from sqlalchemy import and_, cast, func, or_, select, text, tuple_
+from sqlalchemy.dialects.postgresql import DOUBLE_PRECISION
+from sqlalchemy.exc import DBAPIError, IntegrityError, OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from src.app.products.product_schema import (
+    CatalogSort,
+    ImportRowError,
+    Product as Productout,
     ProductCreate,
+    ProductImportResponse,
     ProductUpdateBody,
+    SearchMode,
 )
+from src.app.util.bulk_import import RecordError
+from src.core.cache import TTLCache
+from src.core.config import settings
+from src.core.db import AsyncSessionLocal
 from src.core.models import Product, user_products
-from src.app.users.user_service import get_user
+from src.core.partitions import add_months, list_purchase_partitions, partition_name
 from src.app.users.user_schema import User
 
+product_cache = TTLCache(
+    "products", settings.CATALOG_CACHE_SIZE, settings.CATALOG_CACHE_TTL_SECONDS
+)
+catalog_page_cache = TTLCache(
+    "catalog_pages", settings.CATALOG_CACHE_SIZE, settings.CATALOG_CACHE_TTL_SECONDS
+)
+
+
+def invalidate_catalog(product_id: Union[int, None] = None):
+    # Any catalog write can change what a page holds, so pages are always
+    # dropped. Without a product id every cached product is dropped too.
+    if product_id is None:
+        product_cache.clear()
+    else:
+        product_cache.invalidate(product_id)
+    catalog_page_cache.clear()
+
 
 def add_product(product: ProductCreate, owner_id: int, db: Session):
     try:
@@ -25,32 +56,367 @@ def add_product(product: ProductCreate, owner_id: int, db: Session):
         db.add(product)
         db.commit()
         db.refresh(product)
+        invalidate_catalog(product.id)
         return product
     except Exception:
         db.rollback()
         raise HTTPException(400, "Error while creating product")
 
 
-def get_all_available_products(pagenum: int, db: Session):
-    limit = 20
-    offset = (pagenum - 1) * limit
-    try:
-        return (
-            db.query(Product)
-            .filter(Product.quantity > 0)
-            .offset(offset)
-            .limit(limit)
-            .all()
+# Columns an import row may leave out: an existing product keeps its own
+# value for those the row does not supply, rather than taking the defaults
+IMPORT_OPTIONAL_COLUMNS = ("quantity", "description")
+
+
+def product_upsert_statement(updated: tuple):
+    # xmax is 0 only on a row version this statement inserted
+    return text(
+        f"""
+        INSERT INTO products (title, price, quantity, description, owner_id)
+        SELECT title, price, quantity, description, :owner_id
+        FROM unnest(
+            CAST(:titles AS varchar[]),
+            CAST(:prices AS integer[]),
+            CAST(:quantities AS integer[]),
+            CAST(:descriptions AS varchar[])
+        ) AS rows(title, price, quantity, description)
+        ON CONFLICT (owner_id, title) DO UPDATE
+        SET {", ".join(f"{column} = excluded.{column}" for column in ("price", *updated))}
+        RETURNING xmax = 0 AS created
+        """
+    )
+
+
+# One statement per combination of optional columns supplied
+PRODUCT_UPSERT_STATEMENTS = {
+    updated: product_upsert_statement(updated)
+    for updated in ((), ("quantity",), ("description",), IMPORT_OPTIONAL_COLUMNS)
+}
+
+NUMERIC_VALUE_OUT_OF_RANGE = "22003"
+
+
+def supplied_columns(product: ProductCreate) -> tuple:
+    return tuple(
+        column for column in IMPORT_OPTIONAL_COLUMNS if column in product.model_fields_set
+    )
+
+
+# Titles are unique across sellers, not just per seller
+TAKEN_TITLES_QUERY = text(
+    """
+    SELECT title
+    FROM products
+    WHERE title = ANY(CAST(:titles AS varchar[]))
+        AND owner_id IS DISTINCT FROM :owner_id
+    """
+)
+
+
+def row_error(e: Exception) -> str:
+    if isinstance(e, HTTPException):
+        return e.detail
+    if isinstance(e, ValidationError):
+        return "; ".join(
+            f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in e.errors()
         )
+    return str(e)
+
+
+def upsert_params(products: List[ProductCreate], owner_id: int) -> dict:
+    return {
+        "titles": [product.title for product in products],
+        "prices": [product.price for product in products],
+        "quantities": [product.quantity for product in products],
+        "descriptions": [product.description for product in products],
+        "owner_id": owner_id,
+    }
+
+
+async def import_products(
+    records: AsyncIterator, owner_id: int, db: AsyncSession
+) -> ProductImportResponse:
+    """Creates or updates the seller's products in `records`, matched on
+    title, PRODUCT_IMPORT_BATCH_SIZE rows and a commit at a time. An updated
+    product keeps the quantity and description its row leaves out. A row
+    that fails validation or can't be saved is reported by its position in
+    `records` and leaves the rest of its batch alone."""
+    report = ProductImportResponse(created=0, updated=0, failed=0, errors=[])
+    seen = set()
+    batch = []
+
+    def fail(row: int, error: str):
+        report.failed += 1
+        if len(report.errors) < settings.PRODUCT_IMPORT_MAX_ERRORS:
+            report.errors.append(ImportRowError(row=row, error=error))
+
+    async def upsert(rows: list):
+        taken = set(
+            (
+                await db.execute(
+                    TAKEN_TITLES_QUERY,
+                    {"titles": [product.title for _, product in rows], "owner_id": owner_id},
+                )
+            ).scalars()
+        )
+        for row, product in rows:
+            if product.title in taken:
+                fail(row, "Title is already used by another seller")
+        rows = [(row, product) for row, product in rows if product.title not in taken]
+        if not rows:
+            await db.rollback()
+            return
+        groups = {}
+        for row, product in rows:
+            groups.setdefault(supplied_columns(product), []).append(product)
+        try:
+            created = []
+            for updated, products in groups.items():
+                created += (
+                    await db.execute(
+                        PRODUCT_UPSERT_STATEMENTS[updated], upsert_params(products, owner_id)
+                    )
+                ).scalars().all()
+        except DBAPIError:
+            # Another seller took a title since the check, or a value is out
+            # of range: find the rows at fault one savepoint at a time
+            await db.rollback()
+            created = []
+            for row, product in rows:
+                try:
+                    async with db.begin_nested():
+                        created += (
+                            await db.execute(
+                                PRODUCT_UPSERT_STATEMENTS[supplied_columns(product)],
+                                upsert_params([product], owner_id),
+                            )
+                        ).scalars().all()
+                except IntegrityError:
+                    fail(row, "Title is already used by another seller")
+                except DBAPIError as e:
+                    if getattr(e.orig, "sqlstate", None) == NUMERIC_VALUE_OUT_OF_RANGE:
+                        fail(row, "Value out of range")
+                    else:
+                        fail(row, str(e.orig).strip())
+        await db.commit()
+        report.created += sum(created)
+        report.updated += len(created) - sum(created)
+        invalidate_catalog()
+
+    row = 0
+    async for record in records:
+        row += 1
+        if isinstance(record, RecordError):
+            fail(row, str(record))
+            continue
+        if not isinstance(record, dict):
+            fail(row, "Expected an object")
+            continue
+        try:
+            product = ProductCreate(**record)
+        except (ValidationError, HTTPException) as e:
+            fail(row, row_error(e))
+            continue
+        if product.title in seen:
+            fail(row, "Duplicate title in this import")
+            continue
+        seen.add(product.title)
+        batch.append((row, product))
+        if len(batch) >= settings.PRODUCT_IMPORT_BATCH_SIZE:
+            await upsert(batch)
+            batch = []
+    if batch:
+        await upsert(batch)
+    return report
+
+
+# Titles are unique, so only prices need the id to break ties
+CATALOG_SORT_KEYS = {
+    CatalogSort.id: (Product.id,),
+    CatalogSort.price: (Product.price, Product.id),
+    CatalogSort.title: (Product.title,),
+}
+
+
+def catalog_cursor(product: Productout, sort: CatalogSort) -> dict:
+    return {key.key: getattr(product, key.key) for key in CATALOG_SORT_KEYS[sort]}
+
+
+def catalog_position(after: dict, sort: CatalogSort) -> tuple:
+    """The sort-key values held by a `catalog_cursor`, ignoring any other
+    keys. A cursor missing a key or with a wrong type raises ValueError."""
+    keys = CATALOG_SORT_KEYS[sort]
+    values = tuple(after.get(key.key) for key in keys)
+    if not all(isinstance(value, key.type.python_type) for key, value in zip(keys, values)):
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def catalog_query(
+    pagenum: int,
+    after: Union[dict, None],
+    limit: int,
+    sort: CatalogSort = CatalogSort.id,
+    descending: bool = False,
+    min_price: Union[int, None] = None,
+    max_price: Union[int, None] = None,
+    owner_id: Union[int, None] = None,
+    in_stock: bool = True,
+):
+    """A page of the catalog in `sort` order.
+
+    `after` holds the `catalog_cursor` of the previous page's last product;
+    the page then starts right past it, walking an index instead of counting
+    off `pagenum` pages. Every sort, with or without an owner, has an index
+    that returns products in page order with the price range as an index
+    condition. An invalid cursor raises ValueError, see `catalog_position`.
+    """
+    keys = CATALOG_SORT_KEYS[sort]
+    query = (
+        select(Product)
+        .order_by(*(key.desc() if descending else key for key in keys))
+        .limit(limit)
+    )
+    if in_stock:
+        query = query.filter(Product.quantity > 0)
+    if min_price is not None:
+        query = query.filter(Product.price >= min_price)
+    if max_price is not None:
+        query = query.filter(Product.price <= max_price)
+    if owner_id is not None:
+        query = query.filter(Product.owner_id == owner_id)
+    if after is not None:
+        values = catalog_position(after, sort)
+        position = tuple_(*keys)
+        query = query.filter(position < values if descending else position > values)
+    else:
+        query = query.offset((pagenum - 1) * limit)
+    return query
+
+
+async def get_all_available_products(
+    pagenum: int,
+    db: AsyncSession,
+    after: Union[dict, None] = None,
+    page_size: Union[int, None] = None,
+    sort: CatalogSort = CatalogSort.id,
+    descending: bool = False,
+    min_price: Union[int, None] = None,
+    max_price: Union[int, None] = None,
+    owner_id: Union[int, None] = None,
+    in_stock: bool = True,
+):
+    limit = max(1, min(page_size or settings.PRODUCTS_PAGE_SIZE, settings.PRODUCTS_MAX_PAGE_SIZE))
+    filters = (sort, descending, min_price, max_price, owner_id, in_stock)
+    query = catalog_query(pagenum, after, limit, *filters)
+    key = (
+        catalog_position(after, sort) if after is not None else None,
+        pagenum if after is None else None,
+        limit,
+        *filters,
+    )
+    products = catalog_page_cache.get(key)
+    if products is not None:
+        return products
+    generation = catalog_page_cache.generation
+    try:
+        result = await db.scalars(query)
+        products = [
+            Productout.model_validate(product, from_attributes=True)
+            for product in result
+        ]
+        catalog_page_cache.set(key, products, generation=generation)
+        return products
     except Exception:
         raise HTTPException(400, "Error while fetching products")
 
 
+def search_query(q: str, mode: SearchMode, after: Union[dict, None], limit: int):
+    """In-stock products matching `q`, each with its cursor value.
+
+    Prefix mode matches the start of the title, case-insensitively, in title
+    order off ix_products_title_prefix. Full-text mode matches English words
+    of the title and description through ix_products_search_vector, best
+    ranked first. `after` holds the cursor values of the previous page's last
+    product; an invalid one raises ValueError.
+    """
+    query = select(Product).filter(Product.quantity > 0).limit(limit)
+    if mode == SearchMode.prefix:
+        title = func.lower(Product.title).collate("C")
+        pattern = q.lower().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        query = query.add_columns(title).filter(title.like(pattern + "%", escape="\\"))
+        query = query.order_by(title, Product.id)
+        if after is not None:
+            query = query.filter(tuple_(title, Product.id) > (str(after["title"]), int(after["id"])))
+    else:
+        # A subquery, so that a generic plan of the prepared statement parses
+        # the query once rather than for every matching row
+        terms = select(func.websearch_to_tsquery("english", q)).scalar_subquery()
+        # float8, so the rank in a cursor compares equal to the one computed
+        rank = cast(func.ts_rank_cd(Product.search_vector, terms), DOUBLE_PRECISION)
+        query = query.add_columns(rank).filter(Product.search_vector.op("@@")(terms))
+        query = query.order_by(rank.desc(), Product.id)
+        if after is not None:
+            after_rank, after_id = float(after["rank"]), int(after["id"])
+            query = query.filter(
+                or_(rank < after_rank, and_(rank == after_rank, Product.id > after_id))
+            )
+    return query
+
+
+async def search_products(
+    q: str,
+    mode: SearchMode,
+    db: AsyncSession,
+    after: Union[dict, None] = None,
+    page_size: Union[int, None] = None,
+):
+    """A page of `search_query`, and the cursor values of its last product."""
+    limit = max(1, min(page_size or settings.PRODUCTS_PAGE_SIZE, settings.PRODUCTS_MAX_PAGE_SIZE))
+    query = search_query(q, mode, after, limit)
+    try:
+        rows = (await db.execute(query)).all()
+    except Exception:
+        raise HTTPException(400, "Error while searching products")
+    products = [Productout.model_validate(row[0], from_attributes=True) for row in rows]
+    if not rows:
+        return products, None
+    key = "title" if mode == SearchMode.prefix else "rank"
+    return products, {key: rows[-1][1], "id": rows[-1][0].id}
+
+
 def get_product_by_id(product_id: int, db: Session):
+    product = product_cache.get(product_id)
+    if product is not None:
+        return product
+    generation = product_cache.generation
+    try:
+        product = db.query(Product).filter(Product.id == product_id).first()
+    except Exception:
+        raise HTTPException(400, "Error while fetching product")
+    return cache_product(product, generation)
+
+
+async def get_product_by_id_async(product_id: int, db: AsyncSession):
+    product = product_cache.get(product_id)
+    if product is not None:
+        return product
+    generation = product_cache.generation
     try:
-        return db.query(Product).filter(Product.id == product_id).first()
+        product = await db.scalar(select(Product).filter(Product.id == product_id))
     except Exception:
         raise HTTPException(400, "Error while fetching product")
+    return cache_product(product, generation)
+
+
+def cache_product(product: Union[Product, None], generation: Union[int, None] = None):
+    # `generation` is the cache's, read before the product was; if the
+    # catalog was invalidated since, the row may predate that write
+    if product is None:
+        return None
+    product = Productout.model_validate(product, from_attributes=True)
+    product_cache.set(product.id, product, generation=generation)
+    return product
 
 
 def update_product(product_id: int, product: ProductUpdateBody, db: Session):
@@ -70,65 +436,345 @@ def update_product(product_id: int, product: ProductUpdateBody, db: Session):
         if rowsUpdated == 0:
             return None
         db.commit()
+        invalidate_catalog(product_id)
         return rowsUpdated
     except Exception:
         db.rollback()
         raise HTTPException(400, "Error while updating product")
 
 
-def buy_product(product_id: int, quantity: int, user_id: int, db: Session):
+PURCHASE_STATEMENT = text(
+    """
+    WITH cart AS (
+        SELECT *
+        FROM unnest(CAST(:product_ids AS integer[]), CAST(:quantities AS integer[]))
+            AS cart(product_id, quantity)
+    ),
+    product AS MATERIALIZED (
+        SELECT products.id, products.price, LEAST(products.quantity, cart.quantity) AS bought
+        FROM products
+        JOIN cart ON products.id = cart.product_id
+        WHERE products.quantity > 0
+        ORDER BY products.id
+        FOR UPDATE OF products
+    ),
+    debit AS (
+        UPDATE users
+        SET balance = users.balance - cost.total
+        FROM (SELECT COUNT(*) AS lines, SUM(bought * price) AS total FROM product) AS cost
+        WHERE users.id = :user_id
+            AND cost.lines = :lines
+            AND users.balance >= cost.total
+        RETURNING users.id AS user_id
+    ),
+    purchase AS (
+        SELECT debit.user_id, product.id AS product_id, product.bought, product.price
+        FROM debit CROSS JOIN product
+    ),
+    stock AS (
+        UPDATE products
+        SET quantity = products.quantity - purchase.bought
+        FROM purchase
+        WHERE products.id = purchase.product_id
+        RETURNING products.id
+    ),
+    totals AS (
+        INSERT INTO user_product_totals
+            (user_id, product_id, total_quantity, total_spent)
+        SELECT user_id, product_id, bought, bought * price FROM purchase
+        ON CONFLICT (user_id, product_id) DO UPDATE
+        SET total_quantity = user_product_totals.total_quantity + EXCLUDED.total_quantity,
+            total_spent = user_product_totals.total_spent + EXCLUDED.total_spent
+        RETURNING user_id
+    )
+    INSERT INTO user_products (user_id, product_id, quantity, unit_price)
+    SELECT user_id, product_id, bought, price FROM purchase
+    RETURNING id
+    """
+)
+
+PURCHASE_SUMMARY_QUERY = text(
+    """
+    SELECT
+        p.id as id,
+        p.title as title,
+        p.description as description,
+        p.price as price,
+        t.total_spent as total_spent_on_product,
+        t.total_quantity as total_quantity_bought,
+        u.balance as balance,
+        u.username as username,
+        u.id as user_id
+    FROM
+        user_product_totals t
+        JOIN products p ON t.product_id = p.id
+        JOIN users u ON t.user_id = u.id
+    WHERE
+        t.user_id = :user_id
+    ORDER BY p.id
+    """
+)
+
+
+async def buy_product(product_id: int, quantity: int, user_id: int, db: AsyncSession):
+    return await buy_products([(product_id, quantity)], user_id, db)
+
+
+async def buy_products(lines: list[tuple[int, int]], user_id: int, db: AsyncSession):
+    # Product rows are locked in id order, so overlapping carts queue behind
+    # each other instead of deadlocking, and the balance debit is guarded in
+    # the same statement: concurrent buyers can neither oversell stock nor push
+    # a balance below zero. Each line buys up to the stock left. If any product
+    # is missing or sold out, or the balance does not cover the cart, no row
+    # comes back and nothing was changed. The summary is read from
+    # user_product_totals, which the same statement keeps up to date, so it
+    # costs one row per product the buyer has ever bought.
+    cart: dict[int, int] = {}
+    for product_id, quantity in lines:
+        if quantity < 1:
+            return None
+        cart[product_id] = cart.get(product_id, 0) + quantity
+    if not cart:
+        return None
     try:
-        product = get_product_by_id(product_id, db)
-        user = get_user(user_id, db)
-        if product:
-            minQuantity = min(product.quantity, quantity)
-            product.quantity -= minQuantity
-            cost = minQuantity * product.price
-            if user.balance < cost:
-                return None
-            user.balance -= minQuantity * product.price
-            insertion = user_products.insert().values(
-                user_id=user.id, product_id=product.id, quantity=minQuantity
-            )
-            db.execute(insertion)
-            db.commit()
-            query = text(
-                """
-                SELECT 
-                    p.id as id,
-                    p.title as title,
-                    p.description as description,
-                    p.price as price,
-                    SUM(p.price * up.quantity) as total_spent_on_product,
-                    SUM(up.quantity) as total_quantity_bought,
-                    u.balance as balance,
-                    u.username as username,
-                    u.id as user_id
-                FROM 
-                    user_products up
-                    JOIN products p ON up.product_id = p.id
-                    JOIN users u ON up.user_id = u.id
-                WHERE 
-                    up.user_id = :user_id
-                GROUP BY
-                    p.id, p.title, p.price, u.balance, u.username, u.id
-                order by p.id
-                """
+        purchase = (
+            await db.execute(
+                PURCHASE_STATEMENT,
+                {
+                    "product_ids": list(cart),
+                    "quantities": list(cart.values()),
+                    "lines": len(cart),
+                    "user_id": user_id,
+                },
             )
-            data = db.execute(query, {"user_id": user.id}).fetchall()
-            return data
-        return None
+        ).first()
+        if purchase is None:
+            await db.rollback()
+            return None
+        data = (await db.execute(PURCHASE_SUMMARY_QUERY, {"user_id": user_id})).fetchall()
+        await db.commit()
+        for product_id in cart:
+            invalidate_catalog(product_id)
+        return data
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(400, "Error while buying product")
 
 
+# Rows of deleted products (product_id NULL) never conflict, so each
+# compaction pass adds one snapshot row per buyer for them
+SNAPSHOT_UPSERT = """
+    INSERT INTO user_product_snapshots
+        (user_id, product_id, quantity, spent, compacted_through)
+    SELECT user_id, product_id, quantity, spent, compacted_through
+    FROM rolled
+    ON CONFLICT (user_id, product_id) DO UPDATE
+    SET quantity = user_product_snapshots.quantity + EXCLUDED.quantity,
+        spent = user_product_snapshots.spent + EXCLUDED.spent,
+        compacted_through = GREATEST(
+            user_product_snapshots.compacted_through, EXCLUDED.compacted_through
+        )
+    RETURNING user_id
+"""
+
+COMPACT_LEDGER_STATEMENT = text(
+    f"""
+    WITH batch AS (
+        SELECT id, created_at
+        FROM user_products
+        WHERE created_at < :before
+        ORDER BY id
+        LIMIT :batch_size
+    ),
+    moved AS (
+        DELETE FROM user_products
+        USING batch
+        WHERE user_products.id = batch.id AND user_products.created_at = batch.created_at
+        RETURNING user_products.user_id, user_products.product_id,
+            user_products.quantity, user_products.unit_price, user_products.created_at
+    ),
+    rolled AS (
+        SELECT user_id, product_id, SUM(quantity) AS quantity,
+            SUM(quantity * unit_price) AS spent, MAX(created_at) AS compacted_through
+        FROM moved
+        WHERE user_id IS NOT NULL
+        GROUP BY user_id, product_id
+    ),
+    snapshot AS ({SNAPSHOT_UPSERT})
+    SELECT COUNT(*) FROM moved
+    """
+)
+
+
+def compact_partition_statement(partition: str):
+    return text(
+        f"""
+        WITH rolled AS (
+            SELECT user_id, product_id, SUM(quantity) AS quantity,
+                SUM(quantity * unit_price) AS spent, MAX(created_at) AS compacted_through
+            FROM {partition}
+            WHERE user_id IS NOT NULL
+            GROUP BY user_id, product_id
+        ),
+        snapshot AS ({SNAPSHOT_UPSERT})
+        SELECT (SELECT COUNT(*) FROM {partition})
+        """
+    )
+
+
+LOCK_NOT_AVAILABLE = "55P03"
+
+
+def compact_purchase_ledger(
+    before: datetime, db: Session, batch_size: Union[int, None] = None
+):
+    # Rolls ledger rows older than `before` into user_product_snapshots.
+    # Months that end before the cutoff are rolled up in one pass and their
+    # partition dropped, which leaves nothing behind to vacuum; the remaining
+    # rows are moved in committed batches so buyers are never blocked behind
+    # a long transaction. Snapshot plus remaining rows always add up to the
+    # same quantities and amounts as the uncompacted ledger.
+    batch_size = batch_size or settings.LEDGER_COMPACTION_BATCH_SIZE
+    compacted = 0
+    for month in list_purchase_partitions(db):
+        if datetime.combine(add_months(month, 1), time(), timezone.utc) > before:
+            break
+        partition = partition_name(month)
+        try:
+            rolled = db.execute(compact_partition_statement(partition)).scalar_one()
+            # Dropping a partition locks user_products against every buy and
+            # history read until commit, so the lock is taken last and only
+            # waited for briefly: queued behind a long read, the drop would
+            # hold up everything queued behind it. (DETACH ... CONCURRENTLY
+            # is refused while the DEFAULT partition exists.) A month whose
+            # lock is not granted is left to the batches below.
+            db.execute(
+                text(f"SET LOCAL lock_timeout = {int(settings.LEDGER_PARTITION_LOCK_TIMEOUT_MS)}")
+            )
+            db.execute(text(f"DROP TABLE {partition}"))
+            db.commit()
+            compacted += rolled
+        except OperationalError as e:
+            db.rollback()
+            if getattr(e.orig, "pgcode", None) != LOCK_NOT_AVAILABLE:
+                raise
+    while True:
+        moved = db.execute(
+            COMPACT_LEDGER_STATEMENT, {"before": before, "batch_size": batch_size}
+        ).scalar_one()
+        db.commit()
+        compacted += moved
+        if moved < batch_size:
+            return compacted
+
+
+PURCHASE_HISTORY_QUERY = text(
+    """
+    SELECT up.id, up.product_id, p.title, up.quantity, up.unit_price, up.created_at
+    FROM user_products up
+    LEFT JOIN products p ON p.id = up.product_id
+    WHERE up.user_id = :user_id
+        AND up.created_at >= :since
+        AND up.created_at < :until
+        AND (up.created_at, up.id) < (:before_created_at, :before_id)
+    ORDER BY up.created_at DESC, up.id DESC
+    LIMIT :limit
+    """
+)
+
+
+async def get_purchase_history(
+    user_id: int,
+    since: datetime,
+    until: datetime,
+    db: AsyncSession,
+    before: Union[tuple[datetime, int], None] = None,
+    page_size: Union[int, None] = None,
+):
+    # Both bounds are on the partition key, so only the months in the window
+    # are scanned, newest first, each through (user_id, created_at).
+    limit = max(1, min(page_size or settings.PRODUCTS_PAGE_SIZE, settings.PRODUCTS_MAX_PAGE_SIZE))
+    before_created_at, before_id = before or (until, 2**31 - 1)
+    result = await db.execute(
+        PURCHASE_HISTORY_QUERY,
+        {
+            "user_id": user_id,
+            "since": since,
+            "until": until,
+            "before_created_at": before_created_at,
+            "before_id": before_id,
+            "limit": limit,
+        },
+    )
+    return result.fetchall()
+
+
+PURCHASE_EXPORT_COLUMNS = ("id", "product_id", "title", "quantity", "unit_price", "created_at")
+PURCHASE_EXPORT_QUERY = text(
+    """
+    SELECT up.id, up.product_id, p.title, up.quantity, up.unit_price, up.created_at
+    FROM user_products up
+    LEFT JOIN products p ON p.id = up.product_id
+    WHERE up.user_id = :user_id
+        AND up.created_at >= :since
+        AND up.created_at < :until
+    ORDER BY up.created_at, up.id
+    """
+)
+SALES_EXPORT_COLUMNS = (
+    "id", "product_id", "title", "buyer_id", "quantity", "unit_price", "created_at"
+)
+SALES_EXPORT_QUERY = text(
+    """
+    SELECT up.id, up.product_id, p.title, up.user_id, up.quantity, up.unit_price, up.created_at
+    FROM products p
+    JOIN user_products up ON up.product_id = p.id
+    WHERE p.owner_id = :owner_id
+        AND up.created_at >= :since
+        AND up.created_at < :until
+    ORDER BY up.created_at, up.id
+    """
+)
+
+
+async def stream_rows(query, params: dict):
+    """Yields the rows of `query` EXPORT_BATCH_SIZE at a time off a
+    server-side cursor.
+
+    The session is opened here rather than taken from a dependency: a
+    streamed response is sent after the route's dependencies have closed.
+    """
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(
+            query, params, execution_options={"yield_per": settings.EXPORT_BATCH_SIZE}
+        )
+        # The size is passed again: for a text() statement yield_per does not
+        # reach the result, and partitions() without a size fetches every row
+        async for rows in result.partitions(settings.EXPORT_BATCH_SIZE):
+            yield rows
+
+
+def export_purchases(user_id: int, since: datetime, until: datetime):
+    # Purchases compacted into user_product_snapshots are no longer itemized
+    return stream_rows(
+        PURCHASE_EXPORT_QUERY, {"user_id": user_id, "since": since, "until": until}
+    )
+
+
+def export_sales(owner_id: int, since: datetime, until: datetime):
+    # Sales of deleted products have no product to tie them to the seller
+    return stream_rows(
+        SALES_EXPORT_QUERY, {"owner_id": owner_id, "since": since, "until": until}
+    )
+
+
 def delete_product(product_id: int, db: Session):
     try:
         product = db.query(Product).filter(Product.id == product_id).first()
         if product:
             db.delete(product)
             db.commit()
+            invalidate_catalog(product_id)
             return True
         return None
     except Exception:
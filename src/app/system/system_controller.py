@@ -0,0 +1,45 @@
+from fastapi import APIRouter, Depends
+from fastapi.responses import PlainTextResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.app.coins.coins_service import get_machine_coins, reconcile_machine_coins
+from src.app.users.auth import validate_ops_token
+from src.app.util.validator import CoinCountValidation
+from src.core.cache import caches
+from src.core.db import async_engine, engine, get_async_db
+from src.core.metrics import render_metrics
+
+router = APIRouter(dependencies=[Depends(validate_ops_token)])
+
+
+@router.get("/cache-stats")
+def cache_stats():
+    return {name: cache.stats() for name, cache in caches.items()}
+
+
+@router.get("/pool-stats")
+def pool_stats():
+    return {
+        "sync": engine.pool.stats(),
+        "async": async_engine.sync_engine.pool.stats(),
+    }
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    # Prometheus text format; scrape with the ops token as bearer token
+    return PlainTextResponse(
+        render_metrics(pool_stats()), media_type="text/plain; version=0.0.4"
+    )
+
+
+@router.get("/coins")
+async def machine_coins(db: AsyncSession = Depends(get_async_db)):
+    return await get_machine_coins(db)
+
+
+@router.put("/coins")
+async def count_machine_coins(
+    counted: CoinCountValidation, db: AsyncSession = Depends(get_async_db)
+):
+    return await reconcile_machine_coins(counted.counts, db)
@@ -1,7 +1,17 @@
-from fastapi.security import OAuth2PasswordBearer
+import asyncio
+import hashlib
+import secrets
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer, OAuth2PasswordBearer
 from passlib.context import CryptContext
 from pydantic import BaseModel, Field, validator
+from src.core.cache import TTLCache
 from src.core.config import settings
+from src.core.metrics import timed
 from src.core.models import User
 from jose import JWTError, jwt
 from datetime import datetime, timedelta, timezone
@@ -9,19 +19,77 @@ from typing import Annotated, List, Optional
 from fastapi import Depends, HTTPException, status
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl=settings.API_V1_STR + "/users/login-by-form")
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(
+    schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.BCRYPT_ROUNDS
+)
+
+ops_scheme = HTTPBearer(auto_error=False)
 
 ALGORITHM = "HS256"
 
+# Decoded tokens by SHA-256 digest, each kept until the token's own expiry
+token_cache = TTLCache(
+    "tokens", settings.TOKEN_CACHE_SIZE, settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60
+)
+
+
+@dataclass(frozen=True)
+class Principal:
+    id: int
+    username: str
+    role: str
+
+
+class PasswordHashPool:
+    """Runs bcrypt on a fixed number of threads (bcrypt releases the GIL).
+
+    At most `workers + max_pending` calls may be running or queued; any call
+    beyond that is rejected with a 503 instead of piling up behind the pool.
+    Callers on the event loop await the returned future.
+    """
+
+    def __init__(self, workers: int, max_pending: int):
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="password-hash"
+        )
+        self._slots = threading.BoundedSemaphore(workers + max_pending)
+
+    def submit(self, fn, *args) -> Future:
+        if not self._slots.acquire(blocking=False):
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server is busy, please try again",
+                headers={"Retry-After": "1"},
+            )
+        try:
+            future = self._executor.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+
+password_hash_pool = PasswordHashPool(
+    settings.PASSWORD_HASH_WORKERS, settings.PASSWORD_HASH_QUEUE_SIZE
+)
+
 
-def authenticate_user(password: str, user: User):
-    if not pwd_context.verify(password, user.password):
+async def authenticate_user(password: str, user: User):
+    # Awaited rather than blocked on, so a burst of logins waits on the hash
+    # pool (or gets its 503) without holding Starlette's threadpool threads
+    with timed("hash"):
+        verified = await asyncio.wrap_future(
+            password_hash_pool.submit(pwd_context.verify, password, user.password)
+        )
+    if not verified:
         return False
     return user
 
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+async def get_password_hash(password):
+    with timed("hash"):
+        return await asyncio.wrap_future(password_hash_pool.submit(pwd_context.hash, password))
 
 
 def create_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -37,29 +105,59 @@ def create_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 
-async def validate_user(token: Annotated[str, Depends(oauth2_scheme)]):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
+def decode_token(token: str) -> Optional[Principal]:
+    key = hashlib.sha256(token.encode()).digest()
+    principal = token_cache.get(key)
+    if principal is not None:
+        return principal
     try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        role: str = payload.get("role")
-        id: int = payload.get("id")
-        if username is None:
-            raise credentials_exception
+        with timed("jwt"):
+            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[ALGORITHM])
     except JWTError:
-        raise credentials_exception
-    return User(username=username, role=role, id=id)
+        return None
+    username: str = payload.get("sub")
+    role: str = payload.get("role")
+    id: int = payload.get("id")
+    if username is None:
+        return None
+    principal = Principal(id=id, username=username, role=role)
+    token_cache.set(key, principal, ttl=payload["exp"] - time.time())
+    return principal
+
+
+async def validate_user(token: Annotated[str, Depends(oauth2_scheme)]):
+    principal = decode_token(token)
+    if principal is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return principal
+
+
+def validate_ops_token(
+    credentials: Annotated[Optional[HTTPAuthorizationCredentials], Depends(ops_scheme)],
+):
+    # Operational endpoints are for whoever runs the service, not for users,
+    # so they take the configured OPS_TOKEN rather than a login token
+    if not settings.OPS_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if credentials is None or not secrets.compare_digest(
+        credentials.credentials.encode(), settings.OPS_TOKEN.encode()
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
 
 
 class RoleChecker:
     def __init__(self, allowed_roles):
         self.allowed_roles = allowed_roles
 
-    def __call__(self, user: Annotated[User, Depends(validate_user)]):
+    def __call__(self, user: Annotated[Principal, Depends(validate_user)]):
         if user.role in self.allowed_roles:
             return user
         raise HTTPException(
@@ -1,7 +1,9 @@
-from typing import Annotated
+from datetime import datetime, timedelta, timezone
+from typing import Annotated, Union
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.app.users.user_schema import (
     UpdateUserBody,
@@ -9,46 +11,64 @@ from src.app.users.user_schema import (
     UserCreate,
     NewUserResponse,
     DeletedUserResponse,
-    TokenData,
+    ResetResponse,
     LoginBody
 )
 from src.app.users.user_service import *
+from src.app.products.product_schema import PurchaseRecord
+from src.app.products.products_service import (
+    PURCHASE_EXPORT_COLUMNS,
+    SALES_EXPORT_COLUMNS,
+    export_purchases,
+    export_sales,
+    get_purchase_history,
+)
 from src.app.users.auth import (
+    Principal,
     RoleChecker,
     create_token,
     validate_user,
     authenticate_user,
 )
-from src.app.util.validator import CoinsValidation
-from src.core.db import get_db
+from src.app.util.cursor import decode_cursor, encode_cursor
+from src.app.util.export import ExportFormat, export_response
+from src.app.util.rate_limit import limiter
+from src.app.util.validator import CoinsBatchValidation, CoinsValidation
+from src.core.config import settings
+from src.core.db import get_async_db, get_db
 
 router = APIRouter()
 
 
 @router.post("/", response_model=Userout)
-def create(user: UserCreate, db: Session = Depends(get_db)):
-    existing_user = get_user_by_username(user.username, db)
+@limiter.limit(settings.RATE_LIMIT_LOGIN)
+async def create(
+    request: Request, user: UserCreate, db: AsyncSession = Depends(get_async_db)
+):
+    existing_user = await get_user_by_username(user.username, db)
     if existing_user:
         raise HTTPException(
             status_code=400,
             detail="The user with this username already exists in the system.",
         )
 
-    user = add_user(user, db)
+    user = await add_user(user, db)
     if user:
         return user
     raise HTTPException(500, detail="Error while creating user")
 
 
 @router.post("/login", response_model=NewUserResponse)
-def login(
+@limiter.limit(settings.RATE_LIMIT_LOGIN)
+async def login(
+    request: Request,
     login_body: LoginBody,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    user = get_user_by_username(login_body.username, db)
+    user = await get_user_by_username(login_body.username, db, products=True)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    if not authenticate_user(login_body.password, user):
+    if not await authenticate_user(login_body.password, user):
         raise HTTPException(status_code=404, detail="Invalid username or password")
     token = create_token({"sub": user.username, "role": user.role, "id": user.id})
     return {"access_token": token, "user": user}
@@ -56,76 +76,165 @@ def login(
 
 @router.get("/", response_model=Userout)
 def get(
-    user: Annotated[TokenData, Depends(validate_user)], db: Session = Depends(get_db)
+    user: Annotated[Principal, Depends(validate_user)],
+    db: Session = Depends(get_db),
+    include_products: bool = True,
+    products_after: Union[int, None] = None,
+    products_limit: Union[int, None] = None,
 ):
 
-    user = get_user(user.id, db)
+    user = get_user(
+        user.id, db, include_products, products_after, products_limit
+    )
     if user:
         return user
     raise HTTPException(status_code=404, detail="User not found")
 
 
+@router.get("/purchases", response_model=list[PurchaseRecord])
+async def purchases(
+    user: Annotated[Principal, Depends(validate_user)],
+    response: Response,
+    since: Union[datetime, None] = None,
+    until: Union[datetime, None] = None,
+    after: Union[str, None] = None,
+    page_size: Union[int, None] = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+
+    until = as_utc(until) if until else datetime.now(timezone.utc)
+    since = as_utc(since) if since else until - timedelta(
+        days=settings.PURCHASE_HISTORY_DEFAULT_DAYS
+    )
+    before = None
+    if after is not None:
+        cursor = decode_cursor(after)
+        try:
+            before = (datetime.fromisoformat(cursor["created_at"]), int(cursor["id"]))
+        except (KeyError, TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    records = await get_purchase_history(user.id, since, until, db, before, page_size)
+    if records:
+        last = records[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor(
+            {"created_at": last.created_at.isoformat(), "id": last.id}
+        )
+    return records
+
+
+@router.get("/purchases/export")
+async def purchases_export(
+    user: Annotated[Principal, Depends(validate_user)],
+    format: ExportFormat = ExportFormat.ndjson,
+    since: Union[datetime, None] = None,
+    until: Union[datetime, None] = None,
+):
+
+    since, until = export_window(since, until)
+    return export_response(
+        PURCHASE_EXPORT_COLUMNS, export_purchases(user.id, since, until), format, "purchases"
+    )
+
+
+@router.get("/sales/export")
+async def sales_export(
+    user: Annotated[Principal, Depends(RoleChecker(allowed_roles=["seller"]))],
+    format: ExportFormat = ExportFormat.ndjson,
+    since: Union[datetime, None] = None,
+    until: Union[datetime, None] = None,
+):
+
+    since, until = export_window(since, until)
+    return export_response(
+        SALES_EXPORT_COLUMNS, export_sales(user.id, since, until), format, "sales"
+    )
+
+
+def as_utc(value: datetime):
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def export_window(since: Union[datetime, None], until: Union[datetime, None]):
+    # Everything by default; the bounds still prune the partitions scanned
+    since = as_utc(since) if since else datetime(1970, 1, 1, tzinfo=timezone.utc)
+    until = as_utc(until) if until else datetime.now(timezone.utc)
+    return since, until
+
+
 @router.patch("/", response_model=Userout)
-def update(
-    user: Annotated[User, Depends(validate_user)],
+async def update(
+    user: Annotated[Principal, Depends(validate_user)],
     update_data: UpdateUserBody,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     new_username = update_data.new_username
     new_password = update_data.new_password
 
-    userUpdated = update_user(user.id, new_username, new_password, db)
-    if userUpdated > 0:
-        if new_username:
-            user.username = new_username
-        if new_password:
-            user.password = new_password
-        return get_user(user.id, db)
+    userUpdated = await update_user(user.id, new_username, new_password, db)
+    if userUpdated:
+        return userUpdated
     raise HTTPException(status_code=404, detail="User not found")
 
 
 @router.post("/deposit", response_model=Userout)
-def deposit(
-    user: Annotated[TokenData, Depends(RoleChecker(allowed_roles=["buyer"]))],
+async def deposit(
+    user: Annotated[Principal, Depends(RoleChecker(allowed_roles=["buyer"]))],
     amount: CoinsValidation,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
 
-    rowsUpdated = add_amount(user.id, amount.denomination, db)
-    if rowsUpdated > 0:
-        return get_user(user.id, db)
+    userUpdated = await add_amount(user.id, {amount.denomination: 1}, db)
+    if userUpdated:
+        return userUpdated
+    raise HTTPException(status_code=404, detail="User not found")
+
+
+@router.post("/deposit/batch", response_model=Userout)
+async def deposit_batch(
+    user: Annotated[Principal, Depends(RoleChecker(allowed_roles=["buyer"]))],
+    coins: CoinsBatchValidation,
+    db: AsyncSession = Depends(get_async_db),
+):
+
+    userUpdated = await add_amount(user.id, coins.by_denomination, db)
+    if userUpdated:
+        return userUpdated
     raise HTTPException(status_code=404, detail="User not found")
 
 
 @router.post("/login-by-form", response_model=NewUserResponse)
-def login(
+@limiter.limit(settings.RATE_LIMIT_LOGIN)
+async def login_by_form(
+    request: Request,
     form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    user = get_user_by_username(form_data.username, db)
+    user = await get_user_by_username(form_data.username, db, products=True)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    if not authenticate_user(form_data.password, user):
+    if not await authenticate_user(form_data.password, user):
         raise HTTPException(status_code=404, detail="Invalid username or password")
     token = create_token({"sub": user.username, "role": user.role, "id": user.id})
     return {"access_token": token, "user": user}
 
 
-@router.post("/reset", response_model=Userout)
-def reset(
-    user: Annotated[TokenData, Depends(RoleChecker(allowed_roles=["buyer"]))],
-    db: Session = Depends(get_db),
+@router.post("/reset", response_model=ResetResponse)
+async def reset(
+    user: Annotated[Principal, Depends(RoleChecker(allowed_roles=["buyer"]))],
+    db: AsyncSession = Depends(get_async_db),
 ):
 
-    rowsUpdated = reset_amount(user.id, db)
-    if rowsUpdated > 0:
-        return get_user(user.id, db)
+    result = await reset_amount(user.id, db)
+    if result:
+        userUpdated, change = result
+        userOut = Userout.model_validate(userUpdated, from_attributes=True)
+        return ResetResponse(**userOut.model_dump(), change=change)
     raise HTTPException(status_code=404, detail="User not found")
 
 
 @router.delete("/", response_model=DeletedUserResponse)
 def delete(
-    user: Annotated[User, Depends(validate_user)],
+    user: Annotated[Principal, Depends(validate_user)],
     db: Session = Depends(get_db),
 ):
 
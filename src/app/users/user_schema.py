@@ -1,7 +1,7 @@
 from enum import Enum
 from typing import Annotated, Union
 
-from pydantic import BaseModel, validator
+from pydantic import AliasChoices, BaseModel, Field, validator
 
 from src.app.products.product_schema import Product
 from src.app.util.validator import CoinsValidation
@@ -24,12 +24,19 @@ class UserCreate(UserBase):
 class User(UserBase):
     id: int
     balance: int = 0
-    products: list[Product] = []
+    products: list[Product] = Field(
+        default=[], validation_alias=AliasChoices("purchased_products", "products")
+    )
 
     class Config:
         orm_mode = True
 
 
+class ResetResponse(User):
+    # coin -> number of coins paid out
+    change: dict[int, int] = {}
+
+
 class UpdateUserBody(BaseModel):
     new_username: Union[str, None] = None
     new_password: Union[str, None] = None
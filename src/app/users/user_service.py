@@ -1,80 +1,218 @@
-from sqlalchemy.orm import Session
+from typing import Union
+
+from fastapi import HTTPException
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, noload, selectinload
+from sqlalchemy.orm.attributes import set_committed_value
 
 from src.app.users.user_schema import UserCreate
 from src.app.users.auth import get_password_hash
-from src.core.models import User
-
-def add_user(user: UserCreate, db: Session):
+from src.app.products.products_service import invalidate_catalog
+from src.app.coins.coins_service import count_coins, lock_coins, record_coins, record_payout
+from src.app.util.change import SMALLEST_COIN, make_change, payable
+from src.core.config import settings
+from src.core.models import Product, User, user_product_totals
+
+async def add_user(user: UserCreate, db: AsyncSession):
+    password = await get_password_hash(user.password)
     try:
         user = User(
             username=user.username,
-            password=get_password_hash(user.password),
+            password=password,
             role=user.role.value,
         )
         db.add(user)
-        db.commit()
-        db.refresh(user)
+        await db.commit()
+        await db.refresh(user)
+        set_committed_value(user, "purchased_products", [])
         return user
     except:
         return None
 
 
-def get_user(id: int, db: Session):
+def get_user(
+    id: int,
+    db: Session,
+    products: bool = True,
+    products_after: Union[int, None] = None,
+    products_limit: Union[int, None] = None,
+):
+    paginate = products_after is not None or products_limit is not None
     try:
-        return db.query(User).filter(User.id == id).first()
+        query = db.query(User).filter(User.id == id)
+        if products and not paginate:
+            query = query.options(selectinload(User.purchased_products))
+        else:
+            query = query.options(noload(User.purchased_products))
+        user = query.first()
+        if user and products and paginate:
+            set_committed_value(
+                user,
+                "purchased_products",
+                get_user_products(id, db, products_after, products_limit),
+            )
+        return user
     except:
         return None
 
 
-def get_user_by_username(username: str, db: Session):
+def get_user_products(
+    id: int,
+    db: Session,
+    after: Union[int, None] = None,
+    limit: Union[int, None] = None,
+):
+    limit = max(1, min(limit or settings.PRODUCTS_PAGE_SIZE, settings.PRODUCTS_MAX_PAGE_SIZE))
+    query = (
+        select(Product)
+        .join(user_product_totals, user_product_totals.c.product_id == Product.id)
+        .filter(user_product_totals.c.user_id == id)
+        .order_by(Product.id)
+        .limit(limit)
+    )
+    if after is not None:
+        query = query.filter(Product.id > after)
+    return db.scalars(query).all()
+
+
+async def get_user_by_username(username: str, db: AsyncSession, products: bool = False):
     try:
-        return db.query(User).filter(User.username == username).first()
+        loader = selectinload if products else noload
+        user = await db.scalar(
+            select(User)
+            .filter(User.username == username)
+            .options(loader(User.purchased_products))
+        )
+        # Callers hash a password next; end the read so its connection goes
+        # back to the pool instead of idling through bcrypt
+        await db.commit()
+        return user
     except:
         return None
 
 
-def add_amount(id: int, amount: int, db: Session):
+def returning_user(statement, *columns):
+    # The UPDATE hands back the row it changed, so the response needs no
+    # second SELECT of the user; only the products are loaded after it.
+    return (
+        select(User, *columns)
+        .from_statement(statement.returning(User, *columns))
+        .options(selectinload(User.purchased_products))
+    )
+
+
+async def add_amount(id: int, coins: dict[int, int], db: AsyncSession):
+    # The coins are counted into the machine by the same statement that
+    # credits them. Postgres runs an unreferenced data-modifying CTE after
+    # the main UPDATE, so every deposit locks the user's row before its
+    # counter shard.
+    statement = (
+        update(User)
+        .filter(User.id == id)
+        .values({User.balance: User.balance + sum(coin * count for coin, count in coins.items())})
+    )
+    deposited = record_coins(coins)
+    if deposited is not None:
+        statement = statement.add_cte(deposited.cte("deposited"))
     try:
-        rowsUpdated = (
-            db.query(User)
+        user = await db.scalar(returning_user(statement))
+        if user is None:
+            return None
+        await db.commit()
+        return user
+    except:
+        return None
+
+
+async def reset_amount(id: int, db: AsyncSession):
+    # Pays the balance out as change, returning the user and the coins
+    # dispensed. A balance that is not a multiple of the smallest coin keeps
+    # the remainder. Without the inventory the machine is assumed to hold
+    # every coin, so the payout is not taken off machine_coins, which would
+    # otherwise go negative.
+    if settings.COIN_INVENTORY_ENABLED:
+        return await reset_amount_from_inventory(id, db)
+    try:
+        # The balance before the reset comes back with the updated row
+        before = (
+            select(User.id, User.balance)
             .filter(User.id == id)
-            .update({User.balance: User.balance + amount})
+            .with_for_update()
+            .subquery("before")
         )
-        if rowsUpdated == 0:
+        row = (
+            await db.execute(
+                returning_user(
+                    update(User)
+                    .where(User.id == before.c.id)
+                    .values({User.balance: User.balance % SMALLEST_COIN}),
+                    before.c.balance.label("paid_from"),
+                )
+            )
+        ).first()
+        if row is None:
             return None
-        db.commit()
-        return rowsUpdated
+        user, balance = row
+        change = make_change(payable(balance))
+        await db.commit()
+        return user, change
     except:
         return None
 
 
-def reset_amount(id: int, db: Session):
+async def reset_amount_from_inventory(id: int, db: AsyncSession):
+    # Resets paying out of the counted coins take turns, so two of them
+    # cannot hand out the same coins; deposits go on meanwhile and only add
+    change = None
     try:
-        rowsUpdated = db.query(User).filter(User.id == id).update({User.balance: 0})
-        if rowsUpdated == 0:
+        await lock_coins(db)
+        balance = await db.scalar(
+            select(User.balance).filter(User.id == id).with_for_update()
+        )
+        if balance is None:
             return None
-        db.commit()
-        return rowsUpdated
+        change = make_change(payable(balance), await count_coins(db))
+        if change is None:
+            await db.rollback()
+        else:
+            await record_payout(change, db)
+            user = await db.scalar(
+                returning_user(
+                    update(User)
+                    .filter(User.id == id)
+                    .values({User.balance: User.balance % SMALLEST_COIN})
+                )
+            )
+            await db.commit()
+            return user, change
     except:
         return None
+    raise HTTPException(409, "Not enough coins in the machine to pay out the balance")
 
 
-def update_user(id: int, new_username: str, new_password: str, db: Session):
+async def update_user(id: int, new_username: str, new_password: str, db: AsyncSession):
     update_data = {}
 
     if new_username:
         update_data[User.username] = new_username
     if new_password:
-        update_data[User.password] = get_password_hash(new_password)
+        update_data[User.password] = await get_password_hash(new_password)
 
     try:
-        rows_updated = db.query(User).filter(User.id == id).update(update_data)
-
-        if rows_updated == 0:
+        if not update_data:
+            return await db.scalar(
+                select(User)
+                .filter(User.id == id)
+                .options(selectinload(User.purchased_products))
+            )
+        user = await db.scalar(
+            returning_user(update(User).filter(User.id == id).values(update_data))
+        )
+        if user is None:
             return None
-
-        db.commit()
-        return rows_updated
+        await db.commit()
+        return user
     except:
         return None
 
@@ -85,6 +223,7 @@ def delete_user(id: int, db: Session):
         if user:
             db.delete(user)
             db.commit()
+            invalidate_catalog()
             return True
         return None
     except:
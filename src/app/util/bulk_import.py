@@ -0,0 +1,92 @@
+import codecs
+import csv
+import json
+from enum import Enum
+from typing import AsyncIterator, Iterable
+
+
+class ImportFormat(Enum):
+    json = "application/json"
+    ndjson = "application/x-ndjson"
+    csv = "text/csv"
+
+
+class RecordError(Exception):
+    """A record that could not be parsed, yielded in its place so the rest of
+    the body is still read."""
+
+
+async def lines(chunks: AsyncIterator[bytes]) -> AsyncIterator:
+    """The lines of a UTF-8 body, or a RecordError in place of one that is
+    not valid UTF-8. A newline byte is never part of a multi-byte character,
+    so the body is split before it is decoded."""
+    pending = b""
+    first = True
+    async for chunk in chunks:
+        pending += chunk
+        *complete, pending = pending.split(b"\n")
+        for line in complete:
+            yield decode_line(line, first)
+            first = False
+    if pending:
+        yield decode_line(pending, first)
+
+
+def decode_line(line: bytes, first: bool):
+    if first and line.startswith(codecs.BOM_UTF8):
+        line = line[len(codecs.BOM_UTF8):]
+    try:
+        return line.decode("utf-8").rstrip("\r")
+    except UnicodeDecodeError:
+        return RecordError("Invalid UTF-8")
+
+
+async def json_records(items: Iterable) -> AsyncIterator:
+    for item in items:
+        yield item
+
+
+async def ndjson_records(chunks: AsyncIterator[bytes]) -> AsyncIterator:
+    async for line in lines(chunks):
+        if isinstance(line, RecordError):
+            yield line
+            continue
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield RecordError("Invalid JSON")
+
+
+async def csv_records(chunks: AsyncIterator[bytes]) -> AsyncIterator:
+    """One dict per row, keyed by the header row. Empty fields are left out,
+    so they take the schema's defaults."""
+    header = None
+    record = []
+    quotes = 0
+    async for line in lines(chunks):
+        if isinstance(line, RecordError):
+            # Along with the rest of the record it was part of
+            record = []
+            quotes = 0
+            yield line
+            continue
+        record.append(line)
+        # Quotes inside a quoted field are doubled, so an odd count means a
+        # quoted field carries on over the next line
+        quotes += line.count('"')
+        if quotes % 2:
+            continue
+        values = next(csv.reader(["\n".join(record)]), [])
+        record = []
+        quotes = 0
+        if not values:
+            continue
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        yield {name: value for name, value in zip(header, values) if value != ""}
+    if record:
+        yield RecordError("Unterminated quoted field")
+
@@ -0,0 +1,115 @@
+from typing import Union
+
+# Coins the machine pays change in, largest first
+CHANGE_DENOMINATIONS = (100, 50, 20, 10, 5)
+SMALLEST_COIN = CHANGE_DENOMINATIONS[-1]
+
+# coin: (spare, bound). Whenever at least `spare` of `coin` are left unused,
+# the smaller coins of a fewest-coins answer add up to at most `bound`:
+# otherwise some of them could be swapped for fewer of `coin` (e.g. 50+20+20+10
+# for a 100, or 5 x 20 for 2 x 50).
+EXCHANGE_LIMITS = {100: (1, 195), 50: (2, 85), 20: (1, 15), 10: (1, 5)}
+
+
+def payable(amount: int) -> int:
+    """The part of `amount` that can be paid out in coins."""
+    return max(0, amount - amount % SMALLEST_COIN)
+
+
+def greedy_change(amount: int) -> dict[int, int]:
+    # 100/50/20/10/5 is a canonical coin system, so with an unlimited supply
+    # the greedy answer is also the one with fewest coins
+    change = {}
+    for coin in CHANGE_DENOMINATIONS:
+        count, amount = divmod(amount, coin)
+        if count:
+            change[coin] = count
+    return change
+
+
+def fewest_coins(amount: int, inventory: dict[int, int]) -> Union[dict[int, int], None]:
+    # Bounded DP over the amount in units of the smallest coin: best[v] is
+    # the fewest coins making v from the coins seen so far, with one table
+    # per coin kept to walk the answer back.
+    unit = SMALLEST_COIN
+    target = amount // unit
+    best = [0] + [None] * target
+    tables = []
+    for coin in CHANGE_DENOMINATIONS:
+        step, limit = coin // unit, inventory.get(coin, 0)
+        if limit <= 0 or step > target:
+            continue
+        table = best[:]
+        for value in range(step, target + 1):
+            for count in range(1, min(limit, value // step) + 1):
+                previous = best[value - count * step]
+                if previous is not None and (
+                    table[value] is None or previous + count < table[value]
+                ):
+                    table[value] = previous + count
+        tables.append((coin, step, limit, best))
+        best = table
+    if best[target] is None:
+        return None
+
+    change = {}
+    value = target
+    for coin, step, limit, before in reversed(tables):
+        total = best[value]
+        for count in range(min(limit, value // step) + 1):
+            previous = before[value - count * step]
+            if previous is not None and previous + count == total:
+                break
+        if count:
+            change[coin] = count
+        value -= count * step
+        best = before
+    return change
+
+
+def make_change(
+    amount: int, inventory: Union[dict[int, int], None] = None
+) -> Union[dict[int, int], None]:
+    """Fewest coins adding up to exactly `amount`, a multiple of 5.
+
+    With an `inventory` (coin -> count) only the coins in it are used and
+    None is returned when they cannot make the amount.
+    """
+    if amount < 0 or amount % SMALLEST_COIN:
+        return None
+    if inventory is None:
+        return greedy_change(amount)
+
+    # Every fewest-coins answer uses at least `least` of each large coin (see
+    # EXCHANGE_LIMITS), so those are taken up front and the DP only has to
+    # cover what is left, however large the amount.
+    available = {coin: max(0, inventory.get(coin, 0)) for coin in CHANGE_DENOMINATIONS}
+    taken = {}
+    remaining = amount
+    # How much more the coins already visited could still add in the DP
+    headroom = 0
+    for coin, (spare, bound) in EXCHANGE_LIMITS.items():
+        most = min(available[coin], remaining // coin)
+        needed = -(-(remaining - headroom - bound) // coin)
+        least = max(0, min(available[coin] - spare + 1, needed, most))
+        if least:
+            taken[coin] = least
+            available[coin] -= least
+            remaining -= least * coin
+        headroom += (most - least) * coin
+    # Whatever the larger coins left cannot cover has to be paid in fives
+    larger = sum(coin * count for coin, count in available.items() if coin != SMALLEST_COIN)
+    fives = max(0, -(-(remaining - larger) // SMALLEST_COIN))
+    if fives > available[SMALLEST_COIN]:
+        return None
+    if fives:
+        taken[SMALLEST_COIN] = fives
+        available[SMALLEST_COIN] -= fives
+        remaining -= fives * SMALLEST_COIN
+
+    rest = fewest_coins(remaining, available)
+    if rest is None:
+        return None
+    for coin, count in rest.items():
+        taken[coin] = taken.get(coin, 0) + count
+    return {coin: taken[coin] for coin in CHANGE_DENOMINATIONS if taken.get(coin)}
@@ -0,0 +1,106 @@
+import csv
+import io
+import json
+import threading
+from datetime import datetime
+from enum import Enum
+from typing import AsyncIterator, Sequence
+
+from fastapi import HTTPException, status
+from fastapi.responses import StreamingResponse
+
+from src.core.config import settings
+
+
+class ExportFormat(Enum):
+    ndjson = "ndjson"
+    csv = "csv"
+
+
+MEDIA_TYPES = {
+    ExportFormat.ndjson: "application/x-ndjson",
+    ExportFormat.csv: "text/csv",
+}
+
+
+def plain(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+async def ndjson_chunks(columns: Sequence[str], batches: AsyncIterator) -> AsyncIterator[str]:
+    async for rows in batches:
+        yield "".join(
+            json.dumps(dict(zip(columns, map(plain, row))), separators=(",", ":")) + "\n"
+            for row in rows
+        )
+
+
+async def csv_chunks(columns: Sequence[str], batches: AsyncIterator) -> AsyncIterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    async for rows in batches:
+        writer.writerows([map(plain, row) for row in rows])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+class ExportSlots:
+    """Caps the exports streaming at once. Each one holds a pooled
+    connection and an open transaction until its client has read the last
+    row, so a few slow downloads could otherwise take the whole pool from
+    every other request; exports beyond the cap are turned away with a 503.
+    """
+
+    def __init__(self, limit: int):
+        self._slots = threading.BoundedSemaphore(limit)
+
+    def acquire(self):
+        if not self._slots.acquire(blocking=False):
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many exports in progress, please try again",
+                headers={"Retry-After": "5"},
+            )
+
+    def release(self):
+        self._slots.release()
+
+
+export_slots = ExportSlots(settings.EXPORT_MAX_CONCURRENT)
+
+
+class ExportResponse(StreamingResponse):
+    """Gives its export slot back once the response is over, whether the
+    body was sent in full, the client went away or streaming failed."""
+
+    def __init__(self, *args, slots: ExportSlots, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.slots = slots
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.slots.release()
+
+
+def export_response(
+    columns: Sequence[str], batches: AsyncIterator, format: ExportFormat, filename: str
+) -> StreamingResponse:
+    """Streams `batches` of rows as they arrive, one chunk per batch, so
+    memory use does not grow with the size of the export. Raises a 503 when
+    EXPORT_MAX_CONCURRENT exports are already streaming."""
+    chunks = csv_chunks if format == ExportFormat.csv else ndjson_chunks
+    export_slots.acquire()
+    return ExportResponse(
+        chunks(columns, batches),
+        slots=export_slots,
+        media_type=MEDIA_TYPES[format],
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}.{format.value}"'
+        },
+    )
@@ -0,0 +1,28 @@
+from fastapi import Request
+from slowapi import Limiter
+from slowapi.util import get_remote_address
+
+import src.core.rate_limit  # registers the bounded-memory:// and sqlite:// storages
+from src.app.users.auth import decode_token
+from src.core.config import settings
+
+
+def rate_limit_key(request: Request) -> str:
+    # Authenticated callers are limited per user, so buyers behind one NAT
+    # or kiosk do not share a budget; everyone else is limited per address.
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and token:
+        principal = decode_token(token)
+        if principal is not None:
+            return f"user:{principal.id}"
+    return f"ip:{get_remote_address(request)}"
+
+
+limiter = Limiter(
+    key_func=rate_limit_key,
+    default_limits=[settings.RATE_LIMIT_DEFAULT],
+    storage_uri=settings.RATE_LIMIT_STORAGE_URI,
+    enabled=settings.RATE_LIMIT_ENABLED,
+    in_memory_fallback_enabled=True,
+    key_style="endpoint",
+)
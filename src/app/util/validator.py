@@ -1,15 +1,91 @@
 from fastapi import HTTPException
-from pydantic import BaseModel, validator
+from pydantic import BaseModel, root_validator, validator
+
+ALLOWED_DENOMINATIONS = {0, 5, 10, 20, 50, 100}
+MAX_COINS_PER_DEPOSIT = 1000
+
+
+def validate_coin(v: int):
+    if v not in ALLOWED_DENOMINATIONS:
+        raise HTTPException(
+            400,
+            "Invalid Denomination value. Allowed values are: 5, 10, 20, 50, 100"
+        )
+    return v
+
 
 class CoinsValidation(BaseModel):
     denomination: int
 
     @validator("denomination")
     def validate_denomination(cls, v):
-        allowed_values = {0, 5, 10, 20, 50, 100}
-        if v not in allowed_values:
+        return validate_coin(v)
+
+
+def validate_deposit_coin(v: int):
+    # validate_coin lets 0 through, which is a valid price; as a coin in a
+    # batch it would only make an empty deposit look like one
+    if v == 0:
+        raise HTTPException(
+            400,
+            "Invalid Denomination value. Allowed values are: 5, 10, 20, 50, 100"
+        )
+    return validate_coin(v)
+
+
+class CoinsBatchValidation(BaseModel):
+    coins: list[int] = []
+    counts: dict[int, int] = {}
+
+    @validator("coins")
+    def validate_coins(cls, v):
+        for coin in v:
+            validate_deposit_coin(coin)
+        return v
+
+    @validator("counts")
+    def validate_counts(cls, v):
+        for coin, count in v.items():
+            validate_deposit_coin(coin)
+            if count < 0:
+                raise HTTPException(400, "Coin counts must not be negative")
+        return v
+
+    @root_validator(skip_on_failure=True)
+    def validate_coin_count(cls, values):
+        coins = len(values["coins"]) + sum(values["counts"].values())
+        if coins == 0:
+            raise HTTPException(400, "No coins to deposit")
+        if coins > MAX_COINS_PER_DEPOSIT:
             raise HTTPException(
-                400,
-                "Invalid Denomination value. Allowed values are: 5, 10, 20, 50, 100"
+                400, f"At most {MAX_COINS_PER_DEPOSIT} coins can be deposited at once"
             )
+        return values
+
+    @property
+    def total(self) -> int:
+        return sum(self.coins) + sum(coin * count for coin, count in self.counts.items())
+
+    @property
+    def coin_count(self) -> int:
+        return len(self.coins) + sum(self.counts.values())
+
+    @property
+    def by_denomination(self) -> dict[int, int]:
+        counts = dict(self.counts)
+        for coin in self.coins:
+            counts[coin] = counts.get(coin, 0) + 1
+        return counts
+
+
+class CoinCountValidation(BaseModel):
+    # coin -> number of coins, as counted in the machine
+    counts: dict[int, int]
+
+    @validator("counts")
+    def validate_counts(cls, v):
+        for coin, count in v.items():
+            validate_coin(coin)
+            if count < 0:
+                raise HTTPException(400, "Coin counts must not be negative")
         return v
@@ -1,6 +1,6 @@
 import os
 import secrets
-from typing import Any
+from typing import Any, Union
 
 from pydantic_settings import BaseSettings
 
@@ -12,7 +12,77 @@ class Settings(BaseSettings):
     SECRET_KEY: str = os.environ["SECRET_KEY"]
     # 60 minutes * 24 hours * 8 days = 8 days
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 8
+    TOKEN_CACHE_SIZE: int = 4096
+    # Bearer token for the /system endpoints; they answer 404 while unset
+    OPS_TOKEN: Union[str, None] = None
     DATABASE_URI:str = os.environ["DATABASE_URI"]
+    # Defaults to DATABASE_URI with the psycopg (v3) async driver
+    ASYNC_DATABASE_URI: Union[str, None] = None
+    # Applied to both the sync and the async engine, so each worker process
+    # may hold up to 2 * (DB_POOL_SIZE + DB_MAX_OVERFLOW) connections
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30
+    # Connections are replaced after DB_POOL_RECYCLE seconds, ahead of
+    # typical idle timeouts. Pre-ping tests each one on checkout, at the cost
+    # of a round trip per request; turn it on where connections can be cut
+    # underneath the pool, e.g. across a failover.
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = False
+    # 0 leaves statement_timeout at the server default
+    DB_STATEMENT_TIMEOUT_MS: int = 0
+    # Purchases older than this are rolled into user_product_snapshots
+    LEDGER_RETENTION_DAYS: int = 90
+    LEDGER_COMPACTION_BATCH_SIZE: int = 10000
+    # How long compaction waits to drop an expired month's partition before
+    # moving its rows in batches instead
+    LEDGER_PARTITION_LOCK_TIMEOUT_MS: int = 500
+    # Monthly user_products partitions kept ready beyond the current month
+    PURCHASE_PARTITION_MONTHS_AHEAD: int = 3
+    PURCHASE_HISTORY_DEFAULT_DAYS: int = 30
+    # Rows fetched per round trip while streaming an export
+    EXPORT_BATCH_SIZE: int = 1000
+    # Exports streaming at once per process, each holding a pooled
+    # connection; keep well below DB_POOL_SIZE + DB_MAX_OVERFLOW
+    EXPORT_MAX_CONCURRENT: int = 4
+    # Rows upserted per statement and commit by a bulk product import, and
+    # how many of its failed rows are reported back
+    PRODUCT_IMPORT_BATCH_SIZE: int = 1000
+    PRODUCT_IMPORT_MAX_ERRORS: int = 100
+    PRODUCTS_PAGE_SIZE: int = 20
+    PRODUCTS_MAX_PAGE_SIZE: int = 100
+    # Per-process catalog cache; a size of 0 disables it
+    CATALOG_CACHE_SIZE: int = 1024
+    CATALOG_CACHE_TTL_SECONDS: float = 30
+    # Pay /users/reset out of the coins in machine_coins rather than
+    # assuming an unlimited supply of each denomination
+    COIN_INVENTORY_ENABLED: bool = False
+    # Counter rows per coin that deposits and payouts are spread over
+    COIN_INVENTORY_SHARDS: int = 16
+    BCRYPT_ROUNDS: int = 12
+    # bcrypt threads, and how many more calls may wait before answering 503
+    PASSWORD_HASH_WORKERS: int = os.cpu_count() or 1
+    PASSWORD_HASH_QUEUE_SIZE: int = 64
+    # Request histograms for /system/metrics; Server-Timing also shows
+    # clients where their request spent its time
+    METRICS_ENABLED: bool = True
+    SERVER_TIMING_ENABLED: bool = True
+    # Opt-in log of statements slower than the threshold, with the service
+    # function that ran them; a sample also gets EXPLAIN (ANALYZE, BUFFERS)
+    SLOW_QUERY_LOG_ENABLED: bool = False
+    SLOW_QUERY_THRESHOLD_MS: float = 200
+    SLOW_QUERY_EXPLAIN_SAMPLE_RATE: float = 0.01
+    SLOW_QUERY_LOG_FILE: str = "slow_queries.log"
+    SLOW_QUERY_LOG_MAX_BYTES: int = 10 * 1024 * 1024
+    SLOW_QUERY_LOG_BACKUPS: int = 5
+    # bounded-memory://?max_keys=N keeps counters per process,
+    # sqlite:///path/to/file.db shares them between the workers on one host,
+    # redis://host:port/db shares them between hosts
+    RATE_LIMIT_STORAGE_URI: str = "bounded-memory://?max_keys=10000"
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_DEFAULT: str = "50/minute"
+    RATE_LIMIT_LOGIN: str = "10/minute"
+    RATE_LIMIT_BUY: str = "120/minute"
 
 
 settings = Settings()
\ No newline at end of file
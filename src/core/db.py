@@ -1,19 +1,137 @@
-from sqlalchemy import create_engine
+import threading
+import time
+
+from sqlalchemy import create_engine, exc, make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 
 from src.core.config import settings
+from src.core.metrics import instrument_engine, record_pool_wait
+from src.core.slow_queries import instrument_slow_queries
+
+
+class PoolMetricsMixin:
+    """Counts checkouts and the time spent waiting for a pooled connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._metrics_lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.checked_out_peak = 0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            with self._metrics_lock:
+                self.timeouts += 1
+            raise
+        waited = time.perf_counter() - start
+        record_pool_wait(waited)
+        with self._metrics_lock:
+            self.checkouts += 1
+            self.wait_seconds_total += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+            self.checked_out_peak = max(self.checked_out_peak, self.checkedout())
+        return connection
+
+    def stats(self) -> dict:
+        with self._metrics_lock:
+            return {
+                "size": self.size(),
+                "max_overflow": self._max_overflow,
+                "checked_out": self.checkedout(),
+                "checked_out_peak": self.checked_out_peak,
+                "overflow": max(self.overflow(), 0),
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_seconds_total": round(self.wait_seconds_total, 6),
+                "wait_seconds_max": round(self.wait_seconds_max, 6),
+            }
+
+
+class InstrumentedQueuePool(PoolMetricsMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(PoolMetricsMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def engine_options() -> dict:
+    options = {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+    if settings.DB_STATEMENT_TIMEOUT_MS:
+        options["connect_args"] = {
+            "options": f"-c statement_timeout={settings.DB_STATEMENT_TIMEOUT_MS}"
+        }
+    return options
+
 
-engine = create_engine(settings.DATABASE_URI)
+engine = create_engine(
+    settings.DATABASE_URI, poolclass=InstrumentedQueuePool, **engine_options()
+)
+
+instrument_engine(engine)
+instrument_slow_queries(engine)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = create_async_engine(
+    settings.ASYNC_DATABASE_URI
+    or make_url(settings.DATABASE_URI).set(drivername="postgresql+psycopg"),
+    poolclass=InstrumentedAsyncQueuePool,
+    **engine_options(),
+)
+
+instrument_engine(async_engine.sync_engine)
+instrument_slow_queries(async_engine.sync_engine)
+
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine, autoflush=False, expire_on_commit=False
+)
+
 Base = declarative_base()
 
+class LazySession:
+    """Stands in for a session until something is asked of it, so a request
+    that never reaches the database, such as one rejected by auth, neither
+    creates a session nor checks out a connection."""
+
+    def __init__(self, factory):
+        self._factory = factory
+        self.session = None
+
+    def __getattr__(self, name):
+        if self.session is None:
+            self.session = self._factory()
+        return getattr(self.session, name)
+
+
 def get_db():
-    db = SessionLocal()
+    db = LazySession(SessionLocal)
     try:
         yield db
     finally:
-        db.close()
+        if db.session is not None:
+            db.session.close()
+
 
+async def get_async_db():
+    db = LazySession(AsyncSessionLocal)
+    try:
+        yield db
+    finally:
+        if db.session is not None:
+            await db.session.close()
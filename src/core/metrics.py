@@ -0,0 +1,238 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterable, Union
+
+from sqlalchemy import event
+from starlette.datastructures import MutableHeaders
+
+from src.core.config import settings
+
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 4, 6, 8, 12, 16, 25, 50, 100)
+
+
+class RequestTimings:
+    """What one request spent its time on.
+
+    The middleware puts a fresh one in `current_timings` for every request.
+    SQLAlchemy hooks, the connection pools and `timed` blocks add to it from
+    wherever the request's code runs: the event loop, a threadpool thread or
+    the greenlet behind an AsyncSession all see the request's context.
+    """
+
+    def __init__(self):
+        self.statements = 0
+        self.db_seconds = 0.0
+        self.pool_wait_seconds = 0.0
+        self.phases: dict[str, float] = {}
+
+    def server_timing(self, total: float) -> str:
+        entries = [
+            f"app;dur={total * 1000:.1f}",
+            f'db;dur={self.db_seconds * 1000:.1f};desc="{self.statements} statements"',
+            f"pool;dur={self.pool_wait_seconds * 1000:.1f}",
+        ]
+        entries += [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.phases.items()]
+        return ", ".join(entries)
+
+
+current_timings: ContextVar[Union[RequestTimings, None]] = ContextVar(
+    "current_timings", default=None
+)
+
+
+@contextmanager
+def timed(phase: str):
+    """Adds the time spent in the block to the current request's `phase`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings = current_timings.get()
+        if timings is not None:
+            timings.phases[phase] = timings.phases.get(phase, 0.0) + time.perf_counter() - start
+
+
+def record_pool_wait(seconds: float):
+    timings = current_timings.get()
+    if timings is not None:
+        timings.pool_wait_seconds += seconds
+
+
+class Histogram:
+    """A Prometheus histogram with a fixed set of label names."""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple, buckets: tuple):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # labels -> (count per bucket, sum, count)
+        self._series: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+        histograms.append(self)
+
+    def observe(self, labels: tuple, value: float):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            series = {
+                labels: (list(counts), total, count)
+                for labels, (counts, total, count) in self._series.items()
+            }
+        for labels, (counts, total, count) in sorted(series.items()):
+            label_text = ",".join(
+                f'{name}="{escape(value)}"' for name, value in zip(self.labelnames, labels)
+            )
+            for bound, bucket_count in zip(self.buckets, counts):
+                yield f'{self.name}_bucket{{{label_text},le="{bound}"}} {bucket_count}'
+            yield f'{self.name}_bucket{{{label_text},le="+Inf"}} {count}'
+            yield f"{self.name}_sum{{{label_text}}} {total}"
+            yield f"{self.name}_count{{{label_text}}} {count}"
+
+
+def escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+histograms: list[Histogram] = []
+
+request_seconds = Histogram(
+    "http_request_duration_seconds",
+    "Time from receiving a request to its last response byte.",
+    ("method", "route", "status"),
+    SECONDS_BUCKETS,
+)
+request_statements = Histogram(
+    "http_request_db_statements",
+    "SQL statements run per request.",
+    ("method", "route"),
+    STATEMENT_BUCKETS,
+)
+request_db_seconds = Histogram(
+    "http_request_db_duration_seconds",
+    "Time per request spent executing SQL statements.",
+    ("method", "route"),
+    SECONDS_BUCKETS,
+)
+request_pool_wait_seconds = Histogram(
+    "http_request_pool_wait_seconds",
+    "Time per request spent waiting for a pooled database connection.",
+    ("method", "route"),
+    SECONDS_BUCKETS,
+)
+request_phase_seconds = Histogram(
+    "http_request_phase_duration_seconds",
+    "Time per request spent in a phase timed by the app, e.g. password hashing.",
+    ("method", "route", "phase"),
+    SECONDS_BUCKETS,
+)
+
+
+def render_gauge(name: str, documentation: str, labelname: str, values: dict) -> Iterable[str]:
+    yield f"# HELP {name} {documentation}"
+    yield f"# TYPE {name} gauge"
+    for label, value in sorted(values.items()):
+        yield f'{name}{{{labelname}="{escape(label)}"}} {value}'
+
+
+def render_metrics(pools: dict) -> str:
+    """The histograms, plus gauges from `pools` (name -> pool stats()), in
+    the Prometheus text format."""
+    lines = []
+    for histogram in histograms:
+        lines += histogram.render()
+    for key, documentation in (
+        ("checked_out", "Connections currently checked out."),
+        ("checkouts", "Connections checked out since start."),
+        ("timeouts", "Checkouts that timed out waiting for a connection."),
+        ("wait_seconds_total", "Time spent waiting for a connection since start."),
+    ):
+        lines += render_gauge(
+            f"db_pool_{key}",
+            documentation,
+            "pool",
+            {name: stats[key] for name, stats in pools.items()},
+        )
+    return "\n".join(lines) + "\n"
+
+
+def route_label(scope) -> str:
+    # The route's path template, so /products/1 and /products/2 share a series
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    """Times every HTTP request into the histograms and, with
+    SERVER_TIMING_ENABLED, reports the breakdown in a Server-Timing header."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        timings = RequestTimings()
+        token = current_timings.set(timings)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_timings(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if settings.SERVER_TIMING_ENABLED:
+                    headers = MutableHeaders(scope=message)
+                    headers.append(
+                        "Server-Timing", timings.server_timing(time.perf_counter() - start)
+                    )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timings)
+        finally:
+            current_timings.reset(token)
+            method, route = scope["method"], route_label(scope)
+            request_seconds.observe((method, route, str(status)), time.perf_counter() - start)
+            request_statements.observe((method, route), timings.statements)
+            request_db_seconds.observe((method, route), timings.db_seconds)
+            request_pool_wait_seconds.observe((method, route), timings.pool_wait_seconds)
+            for phase, seconds in timings.phases.items():
+                request_phase_seconds.observe((method, route, phase), seconds)
+
+
+def instrument_engine(engine):
+    """Counts and times the statements `engine` runs for the current request."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def start_statement(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("statement_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def end_statement(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["statement_start"].pop()
+        timings = current_timings.get()
+        if timings is not None:
+            timings.statements += 1
+            timings.db_seconds += elapsed
+
+    @event.listens_for(engine, "handle_error")
+    def failed_statement(exception_context):
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("statement_start"):
+            end_statement(conn, None, None, None, None, False)
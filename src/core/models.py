@@ -1,15 +1,63 @@
-from sqlalchemy import Column, Index, Integer, ForeignKey, String, Table
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Computed, DateTime, Index, Integer, ForeignKey, String, Table, UniqueConstraint, func, text
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import deferred, relationship
 from src.core.db import Base   
 
 
+# Range-partitioned by month on created_at; the partitions themselves are
+# managed in src/core/partitions.py
 user_products = Table(
     "user_products",
     Base.metadata,
-    Column('id', Integer, primary_key=True),
-    Column("user_id", ForeignKey("users.id")),
-    Column("product_id", ForeignKey("products.id")),
+    Column('id', Integer, primary_key=True, autoincrement=True),
+    Column("user_id", ForeignKey("users.id", ondelete="CASCADE")),
+    Column("product_id", ForeignKey("products.id", ondelete="SET NULL")),
     Column("quantity", Integer, default=1),
+    Column("unit_price", Integer, nullable=False),
+    Column("created_at", DateTime(timezone=True), primary_key=True, server_default=func.now(), index=True),
+    Index("ix_user_products_user_id_created_at", "user_id", "created_at"),
+    Index("ix_user_products_product_id", "product_id"),
+    postgresql_partition_by="RANGE (created_at)",
+)
+
+# Like the ledger, totals and snapshots outlive the product: its rows keep
+# their amounts with a NULL product_id. Rows of deleted products are never
+# matched by ON CONFLICT (user_id, product_id), as NULLs are distinct.
+user_product_totals = Table(
+    "user_product_totals",
+    Base.metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("user_id", ForeignKey("users.id", ondelete="CASCADE"), nullable=False),
+    Column("product_id", ForeignKey("products.id", ondelete="SET NULL")),
+    Column("total_quantity", Integer, nullable=False, default=0),
+    Column("total_spent", Integer, nullable=False, default=0),
+    UniqueConstraint("user_id", "product_id", name="uq_user_product_totals_user_id_product_id"),
+    Index("ix_user_product_totals_product_id", "product_id"),
+)
+
+# Ledger rows older than the compaction cutoff, rolled up per user/product
+user_product_snapshots = Table(
+    "user_product_snapshots",
+    Base.metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("user_id", ForeignKey("users.id", ondelete="CASCADE"), nullable=False),
+    Column("product_id", ForeignKey("products.id", ondelete="SET NULL")),
+    Column("quantity", Integer, nullable=False),
+    Column("spent", Integer, nullable=False),
+    Column("compacted_through", DateTime(timezone=True), nullable=False),
+    UniqueConstraint("user_id", "product_id", name="uq_user_product_snapshots_user_id_product_id"),
+    Index("ix_user_product_snapshots_product_id", "product_id"),
+)
+
+# Coins in the machine, as counters split over shards: a coin's count is the
+# sum of its rows, and a single row may be negative. See
+# src/app/coins/coins_service.py.
+machine_coins = Table(
+    "machine_coins",
+    Base.metadata,
+    Column("denomination", Integer, primary_key=True, autoincrement=False),
+    Column("shard", Integer, primary_key=True, autoincrement=False, server_default="0"),
+    Column("count", Integer, nullable=False, server_default="0"),
 )
 
 class User(Base):
@@ -21,11 +69,29 @@ class User(Base):
     role = Column(String, default="buyer")
     balance = Column(Integer, default=0)
     product_owner = relationship("Product", cascade="all, delete")
-    products = relationship('Product', secondary=user_products, back_populates="users", cascade="all, delete")
+    # Purchase rows go with the user (ON DELETE CASCADE) and outlive the
+    # product (ON DELETE SET NULL); the database handles both
+    products = relationship('Product', secondary=user_products, back_populates="users", passive_deletes=True)
+    # One entry per product bought, for responses. Loading is always chosen
+    # per query (selectinload/noload) so serializing a user never lazy-loads.
+    purchased_products = relationship(
+        'Product',
+        secondary=user_product_totals,
+        order_by='Product.id',
+        viewonly=True,
+        lazy="raise",
+    )
 
 
 
 
+# Title words rank above description words
+PRODUCT_SEARCH_VECTOR = (
+    "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(description, '')), 'B')"
+)
+
+
 class Product(Base):
     __tablename__ = "products"
 
@@ -35,8 +101,19 @@ class Product(Base):
     quantity = Column(Integer, default=1)
     description = Column(String)
     owner_id = Column(Integer, ForeignKey("users.id"))
-    users = relationship('User', secondary=user_products, back_populates="products", cascade="all, delete")
+    # Maintained by Postgres for /products/search; never loaded with a product
+    search_vector = deferred(Column(TSVECTOR, Computed(PRODUCT_SEARCH_VECTOR, persisted=True)))
+    users = relationship('User', secondary=user_products, back_populates="products", passive_deletes=True)
     __table_args__ = (
         Index('idx_owner_id_title', 'owner_id', 'title', unique=True),
+        Index('ix_products_in_stock_id', 'id', postgresql_where=text('quantity > 0')),
+        # Catalog sorts by price, and by id or price within one seller; the
+        # title sorts use ix_products_title and idx_owner_id_title
+        Index('ix_products_price_id', 'price', 'id'),
+        Index('ix_products_owner_id_id', 'owner_id', 'id'),
+        Index('ix_products_owner_id_price_id', 'owner_id', 'price', 'id'),
+        Index('ix_products_search_vector', 'search_vector', postgresql_using='gin'),
+        # Byte order, so LIKE 'prefix%' is a range scan returned in title order
+        Index('ix_products_title_prefix', text('lower(title) COLLATE "C"'), 'id'),
     )
 
@@ -0,0 +1,100 @@
+import re
+from datetime import date, datetime, timezone
+from typing import Union
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+# user_products is range-partitioned by month on created_at, one partition
+# per month named user_products_pYYYYMM plus a DEFAULT partition catching
+# anything outside them. Month boundaries are UTC.
+PURCHASES_TABLE = "user_products"
+PURCHASES_DEFAULT_PARTITION = "user_products_default"
+PARTITION_NAME = re.compile(r"^user_products_p(\d{4})(\d{2})$")
+
+
+def month_start(value: Union[date, datetime]) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{PURCHASES_TABLE}_p{month.year:04d}{month.month:02d}"
+
+
+def partition_month(name: str) -> Union[date, None]:
+    match = PARTITION_NAME.match(name)
+    return date(int(match[1]), int(match[2]), 1) if match else None
+
+
+def is_purchase_partition(name: str) -> bool:
+    return name == PURCHASES_DEFAULT_PARTITION or partition_month(name) is not None
+
+
+def month_bound(month: date) -> str:
+    return f"{month.isoformat()} 00:00:00+00"
+
+
+def list_purchase_partitions(db: Session) -> list[date]:
+    names = db.execute(
+        text(
+            """
+            SELECT child.relname
+            FROM pg_inherits
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE pg_inherits.inhparent = CAST(:table AS regclass)
+            """
+        ),
+        {"table": PURCHASES_TABLE},
+    ).scalars()
+    return sorted(month for month in map(partition_month, names) if month)
+
+
+def ensure_purchase_partitions(
+    db: Session, months_ahead: int, start: Union[date, None] = None
+) -> list[str]:
+    """Create the monthly partitions from `start` (this month by default)
+    through `months_ahead` months later, returning the ones created.
+
+    Rows already sitting in the DEFAULT partition for a new month are moved
+    into it, so a late run never fails and never strands purchases.
+    """
+    # Serializes workers starting at the same time
+    db.execute(text("SELECT pg_advisory_xact_lock(hashtext(:table))"), {"table": PURCHASES_TABLE})
+    first = month_start(start or datetime.now(timezone.utc))
+    existing = set(list_purchase_partitions(db))
+    created = []
+    for month in (add_months(first, i) for i in range(months_ahead + 1)):
+        if month in existing:
+            continue
+        name = partition_name(month)
+        lower, upper = month_bound(month), month_bound(add_months(month, 1))
+        db.execute(
+            text(f"CREATE TABLE {name} (LIKE {PURCHASES_TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+        )
+        db.execute(
+            text(
+                f"""
+                WITH moved AS (
+                    DELETE FROM {PURCHASES_DEFAULT_PARTITION}
+                    WHERE created_at >= :lower AND created_at < :upper
+                    RETURNING *
+                )
+                INSERT INTO {name} SELECT * FROM moved
+                """
+            ),
+            {"lower": lower, "upper": upper},
+        )
+        db.execute(
+            text(
+                f"ALTER TABLE {PURCHASES_TABLE} ATTACH PARTITION {name} "
+                f"FOR VALUES FROM ('{lower}') TO ('{upper}')"
+            )
+        )
+        created.append(name)
+    db.commit()
+    return created
@@ -0,0 +1,146 @@
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+
+from limits.errors import ConfigurationError
+from limits.storage import MemoryStorage, Storage
+
+
+def uri_option(uri: Optional[str], name: str, default: int) -> int:
+    values = parse_qs(urlparse(uri or "").query).get(name)
+    return int(values[0]) if values else default
+
+
+class BoundedMemoryStorage(MemoryStorage):
+    """Per-process counters, keeping at most `max_keys` rate limit keys.
+
+    `bounded-memory://?max_keys=10000`. Once full, the key hit least
+    recently is dropped, so a flood of distinct clients cannot grow memory
+    without bound; the dropped client simply starts a fresh window.
+    """
+
+    STORAGE_SCHEME = ["bounded-memory"]
+
+    def __init__(self, uri: Optional[str] = None, wrap_exceptions: bool = False, **options):
+        self.max_keys = uri_option(uri, "max_keys", 10000)
+        self.recent: OrderedDict[str, None] = OrderedDict()
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+
+    def incr(self, key: str, expiry: int, elastic_expiry: bool = False, amount: int = 1) -> int:
+        with self.lock:
+            count = super().incr(key, expiry, elastic_expiry, amount)
+            self.recent[key] = None
+            self.recent.move_to_end(key)
+            while len(self.recent) > self.max_keys:
+                evicted, _ = self.recent.popitem(last=False)
+                super().clear(evicted)
+            return count
+
+    def clear(self, key: str) -> None:
+        with self.lock:
+            self.recent.pop(key, None)
+            super().clear(key)
+
+    def reset(self) -> Optional[int]:
+        with self.lock:
+            self.recent.clear()
+            return super().reset()
+
+
+class SQLiteStorage(Storage):
+    """Counters in a SQLite file shared by every worker on the host.
+
+    `sqlite:///var/run/vending/ratelimit.db` (the path follows `sqlite://`).
+    Each hit is a single upsert, so concurrent workers never lose counts.
+    """
+
+    STORAGE_SCHEME = ["sqlite"]
+    PURGE_EVERY = 1000
+
+    def __init__(self, uri: Optional[str] = None, wrap_exceptions: bool = False, **options):
+        self.path = urlparse(uri).path
+        if not self.path:
+            raise ConfigurationError("sqlite rate limit storage needs a file path")
+        self.local = threading.local()
+        self.hits = 0
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        with self.connection as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS rate_limits (
+                    key TEXT PRIMARY KEY,
+                    count INTEGER NOT NULL,
+                    expiry REAL NOT NULL
+                )
+                """
+            )
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def incr(self, key: str, expiry: int, elastic_expiry: bool = False, amount: int = 1) -> int:
+        now = time.time()
+        with self.lock:
+            self.hits += 1
+            purge = self.hits % self.PURGE_EVERY == 0
+        conn = self.connection
+        if purge:
+            conn.execute("DELETE FROM rate_limits WHERE expiry <= ?", (now,))
+        return conn.execute(
+            """
+            INSERT INTO rate_limits (key, count, expiry) VALUES (:key, :amount, :expiry)
+            ON CONFLICT (key) DO UPDATE SET
+                count = CASE WHEN rate_limits.expiry <= :now
+                    THEN :amount ELSE rate_limits.count + :amount END,
+                expiry = CASE WHEN rate_limits.expiry <= :now OR :elastic
+                    THEN :expiry ELSE rate_limits.expiry END
+            RETURNING count
+            """,
+            {
+                "key": key,
+                "amount": amount,
+                "expiry": now + expiry,
+                "now": now,
+                "elastic": elastic_expiry,
+            },
+        ).fetchone()[0]
+
+    def get(self, key: str) -> int:
+        row = self.connection.execute(
+            "SELECT count FROM rate_limits WHERE key = ? AND expiry > ?",
+            (key, time.time()),
+        ).fetchone()
+        return row[0] if row else 0
+
+    def get_expiry(self, key: str) -> int:
+        row = self.connection.execute(
+            "SELECT expiry FROM rate_limits WHERE key = ?", (key,)
+        ).fetchone()
+        return int(row[0] if row else time.time())
+
+    def check(self) -> bool:
+        try:
+            self.connection.execute("SELECT 1")
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self) -> Optional[int]:
+        return self.connection.execute("DELETE FROM rate_limits").rowcount
+
+    def clear(self, key: str) -> None:
+        self.connection.execute("DELETE FROM rate_limits WHERE key = ?", (key,))
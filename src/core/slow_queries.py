@@ -0,0 +1,134 @@
+import json
+import logging
+import os
+import random
+import sys
+import time
+from datetime import datetime, timezone
+from logging.handlers import RotatingFileHandler
+
+import greenlet
+from sqlalchemy import event
+
+from src.core.config import settings
+
+logger = logging.getLogger("src.slow_queries")
+logger.propagate = False
+logger.setLevel(logging.INFO)
+
+MAX_STATEMENT_LENGTH = 4000
+
+
+def slow_query_logger() -> logging.Logger:
+    # (Re)opened on first use and whenever SLOW_QUERY_LOG_FILE changes
+    path = os.path.abspath(settings.SLOW_QUERY_LOG_FILE)
+    handler = logger.handlers[0] if logger.handlers else None
+    if handler is None or handler.baseFilename != path:
+        if handler is not None:
+            logger.removeHandler(handler)
+            handler.close()
+        handler = RotatingFileHandler(
+            path,
+            maxBytes=settings.SLOW_QUERY_LOG_MAX_BYTES,
+            backupCount=settings.SLOW_QUERY_LOG_BACKUPS,
+            delay=True,
+        )
+        logger.addHandler(handler)
+    return logger
+
+
+def service_function() -> str:
+    """The innermost `*_service` function on the stack, as module.function.
+
+    An AsyncSession runs its statements in a greenlet of its own, so the
+    search carries on up the stacks of the greenlets waiting on it, where the
+    service coroutine is.
+    """
+    frame = sys._getframe(1)
+    current = greenlet.getcurrent()
+    while True:
+        while frame is not None:
+            module = frame.f_globals.get("__name__", "")
+            if module.startswith("src.") and module.endswith("_service"):
+                return f"{module.rsplit('.', 1)[-1]}.{frame.f_code.co_name}"
+            frame = frame.f_back
+        current = current.parent
+        if current is None:
+            return "unknown"
+        frame = current.gr_frame
+
+
+def shape(value):
+    """The types in a statement's parameters, never their values."""
+    if isinstance(value, dict):
+        return {key: shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        if not value:
+            return f"{type(value).__name__}[]"
+        return f"{type(value).__name__}[{shape(value[0])} x {len(value)}]"
+    return type(value).__name__
+
+
+def explain(conn, statement: str, parameters) -> list:
+    # EXPLAIN ANALYZE runs the statement again, so it goes through a savepoint
+    # that is rolled back: an UPDATE is not applied twice. A raw cursor keeps
+    # these statements out of the SQLAlchemy events, and out of the metrics.
+    cursor = conn.connection.dbapi_connection.cursor()
+    try:
+        cursor.execute("SAVEPOINT slow_query_explain")
+        try:
+            cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS) {statement}", parameters)
+            return [row[0] for row in cursor.fetchall()]
+        finally:
+            cursor.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+            cursor.execute("RELEASE SAVEPOINT slow_query_explain")
+    finally:
+        cursor.close()
+
+
+def log_slow_statement(conn, statement, parameters, executemany, elapsed):
+    entry = {
+        "at": datetime.now(timezone.utc).isoformat(),
+        "duration_ms": round(elapsed * 1000, 2),
+        "function": service_function(),
+        "statement": " ".join(statement.split())[:MAX_STATEMENT_LENGTH],
+        "parameters": shape(parameters),
+    }
+    if (
+        not executemany
+        and conn.in_transaction()
+        and random.random() < settings.SLOW_QUERY_EXPLAIN_SAMPLE_RATE
+    ):
+        try:
+            entry["plan"] = explain(conn, statement, parameters)
+        except Exception as e:
+            entry["plan_error"] = str(e).strip()
+    slow_query_logger().info(json.dumps(entry, default=str))
+
+
+def instrument_slow_queries(engine):
+    """Logs statements `engine` runs that take longer than
+    SLOW_QUERY_THRESHOLD_MS, while SLOW_QUERY_LOG_ENABLED is set."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def start_statement(conn, cursor, statement, parameters, context, executemany):
+        if settings.SLOW_QUERY_LOG_ENABLED:
+            conn.info.setdefault("slow_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def end_statement(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("slow_query_start")
+        if not starts:
+            return
+        elapsed = time.perf_counter() - starts.pop()
+        if elapsed * 1000 >= settings.SLOW_QUERY_THRESHOLD_MS:
+            try:
+                log_slow_statement(conn, statement, parameters, executemany, elapsed)
+            except Exception:
+                logging.getLogger(__name__).exception("Could not log a slow statement")
+
+    @event.listens_for(engine, "handle_error")
+    def failed_statement(exception_context):
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("slow_query_start"):
+            conn.info["slow_query_start"].pop()
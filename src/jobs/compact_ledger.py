@@ -0,0 +1,48 @@
+"""Roll purchases older than the retention window into per-user snapshots.
+
+Also creates the upcoming monthly user_products partitions. Meant to run
+periodically (cron, a scheduled container) next to the API:
+
+    python -m src.jobs.compact_ledger --older-than-days 90
+"""
+import argparse
+import json
+import time
+from datetime import datetime, timedelta, timezone
+
+from src.app.products.products_service import compact_purchase_ledger
+from src.core.config import settings
+from src.core.db import SessionLocal
+from src.core.partitions import ensure_purchase_partitions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--older-than-days", type=int, default=settings.LEDGER_RETENTION_DAYS)
+    parser.add_argument("--batch-size", type=int, default=settings.LEDGER_COMPACTION_BATCH_SIZE)
+    parser.add_argument("--months-ahead", type=int, default=settings.PURCHASE_PARTITION_MONTHS_AHEAD)
+    args = parser.parse_args()
+
+    before = datetime.now(timezone.utc) - timedelta(days=args.older_than_days)
+    start = time.perf_counter()
+    db = SessionLocal()
+    try:
+        partitions = ensure_purchase_partitions(db, args.months_ahead)
+        compacted = compact_purchase_ledger(before, db, args.batch_size)
+    finally:
+        db.close()
+
+    print(
+        json.dumps(
+            {
+                "created_partitions": partitions,
+                "before": before.isoformat(),
+                "compacted_rows": compacted,
+                "elapsed_s": round(time.perf_counter() - start, 3),
+            }
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
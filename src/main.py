@@ -1,19 +1,43 @@
+import logging
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 
 from src.core.config import settings
+from src.core.db import SessionLocal
+from src.core.metrics import MetricsMiddleware
+from src.core.partitions import ensure_purchase_partitions
 from src.routes import api_router
 
 from slowapi.errors import RateLimitExceeded
-from slowapi.util import get_remote_address
-from slowapi import Limiter, _rate_limit_exceeded_handler
+from slowapi.middleware import SlowAPIASGIMiddleware
+from slowapi import _rate_limit_exceeded_handler
+
+from src.app.util.rate_limit import limiter
 
 summary = """ 
  API for a vending machine, allowing users with a “seller” role to add, update, or remove products, while users with a “buyer” role can deposit coins into the machine and make purchases. The vending machine should only accept 5, 10, 20, 50, and 100 cent coins
 """
 
-limiter = Limiter(key_func=get_remote_address, default_limits=["50/minute"])
-app = FastAPI(title="Vending Machine API", version="0.1", summary=summary)
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Purchases for a month without a partition land in the default one, so
+    # failing here is logged rather than keeping the API down.
+    try:
+        with SessionLocal() as db:
+            ensure_purchase_partitions(db, settings.PURCHASE_PARTITION_MONTHS_AHEAD)
+    except Exception:
+        logger.exception("Could not create upcoming user_products partitions")
+    yield
+
+
+app = FastAPI(title="Vending Machine API", version="0.1", summary=summary, lifespan=lifespan)
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+app.add_middleware(SlowAPIASGIMiddleware)
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(api_router, prefix=settings.API_V1_STR)
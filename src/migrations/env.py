@@ -8,6 +8,7 @@ from alembic import context
 
 from src.core.models import User
 from src.core.config import settings
+from src.core.partitions import is_purchase_partition
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -26,6 +27,12 @@ target_metadata = [
     User.metadata,
 ]
 
+
+def include_name(name, type_, parent_names):
+    # Purchase partitions are created at runtime, not declared in the models
+    return not (type_ == "table" and is_purchase_partition(name))
+
+
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
 # my_important_option = config.get_main_option("my_important_option")
@@ -48,6 +55,7 @@ def run_migrations_offline() -> None:
     context.configure(
         url=url,
         target_metadata=target_metadata,
+        include_name=include_name,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
     )
@@ -71,7 +79,9 @@ def run_migrations_online() -> None:
 
     with connectable.connect() as connection:
         context.configure(
-            connection=connection, target_metadata=target_metadata
+            connection=connection,
+            target_metadata=target_metadata,
+            include_name=include_name,
         )
 
         with context.begin_transaction():
@@ -0,0 +1,30 @@
+"""Keeps purchases of deleted products
+
+Revision ID: 01dc82af9036
+Revises: 133b86395569
+Create Date: 2026-10-18 17:36:21.804417
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '01dc82af9036'
+down_revision: Union[str, None] = '133b86395569'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # The ledger outlives the product: its rows keep the price paid and lose
+    # only the product reference
+    op.drop_constraint('user_products_product_id_fkey', 'user_products', type_='foreignkey')
+    op.create_foreign_key('user_products_product_id_fkey', 'user_products', 'products', ['product_id'], ['id'], ondelete='SET NULL')
+
+
+def downgrade() -> None:
+    op.drop_constraint('user_products_product_id_fkey', 'user_products', type_='foreignkey')
+    op.create_foreign_key('user_products_product_id_fkey', 'user_products', 'products', ['product_id'], ['id'], ondelete='CASCADE')
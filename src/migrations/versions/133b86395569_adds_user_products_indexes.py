@@ -0,0 +1,39 @@
+"""Adds user_products indexes
+
+Revision ID: 133b86395569
+Revises: f1bb780cbb32
+Create Date: 2026-10-18 16:48:03.512207
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '133b86395569'
+down_revision: Union[str, None] = 'f1bb780cbb32'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # user_id lookups are already served by ix_user_products_user_id_created_at
+    op.create_index('ix_user_products_product_id', 'user_products', ['product_id'], unique=False)
+    op.create_index('ix_user_product_totals_product_id', 'user_product_totals', ['product_id'], unique=False)
+    op.create_index('ix_user_product_snapshots_product_id', 'user_product_snapshots', ['product_id'], unique=False)
+    op.drop_constraint('user_products_user_id_fkey', 'user_products', type_='foreignkey')
+    op.drop_constraint('user_products_product_id_fkey', 'user_products', type_='foreignkey')
+    op.create_foreign_key('user_products_user_id_fkey', 'user_products', 'users', ['user_id'], ['id'], ondelete='CASCADE')
+    op.create_foreign_key('user_products_product_id_fkey', 'user_products', 'products', ['product_id'], ['id'], ondelete='CASCADE')
+
+
+def downgrade() -> None:
+    op.drop_constraint('user_products_product_id_fkey', 'user_products', type_='foreignkey')
+    op.drop_constraint('user_products_user_id_fkey', 'user_products', type_='foreignkey')
+    op.create_foreign_key('user_products_product_id_fkey', 'user_products', 'products', ['product_id'], ['id'])
+    op.create_foreign_key('user_products_user_id_fkey', 'user_products', 'users', ['user_id'], ['id'])
+    op.drop_index('ix_user_product_snapshots_product_id', table_name='user_product_snapshots')
+    op.drop_index('ix_user_product_totals_product_id', table_name='user_product_totals')
+    op.drop_index('ix_user_products_product_id', table_name='user_products')
@@ -0,0 +1,33 @@
+"""Adds machine coins
+
+Revision ID: 4c0d2b7e91a3
+Revises: 01dc82af9036
+Create Date: 2026-10-18 18:12:40.218734
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4c0d2b7e91a3'
+down_revision: Union[str, None] = '01dc82af9036'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    machine_coins = op.create_table('machine_coins',
+    sa.Column('denomination', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('count', sa.Integer(), server_default='0', nullable=False),
+    sa.CheckConstraint('count >= 0', name='ck_machine_coins_count_not_negative'),
+    sa.PrimaryKeyConstraint('denomination')
+    )
+    # An empty machine; operators load coins by updating the counts
+    op.bulk_insert(machine_coins, [{'denomination': coin, 'count': 0} for coin in (5, 10, 20, 50, 100)])
+
+
+def downgrade() -> None:
+    op.drop_table('machine_coins')
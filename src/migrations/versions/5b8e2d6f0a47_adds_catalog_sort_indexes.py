@@ -0,0 +1,30 @@
+"""Adds catalog sort indexes
+
+Revision ID: 5b8e2d6f0a47
+Revises: 7a41c0e9d2b6
+Create Date: 2026-10-18 23:48:52.604113
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b8e2d6f0a47'
+down_revision: Union[str, None] = '7a41c0e9d2b6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_products_owner_id_id', 'products', ['owner_id', 'id'], unique=False)
+    op.create_index('ix_products_owner_id_price_id', 'products', ['owner_id', 'price', 'id'], unique=False)
+    op.create_index('ix_products_price_id', 'products', ['price', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_products_price_id', table_name='products')
+    op.drop_index('ix_products_owner_id_price_id', table_name='products')
+    op.drop_index('ix_products_owner_id_id', table_name='products')
@@ -0,0 +1,53 @@
+"""Adds purchase ledger
+
+Revision ID: 5bf66ca09605
+Revises: ffe2e2059ddb
+Create Date: 2026-10-18 13:41:09.382715
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5bf66ca09605'
+down_revision: Union[str, None] = 'ffe2e2059ddb'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('user_product_snapshots',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.Column('spent', sa.Integer(), nullable=False),
+    sa.Column('compacted_through', sa.DateTime(timezone=True), nullable=False),
+    sa.ForeignKeyConstraint(['product_id'], ['products.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id', 'product_id')
+    )
+    op.add_column('user_products', sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False))
+    op.add_column('user_products', sa.Column('unit_price', sa.Integer(), nullable=True))
+    # The price paid was never recorded; existing rows get the current price,
+    # which is what every summary has reported for them so far.
+    op.execute(
+        """
+        UPDATE user_products up
+        SET unit_price = COALESCE(p.price, 0)
+        FROM products p
+        WHERE up.product_id = p.id
+        """
+    )
+    op.execute("UPDATE user_products SET unit_price = 0 WHERE unit_price IS NULL")
+    op.alter_column('user_products', 'unit_price', nullable=False)
+    op.create_index('ix_user_products_created_at', 'user_products', ['created_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_user_products_created_at', table_name='user_products')
+    op.drop_column('user_products', 'unit_price')
+    op.drop_column('user_products', 'created_at')
+    op.drop_table('user_product_snapshots')
@@ -0,0 +1,46 @@
+"""Adds user_product_totals
+
+Revision ID: 739bb5b3c6d8
+Revises: 2888f074c6c1
+Create Date: 2026-10-18 09:12:41.208513
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '739bb5b3c6d8'
+down_revision: Union[str, None] = '2888f074c6c1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('user_product_totals',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('total_quantity', sa.Integer(), nullable=False),
+    sa.Column('total_spent', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['product_id'], ['products.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id', 'product_id')
+    )
+    # Backfill from the purchase history. Past purchases are valued at the
+    # current product price, which is what the old summary query reported.
+    op.execute(
+        """
+        INSERT INTO user_product_totals (user_id, product_id, total_quantity, total_spent)
+        SELECT up.user_id, up.product_id, SUM(up.quantity), SUM(up.quantity * p.price)
+        FROM user_products up
+        JOIN products p ON up.product_id = p.id
+        WHERE up.user_id IS NOT NULL
+        GROUP BY up.user_id, up.product_id
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('user_product_totals')
@@ -0,0 +1,31 @@
+"""Adds product search
+
+Revision ID: 7a41c0e9d2b6
+Revises: 9e5a3f1c7d20
+Create Date: 2026-10-18 22:31:07.118502
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7a41c0e9d2b6'
+down_revision: Union[str, None] = '9e5a3f1c7d20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('products', sa.Column('search_vector', postgresql.TSVECTOR(), sa.Computed("setweight(to_tsvector('english', coalesce(title, '')), 'A') || setweight(to_tsvector('english', coalesce(description, '')), 'B')", persisted=True), nullable=True))
+    op.create_index('ix_products_search_vector', 'products', ['search_vector'], unique=False, postgresql_using='gin')
+    op.create_index('ix_products_title_prefix', 'products', [sa.text('lower(title) COLLATE "C"'), 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_products_title_prefix', table_name='products')
+    op.drop_index('ix_products_search_vector', table_name='products', postgresql_using='gin')
+    op.drop_column('products', 'search_vector')
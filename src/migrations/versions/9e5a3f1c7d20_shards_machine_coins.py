@@ -0,0 +1,40 @@
+"""Shards machine coins
+
+Revision ID: 9e5a3f1c7d20
+Revises: 4c0d2b7e91a3
+Create Date: 2026-10-18 19:05:11.604127
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9e5a3f1c7d20'
+down_revision: Union[str, None] = '4c0d2b7e91a3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # The existing counts become shard 0
+    op.add_column('machine_coins', sa.Column('shard', sa.Integer(), server_default='0', autoincrement=False, nullable=False))
+    op.drop_constraint('ck_machine_coins_count_not_negative', 'machine_coins', type_='check')
+    op.drop_constraint('machine_coins_pkey', 'machine_coins', type_='primary')
+    op.create_primary_key('machine_coins_pkey', 'machine_coins', ['denomination', 'shard'])
+
+
+def downgrade() -> None:
+    op.execute(
+        """
+        INSERT INTO machine_coins (denomination, shard, count)
+        SELECT denomination, -1, GREATEST(SUM(count), 0) FROM machine_coins GROUP BY denomination
+        """
+    )
+    op.execute("DELETE FROM machine_coins WHERE shard <> -1")
+    op.drop_constraint('machine_coins_pkey', 'machine_coins', type_='primary')
+    op.drop_column('machine_coins', 'shard')
+    op.create_primary_key('machine_coins_pkey', 'machine_coins', ['denomination'])
+    op.create_check_constraint('ck_machine_coins_count_not_negative', 'machine_coins', 'count >= 0')
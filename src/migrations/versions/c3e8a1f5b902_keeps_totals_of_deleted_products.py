@@ -0,0 +1,44 @@
+"""Keeps totals and snapshots of deleted products
+
+Revision ID: c3e8a1f5b902
+Revises: 5b8e2d6f0a47
+Create Date: 2026-10-19 10:12:37.518204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3e8a1f5b902'
+down_revision: Union[str, None] = '5b8e2d6f0a47'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLES = ('user_product_totals', 'user_product_snapshots')
+
+
+def upgrade() -> None:
+    # product_id can no longer be part of the primary key once it may be NULL
+    for table in TABLES:
+        op.execute(f"ALTER TABLE {table} ADD COLUMN id SERIAL")
+        op.drop_constraint(f'{table}_pkey', table, type_='primary')
+        op.create_primary_key(f'{table}_pkey', table, ['id'])
+        op.create_unique_constraint(f'uq_{table}_user_id_product_id', table, ['user_id', 'product_id'])
+        op.alter_column(table, 'product_id', existing_type=sa.Integer(), nullable=True)
+        op.drop_constraint(f'{table}_product_id_fkey', table, type_='foreignkey')
+        op.create_foreign_key(f'{table}_product_id_fkey', table, 'products', ['product_id'], ['id'], ondelete='SET NULL')
+
+
+def downgrade() -> None:
+    for table in TABLES:
+        op.execute(f"DELETE FROM {table} WHERE product_id IS NULL")
+        op.drop_constraint(f'{table}_product_id_fkey', table, type_='foreignkey')
+        op.create_foreign_key(f'{table}_product_id_fkey', table, 'products', ['product_id'], ['id'], ondelete='CASCADE')
+        op.alter_column(table, 'product_id', existing_type=sa.Integer(), nullable=False)
+        op.drop_constraint(f'uq_{table}_user_id_product_id', table, type_='unique')
+        op.drop_constraint(f'{table}_pkey', table, type_='primary')
+        op.create_primary_key(f'{table}_pkey', table, ['user_id', 'product_id'])
+        op.drop_column(table, 'id')
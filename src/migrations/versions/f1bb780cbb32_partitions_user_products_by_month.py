@@ -0,0 +1,108 @@
+"""Partitions user_products by month
+
+Revision ID: f1bb780cbb32
+Revises: 5bf66ca09605
+Create Date: 2026-10-18 15:27:44.905126
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f1bb780cbb32'
+down_revision: Union[str, None] = '5bf66ca09605'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Partitions are created up front for this many months; after that the app
+# and the compaction job keep them ahead (see src/core/partitions.py).
+MONTHS_AHEAD = 12
+
+
+def upgrade() -> None:
+    op.execute("ALTER TABLE user_products RENAME TO user_products_unpartitioned")
+    op.execute("ALTER TABLE user_products_unpartitioned RENAME CONSTRAINT user_products_pkey TO user_products_unpartitioned_pkey")
+    op.execute("ALTER INDEX ix_user_products_created_at RENAME TO ix_user_products_unpartitioned_created_at")
+    # The primary key of a partitioned table has to include the partition key
+    op.execute(
+        """
+        CREATE TABLE user_products (
+            id INTEGER NOT NULL DEFAULT nextval('user_products_id_seq'),
+            user_id INTEGER CONSTRAINT user_products_user_id_fkey REFERENCES users (id),
+            product_id INTEGER CONSTRAINT user_products_product_id_fkey REFERENCES products (id),
+            quantity INTEGER,
+            unit_price INTEGER NOT NULL,
+            created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+            PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+        """
+    )
+    op.create_index('ix_user_products_created_at', 'user_products', ['created_at'], unique=False)
+    op.create_index('ix_user_products_user_id_created_at', 'user_products', ['user_id', 'created_at'], unique=False)
+    op.execute("CREATE TABLE user_products_default PARTITION OF user_products DEFAULT")
+    op.execute(
+        f"""
+        DO $$
+        DECLARE
+            month date;
+        BEGIN
+            FOR month IN
+                SELECT generate_series(
+                    date_trunc('month', LEAST(
+                        (SELECT MIN(created_at) FROM user_products_unpartitioned), now()
+                    ) AT TIME ZONE 'UTC'),
+                    date_trunc('month', now() AT TIME ZONE 'UTC') + interval '{MONTHS_AHEAD} months',
+                    interval '1 month'
+                )::date
+            LOOP
+                EXECUTE format(
+                    'CREATE TABLE %I PARTITION OF user_products FOR VALUES FROM (%L) TO (%L)',
+                    'user_products_p' || to_char(month, 'YYYYMM'),
+                    month || ' 00:00:00+00',
+                    (month + interval '1 month')::date || ' 00:00:00+00'
+                );
+            END LOOP;
+        END
+        $$
+        """
+    )
+    op.execute(
+        """
+        INSERT INTO user_products (id, user_id, product_id, quantity, unit_price, created_at)
+        SELECT id, user_id, product_id, quantity, unit_price, created_at
+        FROM user_products_unpartitioned
+        """
+    )
+    op.execute("ALTER SEQUENCE user_products_id_seq OWNED BY user_products.id")
+    op.drop_table('user_products_unpartitioned')
+
+
+def downgrade() -> None:
+    op.execute("ALTER TABLE user_products RENAME TO user_products_partitioned")
+    op.execute("ALTER TABLE user_products_partitioned RENAME CONSTRAINT user_products_pkey TO user_products_partitioned_pkey")
+    op.execute("ALTER INDEX ix_user_products_created_at RENAME TO ix_user_products_partitioned_created_at")
+    op.execute(
+        """
+        CREATE TABLE user_products (
+            id INTEGER NOT NULL DEFAULT nextval('user_products_id_seq') PRIMARY KEY,
+            user_id INTEGER CONSTRAINT user_products_user_id_fkey REFERENCES users (id),
+            product_id INTEGER CONSTRAINT user_products_product_id_fkey REFERENCES products (id),
+            quantity INTEGER,
+            created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+            unit_price INTEGER NOT NULL
+        )
+        """
+    )
+    op.create_index('ix_user_products_created_at', 'user_products', ['created_at'], unique=False)
+    op.execute(
+        """
+        INSERT INTO user_products (id, user_id, product_id, quantity, created_at, unit_price)
+        SELECT id, user_id, product_id, quantity, created_at, unit_price
+        FROM user_products_partitioned
+        """
+    )
+    op.execute("ALTER SEQUENCE user_products_id_seq OWNED BY user_products.id")
+    op.execute("DROP TABLE user_products_partitioned")
@@ -0,0 +1,26 @@
+"""Adds in-stock products index
+
+Revision ID: ffe2e2059ddb
+Revises: 739bb5b3c6d8
+Create Date: 2026-10-18 10:02:17.451390
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'ffe2e2059ddb'
+down_revision: Union[str, None] = '739bb5b3c6d8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_products_in_stock_id', 'products', ['id'], unique=False, postgresql_where=sa.text('quantity > 0'))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_products_in_stock_id', table_name='products', postgresql_where=sa.text('quantity > 0'))
@@ -2,8 +2,10 @@ from fastapi import APIRouter
 
 from src.app.users.user_controller import router as users
 from src.app.products.products_controller import router as products
+from src.app.system.system_controller import router as system
 
 api_router = APIRouter()
 
 api_router.include_router(users, prefix="/users", tags=["users"])
-api_router.include_router(products, prefix="/products", tags=["products"])
\ No newline at end of file
+api_router.include_router(products, prefix="/products", tags=["products"])
+api_router.include_router(system, prefix="/system", tags=["system"])
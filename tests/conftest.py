@@ -0,0 +1,15 @@
+import pytest
+
+from src.app.util.rate_limit import limiter
+from src.core.config import settings
+
+# The /system endpoints are disabled without a token
+settings.OPS_TOKEN = settings.OPS_TOKEN or "test-ops-token"
+
+
+@pytest.fixture(autouse=True, scope="session")
+def disable_rate_limits():
+    # The suite sends far more requests per minute from one client than the
+    # production limits allow; tests/test_rate_limit.py turns them back on.
+    limiter.enabled = False
+    yield
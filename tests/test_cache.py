@@ -0,0 +1,59 @@
+import time
+
+from src.core.cache import TTLCache, caches
+
+
+def test_cache_hit_and_miss():
+    cache = TTLCache("test_hit_and_miss", maxsize=2, ttl=60)
+    assert cache.get("a") is None
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+    assert caches["test_hit_and_miss"] is cache
+
+def test_cache_evicts_least_recently_used():
+    cache = TTLCache("test_evicts", maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["size"] == 2
+
+def test_cache_entries_expire():
+    cache = TTLCache("test_expire", maxsize=2, ttl=60)
+    cache.set("a", 1, ttl=0.01)
+    cache.set("b", 2)
+    time.sleep(0.02)
+
+    assert cache.get("a") is None
+    assert cache.get("b") == 2
+    assert cache.stats()["size"] == 1
+
+def test_cache_invalidate_and_clear():
+    cache = TTLCache("test_invalidate", maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.invalidate("a")
+    assert cache.get("a") is None
+    cache.clear()
+    assert cache.get("b") is None
+
+def test_cache_skips_values_read_before_an_invalidation():
+    cache = TTLCache("test_generation", maxsize=2, ttl=60)
+    generation = cache.generation
+    cache.invalidate("a")
+    cache.set("a", "stale", generation=generation)
+    assert cache.get("a") is None
+    cache.set("a", "fresh", generation=cache.generation)
+    assert cache.get("a") == "fresh"
+
+def test_disabled_cache_stores_nothing():
+    cache = TTLCache("test_disabled", maxsize=0, ttl=60)
+    cache.set("a", 1)
+    assert cache.get("a") is None
@@ -0,0 +1,73 @@
+import random
+
+import pytest
+
+from src.app.util.change import fewest_coins, greedy_change, make_change, payable
+
+
+def coins_used(change):
+    return sum(change.values())
+
+
+def value(change):
+    return sum(coin * count for coin, count in change.items())
+
+
+@pytest.mark.parametrize(
+    "amount, change",
+    [
+        (0, {}),
+        (5, {5: 1}),
+        (85, {50: 1, 20: 1, 10: 1, 5: 1}),
+        (190, {100: 1, 50: 1, 20: 2}),
+        (1000, {100: 10}),
+    ],
+)
+def test_unlimited_coins(amount, change):
+    assert make_change(amount) == change
+
+
+def test_amount_must_be_payable():
+    assert make_change(7) is None
+    assert make_change(-5) is None
+    assert payable(137) == 135
+    assert payable(-3) == 0
+
+
+def test_limited_coins_avoid_greedy_dead_ends():
+    inventory = {50: 1, 20: 3}
+    assert make_change(60, inventory) == {20: 3}
+    assert make_change(70, inventory) == {50: 1, 20: 1}
+    assert make_change(10, inventory) is None
+    assert make_change(120, inventory) is None
+
+
+def test_large_amounts_with_plenty_of_coins():
+    inventory = {100: 10**9, 50: 10**9, 20: 10**9, 10: 10**9, 5: 10**9}
+    amount = 10**9 + 85
+    assert make_change(amount, inventory) == greedy_change(amount)
+
+    # Once the 100s run out the rest is paid in the next coins down
+    inventory[100] = 3
+    change = make_change(amount, inventory)
+    assert change[100] == 3
+    assert value(change) == amount
+
+
+def test_matches_exhaustive_search():
+    # fewest_coins on its own is a full DP over the amount, so it can be
+    # trusted on small amounts to check the shortcuts make_change takes
+    rng = random.Random(0)
+    for _ in range(3000):
+        inventory = {
+            coin: rng.choice([0, 1, 2, 3, 5, 20]) for coin in (100, 50, 20, 10, 5)
+        }
+        amount = 5 * rng.randint(0, 200)
+        expected = fewest_coins(amount, inventory)
+        change = make_change(amount, inventory)
+        if expected is None:
+            assert change is None
+            continue
+        assert value(change) == amount
+        assert all(count <= inventory[coin] for coin, count in change.items())
+        assert coins_used(change) == coins_used(expected)
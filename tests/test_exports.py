@@ -0,0 +1,213 @@
+import csv
+import io
+import json
+import os
+import subprocess
+import sys
+from urllib.parse import quote
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from src.app.users.user_schema import Role
+from src.app.util import export
+from src.core.db import SessionLocal
+from src.main import app
+from tests.utils.utils import (
+    generate_random_word,
+    login_delete_user,
+    makeRequest,
+    register_login_user,
+)
+
+client = TestClient(app)
+
+seller = generate_random_word(10)
+buyer = generate_random_word(10)
+password = "password"
+
+
+def setup_purchases(rows: int = 0):
+    """A seller's product bought by a buyer, plus `rows` purchases written
+    straight to the ledger, spread over the last few months."""
+    seller_token = register_login_user(client, seller, password, Role.seller.value)
+    buyer_token = register_login_user(client, buyer, password, Role.buyer.value)
+    product = makeRequest(
+        client,
+        "post",
+        "products/",
+        data={"title": generate_random_word(12), "price": 10, "quantity": 5},
+        headers={"Authorization": f"Bearer {seller_token}"},
+    ).json()
+    headers = {"Authorization": f"Bearer {buyer_token}"}
+    makeRequest(client, "post", "users/deposit", data={"denomination": 20}, headers=headers)
+    r = makeRequest(client, "get", f"products/buy/{product['id']}?quantity=2", headers=headers)
+    assert r.status_code == 200
+    if rows:
+        with SessionLocal() as db:
+            db.execute(
+                text(
+                    """
+                    INSERT INTO user_products (user_id, product_id, quantity, unit_price, created_at)
+                    SELECT :user_id, :product_id, 1, 10, now() - n * interval '1 minute'
+                    FROM generate_series(1, :rows) AS n
+                    """
+                ),
+                {"user_id": r.json()["user_id"], "product_id": product["id"], "rows": rows},
+            )
+            db.commit()
+    return seller_token, buyer_token, product, r.json()["user_id"]
+
+
+def test_purchases_export():
+    _, buyer_token, product, _ = setup_purchases()
+    headers = {"Authorization": f"Bearer {buyer_token}"}
+
+    r = makeRequest(client, "get", "users/purchases/export", headers=headers)
+    assert r.status_code == 200
+    assert r.headers["content-type"] == "application/x-ndjson"
+    assert r.headers["content-disposition"] == 'attachment; filename="purchases.ndjson"'
+    rows = [json.loads(line) for line in r.text.splitlines()]
+    assert [(row["product_id"], row["title"], row["quantity"], row["unit_price"]) for row in rows] == [
+        (product["id"], product["title"], 2, 10)
+    ]
+
+    r = makeRequest(client, "get", "users/purchases/export?format=csv", headers=headers)
+    assert r.headers["content-type"].startswith("text/csv")
+    rows = list(csv.reader(io.StringIO(r.text)))
+    assert rows[0] == ["id", "product_id", "title", "quantity", "unit_price", "created_at"]
+    assert rows[1][1:5] == [str(product["id"]), product["title"], "2", "10"]
+
+    r = makeRequest(client, "get", "users/purchases/export?until=2001-01-01T00:00:00", headers=headers)
+    assert r.text == ""
+    r = makeRequest(client, "get", "users/purchases/export?format=xml", headers=headers)
+    assert r.status_code == 422
+    assert makeRequest(client, "get", "users/purchases/export").status_code == 401
+
+
+def test_sales_export():
+    seller_token, buyer_token, product, buyer_id = setup_purchases()
+
+    r = makeRequest(
+        client,
+        "get",
+        "users/sales/export?format=csv",
+        headers={"Authorization": f"Bearer {seller_token}"},
+    )
+    assert r.status_code == 200
+    assert r.headers["content-disposition"] == 'attachment; filename="sales.csv"'
+    rows = list(csv.reader(io.StringIO(r.text)))
+    assert rows[0] == [
+        "id", "product_id", "title", "buyer_id", "quantity", "unit_price", "created_at"
+    ]
+    assert rows[1][1:6] == [str(product["id"]), product["title"], str(buyer_id), "2", "10"]
+    assert len(rows) == 2
+
+    r = makeRequest(
+        client, "get", "users/sales/export", headers={"Authorization": f"Bearer {buyer_token}"}
+    )
+    assert r.status_code == 401
+
+
+def test_concurrent_exports_are_capped(monkeypatch):
+    monkeypatch.setattr(export, "export_slots", export.ExportSlots(1))
+    _, buyer_token, _, _ = setup_purchases()
+    headers = {"Authorization": f"Bearer {buyer_token}"}
+
+    # Another export is streaming
+    export.export_slots.acquire()
+    try:
+        r = makeRequest(client, "get", "users/purchases/export", headers=headers)
+        assert r.status_code == 503
+        assert r.headers["Retry-After"] == "5"
+    finally:
+        export.export_slots.release()
+
+    # Each finished export gives its slot back
+    for _ in range(2):
+        r = makeRequest(client, "get", "users/purchases/export", headers=headers)
+        assert r.status_code == 200
+
+
+# Streams an export through the ASGI app in a fresh process, discarding the
+# body, and reports the peak RSS after a small export and after a full one
+MEASURE_EXPORT = """
+import asyncio, json, resource, sys
+from src.main import app
+
+async def export(query, token):
+    size = 0
+    requested = asyncio.Event()
+
+    async def receive():
+        # The request, then nothing until the response is done: the client
+        # never disconnects
+        if requested.is_set():
+            await asyncio.Event().wait()
+        requested.set()
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal size
+        if message["type"] == "http.response.start":
+            assert message["status"] == 200, message
+        size += len(message.get("body", b""))
+
+    await app(
+        {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": "/api/v1/users/purchases/export",
+            "raw_path": b"/api/v1/users/purchases/export",
+            "query_string": query.encode(),
+            "root_path": "",
+            "headers": [(b"authorization", f"Bearer {token}".encode())],
+            "client": ("127.0.0.1", 1),
+            "server": ("test", 80),
+        },
+        receive,
+        send,
+    )
+    return size
+
+async def main(token, since):
+    small = await export(f"since={since}", token)
+    small_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    full = await export("format=csv", token)
+    full_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({"small": small, "full": full, "small_rss": small_rss, "full_rss": full_rss}))
+
+asyncio.run(main(sys.argv[1], sys.argv[2]))
+"""
+
+
+@pytest.mark.skipif(sys.platform != "linux", reason="ru_maxrss is in KiB on Linux")
+def test_export_memory_is_bounded():
+    _, buyer_token, _, _ = setup_purchases(rows=200_000)
+    with SessionLocal() as db:
+        since = db.execute(text("SELECT now() - interval '20 minutes'")).scalar_one()
+
+    result = subprocess.run(
+        [sys.executable, "-c", MEASURE_EXPORT, buyer_token, quote(since.isoformat())],
+        capture_output=True,
+        text=True,
+        env={**os.environ, "PYTHONWARNINGS": "ignore"},
+        timeout=300,
+    )
+    assert result.returncode == 0, result.stderr
+    report = json.loads(result.stdout.splitlines()[-1])
+    # About 14 MB of CSV; holding it, or the rows, would add far more than
+    # the few batches in flight
+    assert report["full"] > 10_000_000
+    assert report["full_rss"] - report["small_rss"] < 10 * 1024
+
+
+@pytest.fixture(autouse=True)
+def run_before_and_after_tests(tmpdir):
+    yield
+    login_delete_user(client, buyer, password)
+    login_delete_user(client, seller, password)
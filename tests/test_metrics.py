@@ -0,0 +1,92 @@
+import re
+
+from fastapi.testclient import TestClient
+
+from src.core.metrics import Histogram, histograms
+from src.main import app
+from tests.utils.utils import (
+    generate_random_word,
+    login_delete_user,
+    makeRequest,
+    ops_headers,
+    register_login_user,
+)
+
+client = TestClient(app)
+
+password = "password"
+
+
+def server_timing(response) -> dict:
+    timings = {}
+    for entry in response.headers["Server-Timing"].split(", "):
+        name, *params = entry.split(";")
+        timings[name] = dict(param.split("=", 1) for param in params)
+    return timings
+
+
+def metric(text: str, name: str, **labels) -> float:
+    label_text = ",".join(f'{key}="{value}"' for key, value in labels.items())
+    match = re.search(rf"^{name}\{{{re.escape(label_text)}\}} (\S+)$", text, re.MULTILINE)
+    return float(match.group(1)) if match else 0.0
+
+
+def test_histogram_renders_prometheus_text():
+    histogram = Histogram("test_seconds", "Test.", ("route",), (0.1, 1))
+    try:
+        histogram.observe(("/a",), 0.05)
+        histogram.observe(("/a",), 0.5)
+        histogram.observe(("/a",), 5)
+        assert list(histogram.render()) == [
+            "# HELP test_seconds Test.",
+            "# TYPE test_seconds histogram",
+            'test_seconds_bucket{route="/a",le="0.1"} 1',
+            'test_seconds_bucket{route="/a",le="1"} 2',
+            'test_seconds_bucket{route="/a",le="+Inf"} 3',
+            'test_seconds_sum{route="/a"} 5.55',
+            'test_seconds_count{route="/a"} 3',
+        ]
+    finally:
+        histograms.remove(histogram)
+
+
+def test_server_timing_counts_statements():
+    username = generate_random_word(10)
+    access_token = register_login_user(client, username, password)
+    headers = {"Authorization": f"Bearer {access_token}"}
+
+    # A sync route, whose session runs in a threadpool thread
+    r = makeRequest(client, "get", "users/", headers=headers)
+    assert server_timing(r)["db"]["desc"] == '"2 statements"'
+
+    # An async route, whose statements run in SQLAlchemy's greenlet
+    r = makeRequest(client, "post", "users/deposit", data={"denomination": 5}, headers=headers)
+    timings = server_timing(r)
+    assert timings["db"]["desc"] == '"2 statements"'
+    assert float(timings["app"]["dur"]) >= float(timings["db"]["dur"])
+    assert "pool" in timings
+
+    r = makeRequest(client, "post", "users/login", data={"username": username, "password": password})
+    assert float(server_timing(r)["hash"]["dur"]) > 0
+
+    login_delete_user(client, username, password)
+
+
+def test_metrics_endpoint():
+    route = "/api/v1/products/{product_id}"
+    before = makeRequest(client, "get", "system/metrics", headers=ops_headers()).text
+    makeRequest(client, "get", "products/999999999")
+
+    r = makeRequest(client, "get", "system/metrics", headers=ops_headers())
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/plain")
+    labels = {"method": "GET", "route": route, "status": "404"}
+    assert (
+        metric(r.text, "http_request_duration_seconds_count", **labels)
+        == metric(before, "http_request_duration_seconds_count", **labels) + 1
+    )
+    assert metric(r.text, "http_request_db_statements_count", method="GET", route=route) >= 1
+    assert 'db_pool_checkouts{pool="async"}' in r.text
+
+    r = makeRequest(client, "get", "system/metrics")
+    assert r.status_code == 401
@@ -0,0 +1,132 @@
+import json
+from datetime import date, datetime, timezone
+
+from sqlalchemy import text
+
+from src.app.products.products_service import PURCHASE_HISTORY_QUERY, compact_purchase_ledger
+from src.core.config import settings
+from src.core.db import SessionLocal
+from src.core.partitions import (
+    add_months,
+    ensure_purchase_partitions,
+    list_purchase_partitions,
+    month_start,
+    partition_name,
+)
+
+
+def insert_purchase(db, created_at, user_id=None, product_id=None):
+    return db.execute(
+        text(
+            "INSERT INTO user_products (user_id, product_id, quantity, unit_price, created_at) "
+            "VALUES (:user_id, :product_id, 1, 5, :created_at) RETURNING id"
+        ),
+        {"user_id": user_id, "product_id": product_id, "created_at": created_at},
+    ).scalar_one()
+
+
+def partition_of(db, id):
+    return db.execute(
+        text("SELECT tableoid::regclass::text FROM user_products WHERE id = :id"), {"id": id}
+    ).scalar_one()
+
+
+def scanned_relations(db, params):
+    plan = db.execute(
+        text(f"EXPLAIN (FORMAT JSON) {PURCHASE_HISTORY_QUERY.text}"), params
+    ).scalar_one()
+    plan = plan if isinstance(plan, list) else json.loads(plan)
+    relations = set()
+
+    def walk(node):
+        if node.get("Relation Name", "").startswith("user_products"):
+            relations.add(node["Relation Name"])
+        for child in node.get("Plans", []):
+            walk(child)
+
+    walk(plan[0]["Plan"])
+    return relations
+
+
+def test_ensure_partitions_moves_rows_out_of_default():
+    start = date(2040, 1, 1)
+    with SessionLocal() as db:
+        id = insert_purchase(db, datetime(2040, 1, 15, tzinfo=timezone.utc))
+        db.commit()
+        assert partition_of(db, id) == "user_products_default"
+        try:
+            created = ensure_purchase_partitions(db, 1, start)
+            assert created == ["user_products_p204001", "user_products_p204002"]
+            assert partition_of(db, id) == "user_products_p204001"
+            assert ensure_purchase_partitions(db, 1, start) == []
+            assert {start, add_months(start, 1)} <= set(list_purchase_partitions(db))
+        finally:
+            db.rollback()
+            db.execute(text("DELETE FROM user_products WHERE id = :id"), {"id": id})
+            db.execute(text("DROP TABLE IF EXISTS user_products_p204001"))
+            db.execute(text("DROP TABLE IF EXISTS user_products_p204002"))
+            db.commit()
+
+
+def test_compaction_drops_expired_partitions():
+    month = date(2001, 1, 1)
+    with SessionLocal() as db:
+        ensure_purchase_partitions(db, 0, month)
+        ids = [
+            insert_purchase(db, datetime(2001, 1, day, tzinfo=timezone.utc))
+            for day in (3, 4)
+        ]
+        db.commit()
+        assert partition_of(db, ids[0]) == "user_products_p200101"
+
+        compacted = compact_purchase_ledger(datetime(2001, 3, 1, tzinfo=timezone.utc), db)
+
+        assert compacted == 2
+        assert month not in list_purchase_partitions(db)
+        current = month_start(datetime.now(timezone.utc))
+        assert current in list_purchase_partitions(db)
+
+
+def test_purchase_history_query_prunes_partitions():
+    current = month_start(datetime.now(timezone.utc))
+    with SessionLocal() as db:
+        ensure_purchase_partitions(db, 1)
+        params = {
+            "user_id": 1,
+            "since": datetime.combine(current, datetime.min.time(), timezone.utc),
+            "until": datetime.combine(current, datetime.min.time(), timezone.utc).replace(day=15),
+            "before_created_at": datetime(2100, 1, 1, tzinfo=timezone.utc),
+            "before_id": 0,
+            "limit": 20,
+        }
+        assert scanned_relations(db, params) == {partition_name(current)}
+
+        next_month = add_months(current, 1)
+        params["until"] = datetime.combine(next_month, datetime.min.time(), timezone.utc).replace(day=2)
+        assert scanned_relations(db, params) == {
+            partition_name(current),
+            partition_name(next_month),
+        }
+
+
+def test_compaction_does_not_queue_behind_readers(monkeypatch):
+    monkeypatch.setattr(settings, "LEDGER_PARTITION_LOCK_TIMEOUT_MS", 50)
+    month = date(2002, 1, 1)
+    with SessionLocal() as db, SessionLocal() as reader:
+        ensure_purchase_partitions(db, 0, month)
+        for day in (3, 4):
+            insert_purchase(db, datetime(2002, 1, day, tzinfo=timezone.utc))
+        db.commit()
+        # An open transaction that has read the ledger holds a lock the drop
+        # would have to wait for
+        reader.execute(text("SELECT COUNT(*) FROM user_products WHERE id = 0"))
+        try:
+            compacted = compact_purchase_ledger(datetime(2002, 3, 1, tzinfo=timezone.utc), db)
+            # Moved in batches instead, leaving the partition empty
+            assert compacted == 2
+            assert month in list_purchase_partitions(db)
+        finally:
+            reader.rollback()
+
+        assert compact_purchase_ledger(datetime(2002, 3, 1, tzinfo=timezone.utc), db) == 0
+        assert month not in list_purchase_partitions(db)
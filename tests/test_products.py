@@ -1,8 +1,22 @@
 from fastapi.testclient import TestClient
 from src.app.users.user_schema import Role
-from tests.utils.utils import makeRequest, register_login_user, login_delete_user, generate_random_word
+from tests.utils.utils import makeRequest, register_login_user, login_delete_user, generate_random_word, count_queries, ops_headers
 from src.main import app
 import pytest
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import text
+from src.app.products.products_service import (
+    buy_product,
+    buy_products,
+    compact_purchase_ledger,
+    get_product_by_id_async,
+    product_cache,
+)
+from src.app.util.cursor import encode_cursor
+from src.core.config import settings
+from src.core.db import AsyncSessionLocal, SessionLocal
 
 client = TestClient(app)
 
@@ -86,6 +100,149 @@ def test_create_product_invalid_price():
     assert "detail" in r.json()
     assert r.json()["detail"] == "Invalid Denomination value. Allowed values are: 5, 10, 20, 50, 100"
 
+def import_products(access_token, content, content_type="application/json"):
+    return client.post(
+        f"{settings.API_V1_STR}/products/import",
+        headers={"Authorization": f"Bearer {access_token}", "Content-Type": content_type},
+        content=content,
+    )
+
+
+def test_import_products():
+    access_token = register_login_user(client, username, password, Role.seller.value)
+    other = generate_random_word(8)
+    other_token = register_login_user(client, other, password, Role.seller.value)
+    tag = generate_random_word(12)
+    create_product(f"{tag} taken", 10, "description", 1, other_token)
+    create_product(f"{tag} mine", 10, "description", 1, access_token)
+
+    r = import_products(
+        access_token,
+        json.dumps(
+            [
+                {"title": f"{tag} new", "price": 20, "quantity": 3},
+                {"title": f"{tag} mine", "price": 50, "description": "updated"},
+                {"title": f"{tag} cents", "price": 3},
+                {"title": f"{tag} new", "price": 5},
+                {"price": 5},
+                "product",
+                {"title": f"{tag} taken", "price": 5},
+            ]
+        ),
+    )
+    assert r.status_code == 200
+    assert r.json() == {
+        "created": 1,
+        "updated": 1,
+        "failed": 5,
+        "errors": [
+            {"row": 3, "error": "Invalid Denomination value. Allowed values are: 5, 10, 20, 50, 100"},
+            {"row": 4, "error": "Duplicate title in this import"},
+            {"row": 5, "error": "title: Field required"},
+            {"row": 6, "error": "Expected an object"},
+            {"row": 7, "error": "Title is already used by another seller"},
+        ],
+    }
+    r = makeRequest(client, "get", f"products/search?q={tag}&mode=prefix")
+    products = {product["title"]: product for product in r.json()}
+    assert (products[f"{tag} new"]["price"], products[f"{tag} new"]["quantity"]) == (20, 3)
+    assert products[f"{tag} mine"]["description"] == "updated"
+    assert products[f"{tag} taken"]["price"] == 10
+
+    login_delete_user(client, other, password)
+
+
+def test_import_products_streamed(monkeypatch):
+    monkeypatch.setattr(settings, "PRODUCT_IMPORT_BATCH_SIZE", 2)
+    access_token = register_login_user(client, username, password, Role.seller.value)
+    tag = generate_random_word(12)
+
+    body = (
+        "title,price,quantity,description\r\n"
+        f'{tag} café,10,2,"crème, ""fraîche""\nand more"\r\n'
+        f"{tag} b,5,,\r\n"
+        f"{tag} c,five,1,\r\n"
+        f"{tag} d,100,99999999999,\r\n"
+        f"{tag} e,50,1,last\r\n"
+    ).encode()
+    # Chunks split lines, and characters, in two
+    r = import_products(
+        access_token, (body[i:i + 7] for i in range(0, len(body), 7)), "text/csv"
+    )
+    assert r.status_code == 200
+    assert r.json()["created"] == 3
+    assert [error["row"] for error in r.json()["errors"]] == [3, 4]
+    assert r.json()["errors"][1]["error"] == "Value out of range"
+    r = makeRequest(client, "get", f"products/search?q={tag}&mode=prefix")
+    products = {product["title"]: product for product in r.json()}
+    assert sorted(products) == [f"{tag} b", f"{tag} café", f"{tag} e"]
+    assert products[f"{tag} café"]["description"] == 'crème, "fraîche"\nand more'
+    assert products[f"{tag} b"]["quantity"] == 1
+
+    body = f'{{"title": "{tag} b", "price": 20}}\n\nnot json\n{{"title": "{tag} f", "price": 5}}'
+    r = import_products(access_token, body, "application/x-ndjson")
+    assert r.json() == {
+        "created": 1,
+        "updated": 1,
+        "failed": 1,
+        "errors": [{"row": 2, "error": "Invalid JSON"}],
+    }
+
+
+def test_import_products_keeps_fields_a_row_leaves_out():
+    access_token = register_login_user(client, username, password, Role.seller.value)
+    tag = generate_random_word(12)
+    create_product(f"{tag} a", 10, "description a", 7, access_token)
+    create_product(f"{tag} b", 10, "description b", 7, access_token)
+    create_product(f"{tag} c", 10, "description c", 7, access_token)
+
+    r = import_products(
+        access_token,
+        json.dumps(
+            [
+                {"title": f"{tag} a", "price": 20},
+                {"title": f"{tag} b", "price": 20, "quantity": 2, "description": None},
+            ]
+        ),
+    )
+    assert r.json()["updated"] == 2
+    r = import_products(access_token, f"title,price,quantity,description\n{tag} c,50,,\n", "text/csv")
+    assert r.json()["updated"] == 1
+
+    r = makeRequest(client, "get", f"products/search?q={tag}&mode=prefix")
+    assert [
+        (product["price"], product["quantity"], product["description"]) for product in r.json()
+    ] == [(20, 7, "description a"), (20, 2, None), (50, 7, "description c")]
+
+
+def test_import_products_invalid_utf8_row():
+    access_token = register_login_user(client, username, password, Role.seller.value)
+    tag = generate_random_word(12)
+    body = f"title,price\n{tag} a,5\n".encode() + b"\xff\xfe,5\n" + f"{tag} b,5\n".encode()
+
+    r = import_products(access_token, body, "text/csv")
+    assert r.status_code == 200
+    assert r.json() == {
+        "created": 2,
+        "updated": 0,
+        "failed": 1,
+        "errors": [{"row": 2, "error": "Invalid UTF-8"}],
+    }
+
+
+def test_import_products_invalid_body():
+    access_token = register_login_user(client, username, password, Role.seller.value)
+    assert import_products(access_token, "title\n", "text/plain").status_code == 415
+    r = import_products(access_token, '{"title": "product", "price": 5}')
+    assert r.status_code == 400
+    assert r.json()["detail"] == "Expected a JSON array of products"
+
+    buyer = generate_random_word(8)
+    buyer_token = register_login_user(client, buyer, password)
+    assert import_products(buyer_token, "[]").status_code == 401
+    login_delete_user(client, buyer, password)
+
+
 def test_get_available_products():
     access_token = register_login_user(client, username, password, Role.seller.value)
     assert access_token is not None
@@ -113,7 +270,183 @@ def test_get_available_products():
     assert r.json()[1]["price"] == 50
     assert r.json()[1]["description"] == "description"
     assert r.json()[1]["quantity"] == 5
-    
+
+
+def test_get_available_products_by_cursor():
+    access_token = register_login_user(client, username, password, Role.seller.value)
+    assert access_token is not None
+    for i in range(5):
+        product = create_product(f"product{i}", 10, "description", 1, access_token)
+        assert product is not None
+    product = create_product("product5", 10, "description", 0, access_token)
+    assert product is not None
+
+    titles = []
+    r = makeRequest(client, "get", "products/available-products?page_size=2")
+    while r.json():
+        assert r.status_code == 200
+        assert len(r.json()) <= 2
+        titles += [product["title"] for product in r.json()]
+        cursor = r.headers["X-Next-Cursor"]
+        r = makeRequest(
+            client, "get", f"products/available-products?page_size=2&after={cursor}"
+        )
+
+    assert r.status_code == 200
+    assert "X-Next-Cursor" not in r.headers
+    assert titles == [f"product{i}" for i in range(5)]
+
+    r = makeRequest(client, "get", "products/available-products?page_size=2&pagenum=3")
+    assert r.status_code == 200
+    assert [product["title"] for product in r.json()] == ["product4"]
+
+def test_get_available_products_page_size_cap(monkeypatch):
+    monkeypatch.setattr(settings, "PRODUCTS_MAX_PAGE_SIZE", 2)
+    access_token = register_login_user(client, username, password, Role.seller.value)
+    assert access_token is not None
+    products = [
+        create_product(f"product{i}", 10, "description", 1, access_token) for i in range(3)
+    ]
+
+    r = makeRequest(
+        client,
+        "get",
+        f"products/available-products?page_size=3&owner_id={products[0]['owner_id']}",
+    )
+    assert r.status_code == 200
+    assert [product["id"] for product in r.json()] == [product["id"] for product in products[:2]]
+
+def test_get_available_products_invalid_cursor():
+    r = makeRequest(client, "get", "products/available-products?after=invalid")
+
+    assert r.status_code == 400
+    assert r.json()["detail"] == "Invalid cursor"
+
+    r = makeRequest(client, "get", f"products/available-products?after={encode_cursor({'id': 'a'})}")
+    assert r.status_code == 400
+    # Keys other than the sort's are ignored, whatever they hold
+    r = makeRequest(
+        client, "get", f"products/available-products?after={encode_cursor({'id': 1, 'x': [1]})}"
+    )
+    assert r.status_code == 200
+
+
+def test_get_available_products_filtered_and_sorted():
+    access_token = register_login_user(client, username, password, Role.seller.value)
+    tag = generate_random_word(12)
+    owner_id = None
+    for title, price, quantity in (
+        ("d", 20, 1),
+        ("a", 50, 1),
+        ("c", 10, 1),
+        ("e", 20, 1),
+        ("b", 100, 0),
+        ("f", 5, 1),
+    ):
+        owner_id = create_product(f"{tag}-{title}", price, "", quantity, access_token)["owner_id"]
+
+    def walk(query):
+        titles = []
+        url = f"products/available-products?owner_id={owner_id}&page_size=2&{query}"
+        r = makeRequest(client, "get", url)
+        while r.json():
+            titles += [product["title"][-1] for product in r.json()]
+            cursor = r.headers["X-Next-Cursor"]
+            r = makeRequest(client, "get", f"{url}&after={cursor}")
+        return "".join(titles)
+
+    assert walk("") == "dacef"
+    assert walk("sort=title") == "acdef"
+    assert walk("sort=title&descending=true&in_stock=false") == "fedcba"
+    # Equal prices come in id order, reversed when descending
+    assert walk("sort=price") == "fcdea"
+    assert walk("sort=price&descending=true") == "aedcf"
+    assert walk("sort=price&min_price=10&max_price=50") == "cdea"
+    assert walk("sort=price&min_price=50&in_stock=false") == "ab"
+
+    r = makeRequest(
+        client,
+        "get",
+        f"products/available-products?owner_id={owner_id}&sort=price&pagenum=2&page_size=2",
+    )
+    assert [product["title"][-1] for product in r.json()] == ["d", "e"]
+
+    # A cursor from one sort does not fit another
+    r = makeRequest(client, "get", "products/available-products?sort=title")
+    cursor = r.headers["X-Next-Cursor"]
+    r = makeRequest(client, "get", f"products/available-products?sort=price&after={cursor}")
+    assert r.status_code == 400
+    assert r.json()["detail"] == "Invalid cursor"
+    r = makeRequest(client, "get", "products/available-products?sort=rating")
+    assert r.status_code == 422
+
+
+def test_search_products_by_prefix():
+    access_token = register_login_user(client, username, password, Role.seller.value)
+    tag = generate_random_word(12)
+    for title, quantity in (
+        (f"{tag} Cola", 1),
+        (f"{tag} coffee", 1),
+        (f"{tag} Chips", 1),
+        (f"{tag} cocoa", 0),
+        (f"{tag}_cake", 1),
+    ):
+        create_product(title, 10, "description", quantity, access_token)
+
+    titles = []
+    r = makeRequest(client, "get", f"products/search?q={tag} CO&mode=prefix&page_size=1")
+    while r.json():
+        titles += [product["title"] for product in r.json()]
+        cursor = r.headers["X-Next-Cursor"]
+        r = makeRequest(
+            client, "get", f"products/search?q={tag} co&mode=prefix&page_size=1&after={cursor}"
+        )
+    assert titles == [f"{tag} coffee", f"{tag} Cola"]
+
+    # _ and % are matched literally
+    r = makeRequest(client, "get", f"products/search?q={tag}_&mode=prefix")
+    assert [product["title"] for product in r.json()] == [f"{tag}_cake"]
+    r = makeRequest(client, "get", f"products/search?q={tag}%25c&mode=prefix")
+    assert r.json() == []
+
+
+def test_search_products_full_text():
+    access_token = register_login_user(client, username, password, Role.seller.value)
+    tag = generate_random_word(12)
+    create_product(f"{tag} sparkling water", 10, "bottled at the source", 1, access_token)
+    create_product(f"{tag} lemonade", 10, "made with sparkling water", 1, access_token)
+    create_product(f"{tag} still water bottles", 10, "", 1, access_token)
+    create_product(f"{tag} juice", 10, "orange", 1, access_token)
+
+    r = makeRequest(client, "get", f"products/search?q={tag} sparkling water")
+    assert r.status_code == 200
+    # A match in the title ranks above one in the description
+    assert [product["title"] for product in r.json()] == [
+        f"{tag} sparkling water",
+        f"{tag} lemonade",
+    ]
+
+    # Stemmed: "bottle" finds "bottled" and "bottles"
+    titles = []
+    r = makeRequest(client, "get", f"products/search?q={tag} bottle&page_size=1")
+    while r.json():
+        titles += [product["title"] for product in r.json()]
+        cursor = r.headers["X-Next-Cursor"]
+        r = makeRequest(client, "get", f"products/search?q={tag} bottle&page_size=1&after={cursor}")
+    assert sorted(titles) == [f"{tag} sparkling water", f"{tag} still water bottles"]
+
+    r = makeRequest(client, "get", f"products/search?q={tag} -water")
+    assert [product["title"] for product in r.json()] == [f"{tag} juice"]
+
+
+def test_search_products_invalid_input():
+    assert makeRequest(client, "get", "products/search?q=").status_code == 422
+    assert makeRequest(client, "get", "products/search?q=a&mode=fuzzy").status_code == 422
+    r = makeRequest(client, "get", "products/search?q=a&after=invalid")
+    assert r.status_code == 400
+    assert r.json()["detail"] == "Invalid cursor"
+
+
 def test_get_product_details():
     access_token = register_login_user(client, username, password, Role.seller.value)
     assert access_token is not None
@@ -581,6 +914,633 @@ def test_buy_multiple_products():
     login_delete_user(client, new_username, password)
 
 
+def test_buy_invalidates_cached_product():
+    access_token = register_login_user(client, username, password, Role.seller.value)
+    assert access_token is not None
+    product = create_product("product", 10, "description", 10, access_token)
+    assert product is not None
+
+    new_username = generate_random_word(7)
+    access_token = register_login_user(client, new_username, password, Role.buyer.value)
+    assert access_token is not None
+
+    r = makeRequest(
+        client,
+        "post",
+        "users/deposit",
+        data={"denomination": 50},
+        headers={"Authorization": f"Bearer {access_token}"},
+    )
+    assert r.status_code == 200
+
+    r = makeRequest(client, "get", f"products/{product['id']}")
+    assert r.json()["quantity"] == 10
+    hits = makeRequest(client, "get", "system/cache-stats", headers=ops_headers()).json()["products"]["hits"]
+    r = makeRequest(client, "get", f"products/{product['id']}")
+    assert r.json()["quantity"] == 10
+    assert makeRequest(client, "get", "system/cache-stats", headers=ops_headers()).json()["products"]["hits"] == hits + 1
+
+    r = makeRequest(
+        client,
+        "get",
+        f"products/buy/{product['id']}?quantity=2",
+        headers={"Authorization": f"Bearer {access_token}"},
+    )
+    assert r.status_code == 200
+
+    r = makeRequest(client, "get", f"products/{product['id']}")
+    assert r.json()["quantity"] == 8
+    r = makeRequest(client, "get", "products/available-products")
+    assert [p["quantity"] for p in r.json() if p["id"] == product["id"]] == [8]
+    login_delete_user(client, new_username, password)
+
+def test_buy_during_product_read_does_not_cache_stale_product():
+    access_token = register_login_user(client, username, password, Role.seller.value)
+    assert access_token is not None
+    product = create_product("product", 10, "description", 10, access_token)
+    assert product is not None
+
+    new_username = generate_random_word(7)
+    access_token = register_login_user(client, new_username, password, Role.buyer.value)
+    assert access_token is not None
+    user_id = deposit(access_token, 50)["id"]
+
+    async def read_while_buying():
+        async with AsyncSessionLocal() as db:
+            scalar = db.scalar
+
+            async def scalar_then_buy(*args, **kwargs):
+                # The row is read, then a buy commits before it is cached
+                row = await scalar(*args, **kwargs)
+                async with AsyncSessionLocal() as buyer_db:
+                    assert await buy_product(product["id"], 2, user_id, buyer_db)
+                return row
+
+            db.scalar = scalar_then_buy
+            return await get_product_by_id_async(product["id"], db)
+
+    assert asyncio.run(read_while_buying()).quantity == 10
+    assert product_cache.get(product["id"]) is None
+    r = makeRequest(client, "get", f"products/{product['id']}")
+    assert r.json()["quantity"] == 8
+    login_delete_user(client, new_username, password)
+
+def test_concurrent_buy_does_not_oversell():
+    access_token = register_login_user(client, username, password, Role.seller.value)
+    assert access_token is not None
+    product = create_product("product", 20, "description", 10, access_token)
+    assert product is not None
+
+    buyers = []
+    for _ in range(8):
+        buyer_username = generate_random_word(7)
+        buyer_token = register_login_user(client, buyer_username, password, Role.buyer.value)
+        assert buyer_token is not None
+        r = makeRequest(
+            client,
+            "post",
+            "users/deposit",
+            data={"denomination": 100},
+            headers={"Authorization": f"Bearer {buyer_token}"},
+        )
+        assert r.status_code == 200
+        buyers.append((buyer_username, r.json()["id"]))
+
+    results = buy_concurrently(
+        [(product["id"], 3, user_id) for _, user_id in buyers]
+    )
+
+    bought = 0
+    for result in results:
+        if result:
+            bought += result[0]._mapping.total_quantity_bought
+            assert result[0]._mapping.balance >= 0
+    assert bought == 10
+
+    r = makeRequest(client, "get", f"products/{product['id']}")
+    assert r.status_code == 200
+    assert r.json()["quantity"] == 0
+    for buyer_username, _ in buyers:
+        login_delete_user(client, buyer_username, password)
+
+def test_concurrent_buy_does_not_overspend():
+    access_token = register_login_user(client, username, password, Role.seller.value)
+    assert access_token is not None
+    product = create_product("product", 20, "description", 10, access_token)
+    assert product is not None
+
+    new_username = generate_random_word(7)
+    access_token = register_login_user(client, new_username, password, Role.buyer.value)
+    assert access_token is not None
+
+    r = makeRequest(
+        client,
+        "post",
+        "users/deposit",
+        data={"denomination": 50},
+        headers={"Authorization": f"Bearer {access_token}"},
+    )
+    assert r.status_code == 200
+    user_id = r.json()["id"]
+
+    results = buy_concurrently([(product["id"], 2, user_id)] * 5)
+
+    assert len([result for result in results if result]) == 1
+
+    r = makeRequest(
+        client, "get", "users/", headers={"Authorization": f"Bearer {access_token}"}
+    )
+    assert r.status_code == 200
+    assert r.json()["balance"] == 10
+
+    r = makeRequest(client, "get", f"products/{product['id']}")
+    assert r.json()["quantity"] == 8
+    login_delete_user(client, new_username, password)
+
+
+def test_buy_cart():
+    access_token = register_login_user(client, username, password, Role.seller.value)
+    assert access_token is not None
+    product1 = create_product("product1", 10, "description", 10, access_token)
+    assert product1 is not None
+    product2 = create_product("product2", 20, "description", 10, access_token)
+    assert product2 is not None
+
+    new_username = generate_random_word(7)
+    access_token = register_login_user(client, new_username, password, Role.buyer.value)
+    assert access_token is not None
+    deposit(access_token, 100)
+
+    r = makeRequest(
+        client,
+        "post",
+        "products/buy",
+        data={
+            "lines": [
+                {"product_id": product2["id"], "quantity": 1},
+                {"product_id": product1["id"], "quantity": 1},
+                {"product_id": product1["id"], "quantity": 1},
+            ]
+        },
+        headers={"Authorization": f"Bearer {access_token}"},
+    )
+
+    assert r.status_code == 200
+    assert r.json()['username'] == new_username
+    assert r.json()['balance'] == 60
+    assert len(r.json()['products']) == 2
+    assert r.json()['products'][0]['title'] == "product1"
+    assert r.json()['products'][0]['total_spent_on_product'] == 20
+    assert r.json()['products'][0]['total_quantity_bought'] == 2
+    assert r.json()['products'][1]['title'] == "product2"
+    assert r.json()['products'][1]['total_spent_on_product'] == 20
+    assert r.json()['products'][1]['total_quantity_bought'] == 1
+    assert makeRequest(client, "get", f"products/{product1['id']}").json()["quantity"] == 8
+    assert makeRequest(client, "get", f"products/{product2['id']}").json()["quantity"] == 9
+    login_delete_user(client, new_username, password)
+
+def test_buy_cart_is_all_or_nothing():
+    access_token = register_login_user(client, username, password, Role.seller.value)
+    assert access_token is not None
+    product1 = create_product("product1", 10, "description", 10, access_token)
+    assert product1 is not None
+    product2 = create_product("product2", 50, "description", 10, access_token)
+    assert product2 is not None
+    # An id that certainly belongs to no product
+    missing = create_product("product3", 10, "description", 10, access_token)
+    r = makeRequest(
+        client,
+        "delete",
+        f"products/{missing['id']}",
+        headers={"Authorization": f"Bearer {access_token}"},
+    )
+    assert r.status_code == 200
+
+    new_username = generate_random_word(7)
+    access_token = register_login_user(client, new_username, password, Role.buyer.value)
+    assert access_token is not None
+    deposit(access_token, 50)
+
+    for lines in (
+        [{"product_id": product1["id"], "quantity": 1}, {"product_id": product2["id"], "quantity": 1}],
+        [{"product_id": product1["id"], "quantity": 1}, {"product_id": missing["id"], "quantity": 1}],
+        [{"product_id": product1["id"], "quantity": 1}, {"product_id": product2["id"], "quantity": 0}],
+        [],
+    ):
+        r = makeRequest(
+            client,
+            "post",
+            "products/buy",
+            data={"lines": lines},
+            headers={"Authorization": f"Bearer {access_token}"},
+        )
+        assert r.status_code == 404
+        assert r.json()["detail"] == "Product not found or insufficient balance"
+
+    r = makeRequest(
+        client, "get", "users/", headers={"Authorization": f"Bearer {access_token}"}
+    )
+    assert r.json()["balance"] == 50
+    assert makeRequest(client, "get", f"products/{product1['id']}").json()["quantity"] == 10
+    assert makeRequest(client, "get", f"products/{product2['id']}").json()["quantity"] == 10
+    login_delete_user(client, new_username, password)
+
+def test_concurrent_carts_do_not_deadlock():
+    access_token = register_login_user(client, username, password, Role.seller.value)
+    assert access_token is not None
+    product1 = create_product("product1", 5, "description", 100, access_token)
+    assert product1 is not None
+    product2 = create_product("product2", 5, "description", 100, access_token)
+    assert product2 is not None
+
+    buyers = []
+    for _ in range(3):
+        buyer_username = generate_random_word(7)
+        buyer_token = register_login_user(client, buyer_username, password, Role.buyer.value)
+        assert buyer_token is not None
+        buyers.append((buyer_username, deposit(buyer_token, 100)["id"]))
+
+    # Each buyer checks out several carts at once, in both line orders; 12
+    # carts stay within the async pool
+    carts = []
+    for i, (_, user_id) in enumerate(buyers * 4):
+        lines = [(product1["id"], 1), (product2["id"], 1)]
+        carts.append((lines if i % 2 else lines[::-1], user_id))
+
+    async def buy_cart_in_new_session(lines, user_id):
+        async with AsyncSessionLocal() as db:
+            return await buy_products(lines, user_id, db)
+
+    async def buy_all():
+        return await asyncio.gather(
+            *(buy_cart_in_new_session(*cart) for cart in carts)
+        )
+
+    results = asyncio.run(buy_all())
+    assert all(results)
+    assert makeRequest(client, "get", f"products/{product1['id']}").json()["quantity"] == 88
+    assert makeRequest(client, "get", f"products/{product2['id']}").json()["quantity"] == 88
+    for buyer_username, _ in buyers:
+        login_delete_user(client, buyer_username, password)
+
+def test_user_products_query_count():
+    access_token = register_login_user(client, username, password, Role.seller.value)
+    assert access_token is not None
+    products = [
+        create_product(f"product{i}", 5, "description", 10, access_token)
+        for i in range(3)
+    ]
+
+    new_username = generate_random_word(7)
+    access_token = register_login_user(client, new_username, password, Role.buyer.value)
+    assert access_token is not None
+    headers = {"Authorization": f"Bearer {access_token}"}
+    deposit(access_token, 50)
+    r = makeRequest(
+        client,
+        "post",
+        "products/buy",
+        data={"lines": [{"product_id": p["id"], "quantity": 2} for p in products]},
+        headers=headers,
+    )
+    assert r.status_code == 200
+
+    with count_queries() as statements:
+        r = makeRequest(client, "get", "users/", headers=headers)
+    assert r.status_code == 200
+    assert [p["id"] for p in r.json()["products"]] == [p["id"] for p in products]
+    assert len(statements) == 2
+
+    with count_queries() as statements:
+        r = makeRequest(client, "get", "users/?include_products=false", headers=headers)
+    assert r.json()["products"] == []
+    assert len(statements) == 1
+
+    for method, url, data, queries in (
+        ("post", "users/deposit", {"denomination": 5}, 2),
+        ("post", "users/deposit/batch", {"coins": [5, 5]}, 2),
+        # The reset leaves machine_coins alone without the coin inventory
+        ("post", "users/reset", {}, 2),
+        ("patch", "users/", {"new_username": new_username}, 2),
+    ):
+        with count_queries() as statements:
+            r = makeRequest(client, method, url, data=data, headers=headers)
+        assert r.status_code == 200
+        assert len(r.json()["products"]) == 3
+        assert len(statements) == queries
+
+    login_delete_user(client, new_username, password)
+
+def test_user_products_pagination():
+    access_token = register_login_user(client, username, password, Role.seller.value)
+    assert access_token is not None
+    products = [
+        create_product(f"product{i}", 5, "description", 10, access_token)
+        for i in range(3)
+    ]
+
+    new_username = generate_random_word(7)
+    access_token = register_login_user(client, new_username, password, Role.buyer.value)
+    assert access_token is not None
+    headers = {"Authorization": f"Bearer {access_token}"}
+    deposit(access_token, 50)
+    r = makeRequest(
+        client,
+        "post",
+        "products/buy",
+        data={"lines": [{"product_id": p["id"], "quantity": 1} for p in products]},
+        headers=headers,
+    )
+    assert r.status_code == 200
+
+    r = makeRequest(client, "get", "users/?products_limit=2", headers=headers)
+    assert r.status_code == 200
+    assert [p["id"] for p in r.json()["products"]] == [p["id"] for p in products[:2]]
+
+    r = makeRequest(
+        client,
+        "get",
+        f"users/?products_limit=2&products_after={products[1]['id']}",
+        headers=headers,
+    )
+    assert r.status_code == 200
+    assert [p["id"] for p in r.json()["products"]] == [products[2]["id"]]
+
+    r = makeRequest(client, "get", "users/?products_limit=-1", headers=headers)
+    assert r.status_code == 200
+    assert [p["id"] for p in r.json()["products"]] == [products[0]["id"]]
+
+    login_delete_user(client, new_username, password)
+
+def test_purchase_ledger_records_price_paid():
+    seller_token = register_login_user(client, username, password, Role.seller.value)
+    assert seller_token is not None
+    product = create_product("product", 10, "description", 10, seller_token)
+    assert product is not None
+
+    new_username = generate_random_word(7)
+    access_token = register_login_user(client, new_username, password, Role.buyer.value)
+    assert access_token is not None
+    headers = {"Authorization": f"Bearer {access_token}"}
+    user_id = deposit(access_token, 50)["id"]
+
+    r = makeRequest(client, "get", f"products/buy/{product['id']}?quantity=1", headers=headers)
+    assert r.status_code == 200
+    r = makeRequest(
+        client,
+        "patch",
+        f"products/{product['id']}",
+        data={"price": 20},
+        headers={"Authorization": f"Bearer {seller_token}"},
+    )
+    assert r.status_code == 200
+    r = makeRequest(client, "get", f"products/buy/{product['id']}?quantity=1", headers=headers)
+    assert r.status_code == 200
+    assert r.json()["products"][0]["total_spent_on_product"] == 30
+    assert r.json()["balance"] == 20
+
+    with SessionLocal() as db:
+        prices = db.execute(
+            text("SELECT unit_price FROM user_products WHERE user_id = :user_id ORDER BY id"),
+            {"user_id": user_id},
+        ).scalars().all()
+    assert prices == [10, 20]
+    login_delete_user(client, new_username, password)
+
+def test_compact_purchase_ledger():
+    access_token = register_login_user(client, username, password, Role.seller.value)
+    assert access_token is not None
+    product1 = create_product("product1", 10, "description", 10, access_token)
+    assert product1 is not None
+    product2 = create_product("product2", 20, "description", 10, access_token)
+    assert product2 is not None
+
+    new_username = generate_random_word(7)
+    access_token = register_login_user(client, new_username, password, Role.buyer.value)
+    assert access_token is not None
+    headers = {"Authorization": f"Bearer {access_token}"}
+    user_id = deposit(access_token, 100)["id"]
+
+    r = makeRequest(
+        client,
+        "post",
+        "products/buy",
+        data={
+            "lines": [
+                {"product_id": product1["id"], "quantity": 2},
+                {"product_id": product2["id"], "quantity": 1},
+            ]
+        },
+        headers=headers,
+    )
+    assert r.status_code == 200
+
+    with SessionLocal() as db:
+        db.execute(
+            text(
+                "UPDATE user_products SET created_at = now() - interval '100 days' "
+                "WHERE user_id = :user_id"
+            ),
+            {"user_id": user_id},
+        )
+        db.commit()
+
+    r = makeRequest(client, "get", f"products/buy/{product1['id']}?quantity=1", headers=headers)
+    assert r.status_code == 200
+    summary = {p["id"]: p for p in r.json()["products"]}
+
+    cutoff = datetime.now(timezone.utc) - timedelta(days=90)
+    with SessionLocal() as db:
+        assert compact_purchase_ledger(cutoff, db, batch_size=1) == 2
+        assert compact_purchase_ledger(cutoff, db) == 0
+        ledger = db.execute(
+            text("SELECT product_id, quantity FROM user_products WHERE user_id = :user_id"),
+            {"user_id": user_id},
+        ).all()
+        snapshots = db.execute(
+            text(
+                "SELECT product_id, quantity, spent FROM user_product_snapshots "
+                "WHERE user_id = :user_id ORDER BY product_id"
+            ),
+            {"user_id": user_id},
+        ).all()
+
+    assert ledger == [(product1["id"], 1)]
+    assert snapshots == [(product1["id"], 2, 20), (product2["id"], 1, 20)]
+    assert summary[product1["id"]]["total_quantity_bought"] == 3
+    assert summary[product1["id"]]["total_spent_on_product"] == 30
+    assert summary[product2["id"]]["total_quantity_bought"] == 1
+    login_delete_user(client, new_username, password)
+
+def test_compact_purchase_ledger_of_deleted_product():
+    seller_token = register_login_user(client, username, password, Role.seller.value)
+    product1 = create_product("product1", 10, "description", 10, seller_token)
+    product2 = create_product("product2", 20, "description", 10, seller_token)
+
+    new_username = generate_random_word(7)
+    access_token = register_login_user(client, new_username, password, Role.buyer.value)
+    user_id = deposit(access_token, 100)["id"]
+    r = makeRequest(
+        client,
+        "post",
+        "products/buy",
+        data={
+            "lines": [
+                {"product_id": product1["id"], "quantity": 2},
+                {"product_id": product2["id"], "quantity": 1},
+            ]
+        },
+        headers={"Authorization": f"Bearer {access_token}"},
+    )
+    assert r.status_code == 200
+    r = makeRequest(
+        client,
+        "delete",
+        f"products/{product2['id']}",
+        headers={"Authorization": f"Bearer {seller_token}"},
+    )
+    assert r.status_code == 200
+
+    amounts = text(
+        """
+        SELECT
+            (SELECT COALESCE(SUM(quantity), 0) FROM user_products WHERE user_id = :user_id)
+                + (SELECT COALESCE(SUM(quantity), 0) FROM user_product_snapshots WHERE user_id = :user_id),
+            (SELECT COALESCE(SUM(quantity * unit_price), 0) FROM user_products WHERE user_id = :user_id)
+                + (SELECT COALESCE(SUM(spent), 0) FROM user_product_snapshots WHERE user_id = :user_id)
+        """
+    )
+    with SessionLocal() as db:
+        before = db.execute(amounts, {"user_id": user_id}).one()
+        db.execute(
+            text(
+                "UPDATE user_products SET created_at = now() - interval '100 days' "
+                "WHERE user_id = :user_id"
+            ),
+            {"user_id": user_id},
+        )
+        db.commit()
+        assert compact_purchase_ledger(datetime.now(timezone.utc) - timedelta(days=90), db) == 2
+        after = db.execute(amounts, {"user_id": user_id}).one()
+        snapshots = db.execute(
+            text(
+                "SELECT product_id, quantity, spent FROM user_product_snapshots "
+                "WHERE user_id = :user_id ORDER BY product_id"
+            ),
+            {"user_id": user_id},
+        ).all()
+        totals = db.execute(
+            text(
+                "SELECT product_id, total_quantity, total_spent FROM user_product_totals "
+                "WHERE user_id = :user_id ORDER BY product_id"
+            ),
+            {"user_id": user_id},
+        ).all()
+
+    assert before == after == (3, 40)
+    assert snapshots == [(product1["id"], 2, 20), (None, 1, 20)]
+    assert totals == [(product1["id"], 2, 20), (None, 1, 20)]
+    login_delete_user(client, new_username, password)
+
+
+def test_purchase_history():
+    access_token = register_login_user(client, username, password, Role.seller.value)
+    assert access_token is not None
+    product1 = create_product("product1", 10, "description", 10, access_token)
+    assert product1 is not None
+    product2 = create_product("product2", 20, "description", 10, access_token)
+    assert product2 is not None
+
+    new_username = generate_random_word(7)
+    access_token = register_login_user(client, new_username, password, Role.buyer.value)
+    assert access_token is not None
+    headers = {"Authorization": f"Bearer {access_token}"}
+    deposit(access_token, 50)
+    for product in (product1, product2):
+        r = makeRequest(client, "get", f"products/buy/{product['id']}?quantity=1", headers=headers)
+        assert r.status_code == 200
+
+    r = makeRequest(client, "get", "users/purchases?page_size=1", headers=headers)
+    assert r.status_code == 200
+    assert [(p["product_id"], p["title"], p["unit_price"]) for p in r.json()] == [
+        (product2["id"], "product2", 20)
+    ]
+
+    r = makeRequest(
+        client,
+        "get",
+        f"users/purchases?page_size=1&after={r.headers['X-Next-Cursor']}",
+        headers=headers,
+    )
+    assert r.status_code == 200
+    assert [p["product_id"] for p in r.json()] == [product1["id"]]
+
+    r = makeRequest(client, "get", "users/purchases?until=2001-01-01T00:00:00", headers=headers)
+    assert r.status_code == 200
+    assert r.json() == []
+
+    r = makeRequest(client, "get", "users/purchases?after=invalid", headers=headers)
+    assert r.status_code == 400
+
+    r = makeRequest(client, "get", "users/purchases?page_size=-1", headers=headers)
+    assert r.status_code == 200
+    assert [p["product_id"] for p in r.json()] == [product2["id"]]
+    login_delete_user(client, new_username, password)
+
+def test_delete_buyer_keeps_bought_products():
+    access_token = register_login_user(client, username, password, Role.seller.value)
+    assert access_token is not None
+    product = create_product("product", 10, "description", 10, access_token)
+    assert product is not None
+
+    new_username = generate_random_word(7)
+    access_token = register_login_user(client, new_username, password, Role.buyer.value)
+    assert access_token is not None
+    headers = {"Authorization": f"Bearer {access_token}"}
+    user_id = deposit(access_token, 50)["id"]
+    for _ in range(2):
+        r = makeRequest(client, "get", f"products/buy/{product['id']}?quantity=1", headers=headers)
+        assert r.status_code == 200
+    assert r.json()["products"][0]["total_quantity_bought"] == 2
+
+    r = makeRequest(client, "delete", "users/", headers=headers)
+    assert r.status_code == 200
+    assert makeRequest(client, "get", f"products/{product['id']}").json()["quantity"] == 8
+    with SessionLocal() as db:
+        assert db.execute(
+            text("SELECT count(*) FROM user_products WHERE user_id = :user_id"),
+            {"user_id": user_id},
+        ).scalar_one() == 0
+
+def test_delete_product_keeps_buyers_and_their_history():
+    seller_token = register_login_user(client, username, password, Role.seller.value)
+    assert seller_token is not None
+    product = create_product("product", 10, "description", 10, seller_token)
+    assert product is not None
+
+    new_username = generate_random_word(7)
+    access_token = register_login_user(client, new_username, password, Role.buyer.value)
+    assert access_token is not None
+    headers = {"Authorization": f"Bearer {access_token}"}
+    deposit(access_token, 50)
+    r = makeRequest(client, "get", f"products/buy/{product['id']}?quantity=1", headers=headers)
+    assert r.status_code == 200
+
+    r = makeRequest(
+        client,
+        "delete",
+        f"products/{product['id']}",
+        headers={"Authorization": f"Bearer {seller_token}"},
+    )
+    assert r.status_code == 200
+    r = makeRequest(client, "get", "users/", headers=headers)
+    assert r.status_code == 200
+    assert r.json()["products"] == []
+    # The ledger keeps the purchase and the price paid, without the product
+    r = makeRequest(client, "get", "users/purchases", headers=headers)
+    assert [(p["product_id"], p["title"], p["unit_price"]) for p in r.json()] == [(None, None, 10)]
+    login_delete_user(client, new_username, password)
+
 #Developer functions
 def create_product(title, price, description, quantity, access_token):
     r = makeRequest(
@@ -598,6 +1558,31 @@ def create_product(title, price, description, quantity, access_token):
     return r.json()
 
 
+def deposit(access_token, amount):
+    r = makeRequest(
+        client,
+        "post",
+        "users/deposit",
+        data={"denomination": amount},
+        headers={"Authorization": f"Bearer {access_token}"},
+    )
+    assert r.status_code == 200
+    return r.json()
+
+
+def buy_concurrently(purchases):
+    async def buy_in_new_session(product_id, quantity, user_id):
+        async with AsyncSessionLocal() as db:
+            return await buy_product(product_id, quantity, user_id, db)
+
+    async def buy_all():
+        return await asyncio.gather(
+            *(buy_in_new_session(*purchase) for purchase in purchases)
+        )
+
+    return asyncio.run(buy_all())
+
+
 @pytest.fixture(autouse=True)
 def run_before_and_after_tests(tmpdir):
     yield
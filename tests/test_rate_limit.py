@@ -0,0 +1,128 @@
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from limits import parse
+from limits.storage import storage_from_string
+from limits.strategies import FixedWindowRateLimiter
+
+from src.app.users.user_schema import Role
+from src.app.util.rate_limit import limiter
+from src.core.config import settings
+from src.core.rate_limit import BoundedMemoryStorage
+from src.main import app
+from tests.utils.utils import makeRequest, register_login_user, login_delete_user, generate_random_word
+
+client = TestClient(app)
+
+password = "password"
+
+
+@pytest.fixture
+def rate_limits():
+    limiter.reset()
+    limiter.enabled = True
+    yield
+    limiter.enabled = False
+    limiter.reset()
+
+
+def test_bounded_memory_storage_evicts_least_recent_key():
+    storage = storage_from_string("bounded-memory://?max_keys=2")
+    assert isinstance(storage, BoundedMemoryStorage)
+
+    storage.incr("a", 60)
+    storage.incr("b", 60)
+    storage.incr("a", 60)
+    storage.incr("c", 60)
+
+    assert storage.get("a") == 2
+    assert storage.get("b") == 0
+    assert storage.get("c") == 1
+    assert len(storage.storage) == 2
+
+
+def test_sqlite_storage_is_shared_between_workers(tmp_path):
+    uri = f"sqlite://{tmp_path}/ratelimit.db"
+    first, second = storage_from_string(uri), storage_from_string(uri)
+    limit = parse("3/minute")
+
+    assert all(FixedWindowRateLimiter(first).hit(limit, "user:1") for _ in range(2))
+    assert FixedWindowRateLimiter(second).hit(limit, "user:1")
+    assert not FixedWindowRateLimiter(second).hit(limit, "user:1")
+    assert not FixedWindowRateLimiter(first).hit(limit, "user:1")
+    assert FixedWindowRateLimiter(first).hit(limit, "user:2")
+
+    first.clear("user:1")
+    assert second.get("user:1") == 0
+
+
+def test_sqlite_storage_window_expires(tmp_path):
+    storage = storage_from_string(f"sqlite://{tmp_path}/ratelimit.db")
+
+    assert storage.incr("key", 1) == 1
+    assert storage.incr("key", 1) == 2
+    time.sleep(1.1)
+    assert storage.get("key") == 0
+    assert storage.incr("key", 1) == 1
+
+
+def test_redis_storage():
+    fakeredis = pytest.importorskip("fakeredis")
+    import redis
+
+    # A local stand-in for the Redis server shared by every worker
+    pool = redis.ConnectionPool(
+        connection_class=fakeredis.FakeConnection, server=fakeredis.FakeServer()
+    )
+    workers = [
+        FixedWindowRateLimiter(
+            storage_from_string("redis://localhost:6379/0", connection_pool=pool)
+        )
+        for _ in range(2)
+    ]
+    limit = parse("2/minute")
+
+    assert workers[0].hit(limit, "user:1")
+    assert workers[1].hit(limit, "user:1")
+    assert not workers[0].hit(limit, "user:1")
+    assert workers[1].hit(limit, "user:2")
+
+
+def test_login_is_limited_per_address(rate_limits):
+    count, _ = settings.RATE_LIMIT_LOGIN.split("/")
+    for _ in range(int(count)):
+        r = makeRequest(
+            client, "post", "users/login", data={"username": "missing", "password": password}
+        )
+        assert r.status_code == 404
+
+    r = makeRequest(
+        client, "post", "users/login", data={"username": "missing", "password": password}
+    )
+    assert r.status_code == 429
+
+
+def test_authenticated_requests_are_limited_per_user(rate_limits):
+    usernames = [generate_random_word(7) for _ in range(2)]
+    tokens = [register_login_user(client, name, password, Role.buyer.value) for name in usernames]
+    assert all(tokens)
+
+    count, _ = settings.RATE_LIMIT_DEFAULT.split("/")
+    headers = {"Authorization": f"Bearer {tokens[0]}"}
+    for _ in range(int(count)):
+        r = makeRequest(client, "get", "users/?include_products=false", headers=headers)
+        assert r.status_code == 200
+    r = makeRequest(client, "get", "users/?include_products=false", headers=headers)
+    assert r.status_code == 429
+
+    r = makeRequest(
+        client,
+        "get",
+        "users/?include_products=false",
+        headers={"Authorization": f"Bearer {tokens[1]}"},
+    )
+    assert r.status_code == 200
+
+    for name in usernames:
+        login_delete_user(client, name, password)
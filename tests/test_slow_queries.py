@@ -0,0 +1,74 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from src.core.config import settings
+from src.core.slow_queries import shape
+from src.main import app
+from tests.utils.utils import (
+    generate_random_word,
+    login_delete_user,
+    makeRequest,
+    register_login_user,
+)
+
+client = TestClient(app)
+
+password = "password"
+
+
+@pytest.fixture
+def slow_query_log(monkeypatch, tmp_path):
+    # Every statement counts as slow and is explained
+    path = tmp_path / "slow.log"
+    monkeypatch.setattr(settings, "SLOW_QUERY_LOG_ENABLED", True)
+    monkeypatch.setattr(settings, "SLOW_QUERY_THRESHOLD_MS", 0)
+    monkeypatch.setattr(settings, "SLOW_QUERY_EXPLAIN_SAMPLE_RATE", 1.0)
+    monkeypatch.setattr(settings, "SLOW_QUERY_LOG_FILE", str(path))
+
+    def entries():
+        if not path.exists():
+            return []
+        return [json.loads(line) for line in path.read_text().splitlines()]
+
+    return entries
+
+
+def test_parameter_shape_hides_values():
+    assert shape({"user_id": 7, "product_ids": [1, 2, 3], "title": "secret"}) == {
+        "user_id": "int",
+        "product_ids": "list[int x 3]",
+        "title": "str",
+    }
+    assert shape(("x", None)) == "tuple[str x 2]"
+
+
+def test_logs_service_function_and_plan(slow_query_log):
+    username = generate_random_word(10)
+    access_token = register_login_user(client, username, password)
+    headers = {"Authorization": f"Bearer {access_token}"}
+
+    # Async: the statement runs in the AsyncSession's greenlet
+    makeRequest(client, "post", "users/deposit", data={"denomination": 5}, headers=headers)
+    # Sync: the statement runs in a threadpool thread
+    r = makeRequest(client, "get", "users/", headers=headers)
+    # The deposit was explained, and so ran twice, but applied once
+    assert r.json()["balance"] == 5
+
+    entries = slow_query_log()
+    functions = {entry["function"] for entry in entries}
+    assert {"user_service.add_amount", "user_service.get_user"} <= functions
+    deposit = next(entry for entry in entries if entry["function"] == "user_service.add_amount")
+    assert deposit["statement"].startswith("WITH deposited AS")
+    assert deposit["parameters"]["balance_1"] == "int"
+    assert "5" not in json.dumps(deposit["parameters"])
+    assert any("Buffers" in line or "Execution Time" in line for line in deposit["plan"])
+
+    login_delete_user(client, username, password)
+
+
+def test_off_by_default(slow_query_log, monkeypatch):
+    monkeypatch.setattr(settings, "SLOW_QUERY_LOG_ENABLED", False)
+    makeRequest(client, "get", "products/available-products")
+    assert slow_query_log() == []
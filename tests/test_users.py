@@ -1,8 +1,18 @@
 from fastapi.testclient import TestClient
 from src.app.users.user_schema import Role
-from tests.utils.utils import makeRequest, login_delete_user, register_login_user, generate_random_word
+from tests.utils.utils import makeRequest, login_delete_user, register_login_user, generate_random_word, ops_headers
 from src.main import app
 import pytest
+import asyncio
+import httpx
+import threading
+from datetime import timedelta
+from src.app.users import auth
+from src.core.config import settings
+from src.core import db as db_module
+from src.core.db import SessionLocal
+from src.core.models import User
+from sqlalchemy import update
 
 client = TestClient(app)
 
@@ -178,6 +188,61 @@ def test_invalid_deposit_amount():
     assert "detail" in r.json()
     assert r.json()["detail"] == "Invalid Denomination value. Allowed values are: 5, 10, 20, 50, 100"
 
+def test_deposit_batch():
+    access_token = register_login_user(client, username, password)
+    assert access_token is not None
+
+    r = makeRequest(
+        client,
+        "post",
+        "users/deposit/batch",
+        data={"coins": [5, 10, 100], "counts": {"20": 3, "50": 1}},
+        headers={"Authorization": f"Bearer {access_token}"},
+    )
+
+    assert r.status_code == 200
+    assert r.json()["username"] == username
+    assert r.json()["balance"] == 225
+
+    r = makeRequest(
+        client,
+        "post",
+        "users/deposit/batch",
+        data={"counts": {"5": 1}},
+        headers={"Authorization": f"Bearer {access_token}"},
+    )
+
+    assert r.status_code == 200
+    assert r.json()["balance"] == 230
+
+def test_invalid_deposit_batch():
+    access_token = register_login_user(client, username, password)
+    assert access_token is not None
+
+    for data, detail in (
+        ({"coins": [5, 101]}, "Invalid Denomination value. Allowed values are: 5, 10, 20, 50, 100"),
+        ({"counts": {"25": 1}}, "Invalid Denomination value. Allowed values are: 5, 10, 20, 50, 100"),
+        ({"counts": {"0": 5}}, "Invalid Denomination value. Allowed values are: 5, 10, 20, 50, 100"),
+        ({"coins": [5, 0]}, "Invalid Denomination value. Allowed values are: 5, 10, 20, 50, 100"),
+        ({"counts": {"5": -1}}, "Coin counts must not be negative"),
+        ({"coins": []}, "No coins to deposit"),
+        ({"counts": {"5": 1001}}, "At most 1000 coins can be deposited at once"),
+    ):
+        r = makeRequest(
+            client,
+            "post",
+            "users/deposit/batch",
+            data=data,
+            headers={"Authorization": f"Bearer {access_token}"},
+        )
+        assert r.status_code == 400
+        assert r.json()["detail"] == detail
+
+    r = makeRequest(
+        client, "get", "users/", headers={"Authorization": f"Bearer {access_token}"}
+    )
+    assert r.json()["balance"] == 0
+
 def test_reset_amount():
     access_token = register_login_user(client, username, password)
     assert access_token is not None
@@ -211,7 +276,349 @@ def test_reset_amount():
     assert "id" in r.json()
     assert r.json()["products"] == []
     assert r.json()["balance"] == 0
+    assert r.json()["change"] == {"100": 1}
+
+
+def test_reset_pays_out_fewest_coins():
+    buyer = generate_random_word(10)
+    access_token = register_login_user(client, buyer, password)
+    headers = {"Authorization": f"Bearer {access_token}"}
+    coins = [5, 5, 5, 10, 20, 20, 20, 50, 50, 100, 100]
+
+    r = makeRequest(client, "post", "users/deposit/batch", data={"coins": coins}, headers=headers)
+    assert r.json()["balance"] == 385
+
+    r = makeRequest(client, "post", "users/reset", headers=headers)
+    assert r.status_code == 200
+    assert r.json()["balance"] == 0
+    assert r.json()["change"] == {"100": 3, "50": 1, "20": 1, "10": 1, "5": 1}
+
+    r = makeRequest(client, "post", "users/reset", headers=headers)
+    assert r.json()["change"] == {}
+
+    login_delete_user(client, buyer, password)
+
+
+def machine_coins_held():
+    r = makeRequest(client, "get", "system/coins", headers=ops_headers())
+    assert r.status_code == 200
+    return {int(coin): count for coin, count in r.json()["coins"].items()}
+
+
+def test_reset_pays_out_of_machine_coins(monkeypatch):
+    monkeypatch.setattr(settings, "COIN_INVENTORY_ENABLED", True)
+    buyer = generate_random_word(10)
+    access_token = register_login_user(client, buyer, password)
+    headers = {"Authorization": f"Bearer {access_token}"}
+    held = machine_coins_held()
+
+    r = makeRequest(
+        client, "put", "system/coins", data={"counts": {50: 1, 20: 3}}, headers=ops_headers()
+    )
+    assert r.status_code == 200
+    try:
+        makeRequest(client, "post", "users/deposit/batch", data={"coins": [50, 10]}, headers=headers)
+        assert machine_coins_held() == {10: 1, 20: 3, 50: 2}
+
+        # The operator empties the 10s and takes a 50 out. 50 + 10 is no
+        # longer possible, so three 20s go out instead.
+        makeRequest(client, "put", "system/coins", data={"counts": {50: 1, 20: 3}}, headers=ops_headers())
+        r = makeRequest(client, "post", "users/reset", headers=headers)
+        assert r.status_code == 200
+        assert r.json()["balance"] == 0
+        assert r.json()["change"] == {"20": 3}
+        assert machine_coins_held() == {20: 0, 50: 1}
+
+        makeRequest(client, "post", "users/deposit/batch", data={"coins": [50, 10]}, headers=headers)
+        makeRequest(client, "put", "system/coins", data={"counts": {50: 1}}, headers=ops_headers())
+        r = makeRequest(client, "post", "users/reset", headers=headers)
+        assert r.status_code == 409
+
+        r = makeRequest(client, "get", "users/", headers=headers)
+        assert r.json()["balance"] == 60
+        assert machine_coins_held() == {50: 1}
+    finally:
+        r = makeRequest(client, "put", "system/coins", data={"counts": held}, headers=ops_headers())
+        assert r.status_code == 200
+        login_delete_user(client, buyer, password)
+
+
+def test_machine_coins_count_deposits():
+    buyer = generate_random_word(10)
+    access_token = register_login_user(client, buyer, password)
+    headers = {"Authorization": f"Bearer {access_token}"}
+    before = machine_coins_held()
+
+    makeRequest(client, "post", "users/deposit", data={"denomination": 100}, headers=headers)
+    makeRequest(
+        client, "post", "users/deposit/batch",
+        data={"coins": [20, 5], "counts": {"20": 2}}, headers=headers,
+    )
+    # Without the inventory, change is not taken out of the counts
+    r = makeRequest(client, "post", "users/reset", headers=headers)
+    assert r.json()["change"] == {"100": 1, "50": 1, "10": 1, "5": 1}
+
+    after = machine_coins_held()
+    added = {100: 1, 50: 0, 20: 3, 10: 0, 5: 1}
+    assert {coin: after.get(coin, 0) - before.get(coin, 0) for coin in added} == added
+
+    login_delete_user(client, buyer, password)
+
+
+def test_concurrent_deposits_are_all_counted():
+    buyers = [generate_random_word(10) for _ in range(4)]
+    tokens = [register_login_user(client, buyer, password) for buyer in buyers]
+    before = machine_coins_held()
+
+    async def deposit_all():
+        # Rounds of 12 stay within the async pool, whose wait queue would
+        # otherwise be tied to this test's event loop
+        transport = httpx.ASGITransport(app=app)
+        responses = []
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as ac:
+            for _ in range(3):
+                responses += await asyncio.gather(
+                    *(
+                        ac.post(
+                            f"{settings.API_V1_STR}/users/deposit/batch",
+                            json={"coins": [10, 20]},
+                            headers={"Authorization": f"Bearer {token}"},
+                        )
+                        for token in tokens
+                        for _ in range(3)
+                    )
+                )
+        return responses
+
+    responses = asyncio.run(deposit_all())
+    assert [r.status_code for r in responses] == [200] * 36
+
+    after = machine_coins_held()
+    assert after.get(10, 0) - before.get(10, 0) == 36
+    assert after.get(20, 0) - before.get(20, 0) == 36
+
+    for buyer in buyers:
+        login_delete_user(client, buyer, password)
+
+
+def test_recount_reports_discrepancy():
+    held = machine_coins_held()
+    counted = dict(held)
+    counted[100] = held.get(100, 0) + 2
+    try:
+        r = makeRequest(
+            client, "put", "system/coins", data={"counts": counted}, headers=ops_headers()
+        )
+        assert r.status_code == 200
+        assert r.json()["discrepancy"] == {"100": 2}
+        r = makeRequest(client, "get", "system/coins", headers=ops_headers())
+        # Folded back into one row per coin
+        assert r.json()["shard_rows"] == len([count for count in counted.values() if count])
+    finally:
+        r = makeRequest(client, "put", "system/coins", data={"counts": held}, headers=ops_headers())
+        assert r.status_code == 200
+
+    r = makeRequest(
+        client, "put", "system/coins", data={"counts": {"3": 1}}, headers=ops_headers()
+    )
+    assert r.status_code == 400
+
 
+def test_validated_token_is_cached():
+    access_token = register_login_user(client, username, password)
+    assert access_token is not None
+
+    r = makeRequest(
+        client, "get", "users/", headers={"Authorization": f"Bearer {access_token}"}
+    )
+    assert r.status_code == 200
+    hits = makeRequest(client, "get", "system/cache-stats", headers=ops_headers()).json()["tokens"]["hits"]
+
+    r = makeRequest(
+        client, "get", "users/", headers={"Authorization": f"Bearer {access_token}"}
+    )
+    assert r.status_code == 200
+    assert r.json()["username"] == username
+    stats = makeRequest(client, "get", "system/cache-stats", headers=ops_headers()).json()["tokens"]
+    assert stats["hits"] == hits + 1
+    assert stats["hit_rate"] > 0
+
+def test_expired_token_is_rejected():
+    access_token = register_login_user(client, username, password)
+    assert access_token is not None
+    r = makeRequest(
+        client, "get", "users/", headers={"Authorization": f"Bearer {access_token}"}
+    )
+    user_id = r.json()["id"]
+    expired_token = auth.create_token(
+        {"sub": username, "role": Role.buyer.value, "id": user_id},
+        expires_delta=timedelta(seconds=-1),
+    )
+
+    for _ in range(2):
+        r = makeRequest(
+            client, "get", "users/", headers={"Authorization": f"Bearer {expired_token}"}
+        )
+        assert r.status_code == 401
+        assert r.json()["detail"] == "Could not validate credentials"
+
+
+def test_system_endpoints_need_ops_token(monkeypatch):
+    access_token = register_login_user(client, username, password)
+    assert access_token is not None
+    for endpoint in ("system/pool-stats", "system/cache-stats"):
+        assert makeRequest(client, "get", endpoint).status_code == 401
+        r = makeRequest(
+            client, "get", endpoint, headers={"Authorization": f"Bearer {access_token}"}
+        )
+        assert r.status_code == 401
+        assert makeRequest(client, "get", endpoint, headers=ops_headers()).status_code == 200
+
+    monkeypatch.setattr(settings, "OPS_TOKEN", None)
+    r = makeRequest(client, "get", "system/pool-stats", headers={"Authorization": "Bearer None"})
+    assert r.status_code == 404
+
+
+def test_rejected_token_does_not_check_out_connection(monkeypatch):
+    sessions = []
+
+    def counted(factory):
+        def create():
+            sessions.append(factory)
+            return factory()
+        return create
+
+    monkeypatch.setattr(db_module, "SessionLocal", counted(db_module.SessionLocal))
+    monkeypatch.setattr(db_module, "AsyncSessionLocal", counted(db_module.AsyncSessionLocal))
+    before = makeRequest(client, "get", "system/pool-stats", headers=ops_headers()).json()
+
+    r = makeRequest(client, "get", "users/", headers={"Authorization": "Bearer invalid"})
+    assert r.status_code == 401
+    r = makeRequest(
+        client,
+        "post",
+        "users/deposit",
+        data={"denomination": 10},
+        headers={"Authorization": "Bearer invalid"},
+    )
+    assert r.status_code == 401
+
+    # Not even a session is created
+    assert sessions == []
+    after = makeRequest(client, "get", "system/pool-stats", headers=ops_headers()).json()
+    assert after["sync"]["checkouts"] == before["sync"]["checkouts"]
+    assert after["async"]["checkouts"] == before["async"]["checkouts"]
+
+def test_pool_stats_count_checkouts():
+    access_token = register_login_user(client, username, password)
+    assert access_token is not None
+    before = makeRequest(client, "get", "system/pool-stats", headers=ops_headers()).json()["sync"]
+
+    r = makeRequest(
+        client, "get", "users/", headers={"Authorization": f"Bearer {access_token}"}
+    )
+    assert r.status_code == 200
+
+    after = makeRequest(client, "get", "system/pool-stats", headers=ops_headers()).json()["sync"]
+    assert after["checkouts"] == before["checkouts"] + 1
+    assert after["size"] == settings.DB_POOL_SIZE
+    assert after["wait_seconds_total"] >= before["wait_seconds_total"]
+
+
+def test_login_rejected_when_password_hashing_saturated(monkeypatch):
+    access_token = register_login_user(client, username, password)
+    assert access_token is not None
+    headers = {"Authorization": f"Bearer {access_token}"}
+    # Two bcrypt threads and two waiting calls, held until the burst is in:
+    # of twelve logins four take the slots and the rest are turned away,
+    # while other routes keep answering
+    monkeypatch.setattr(auth, "password_hash_pool", auth.PasswordHashPool(workers=2, max_pending=2))
+    release = threading.Event()
+    verify = auth.pwd_context.verify
+
+    def held_verify(*args):
+        release.wait()
+        return verify(*args)
+
+    monkeypatch.setattr(auth.pwd_context, "verify", held_verify)
+    body = {"username": username, "password": password}
+
+    async def burst():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as ac:
+            logins = [
+                asyncio.ensure_future(ac.post(f"{settings.API_V1_STR}/users/login", json=body))
+                for _ in range(12)
+            ]
+            try:
+                # The four holding slots cannot finish, so this waits for the
+                # other eight to be answered
+                for _ in range(1000):
+                    if sum(login.done() for login in logins) >= 8:
+                        break
+                    await asyncio.sleep(0.01)
+                me = await asyncio.wait_for(
+                    ac.get(f"{settings.API_V1_STR}/users/", headers=headers), timeout=5
+                )
+                rejected = [login.result() for login in logins if login.done()]
+            finally:
+                release.set()
+            return me, rejected, await asyncio.gather(*logins)
+
+    me, rejected, logins = asyncio.run(burst())
+    assert me.status_code == 200
+    assert [r.status_code for r in rejected] == [503] * 8
+    assert rejected[0].headers["Retry-After"] == "1"
+    assert rejected[0].json()["detail"] == "Server is busy, please try again"
+    assert sorted(r.status_code for r in logins) == [200] * 4 + [503] * 8
+
+
+def test_logins_waiting_on_password_hashing_do_not_hold_threads(monkeypatch):
+    access_token = register_login_user(client, username, password)
+    assert access_token is not None
+    headers = {"Authorization": f"Bearer {access_token}"}
+    # More logins than Starlette has threadpool threads (40) wait on a held
+    # bcrypt pool; a sync route must still get a thread and answer
+    monkeypatch.setattr(auth, "password_hash_pool", auth.PasswordHashPool(workers=1, max_pending=60))
+    with SessionLocal() as db:
+        # Cheap hash so that 45 verifications stay fast once released
+        db.execute(
+            update(User)
+            .filter(User.username == username)
+            .values(password=auth.pwd_context.hash(password, rounds=4))
+        )
+        db.commit()
+    release = threading.Event()
+    verify = auth.pwd_context.verify
+
+    def held_verify(*args):
+        release.wait()
+        return verify(*args)
+
+    monkeypatch.setattr(auth.pwd_context, "verify", held_verify)
+    body = {"username": username, "password": password}
+
+    async def burst():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as ac:
+            logins = [
+                asyncio.ensure_future(ac.post(f"{settings.API_V1_STR}/users/login", json=body))
+                for _ in range(45)
+            ]
+            try:
+                await asyncio.sleep(0.2)
+                me = await asyncio.wait_for(
+                    ac.get(f"{settings.API_V1_STR}/users/", headers=headers), timeout=5
+                )
+                waiting = sum(not login.done() for login in logins)
+            finally:
+                release.set()
+            return me, waiting, await asyncio.gather(*logins)
+
+    me, waiting, logins = asyncio.run(burst())
+    assert me.status_code == 200
+    assert waiting == 45
+    assert [r.status_code for r in logins] == [200] * 45
 
 
 @pytest.fixture(autouse=True)
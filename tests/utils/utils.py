@@ -1,8 +1,11 @@
 import random
 import string
+from contextlib import contextmanager
 from fastapi.testclient import TestClient
+from sqlalchemy import event
 from src.app.users.user_schema import Role
 from src.core.config import settings
+from src.core.db import async_engine, engine
 
 
 def makeRequest(
@@ -13,6 +16,10 @@ def makeRequest(
     )
 
 
+def ops_headers():
+    return {"Authorization": f"Bearer {settings.OPS_TOKEN}"}
+
+
 def register_login_user(
     client: TestClient, username: str, password: str, role=Role.buyer.value
 ):
@@ -58,4 +65,21 @@ def login_delete_user(client: TestClient, username: str, password: str):
 
 def generate_random_word(length):
     letters = string.ascii_lowercase
-    return ''.join(random.choice(letters) for _ in range(length))
\ No newline at end of file
+    return ''.join(random.choice(letters) for _ in range(length))
+
+@contextmanager
+def count_queries():
+    """Collect the SQL statements run on either engine inside the block."""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engines = (engine, async_engine.sync_engine)
+    for e in engines:
+        event.listen(e, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        for e in engines:
+            event.remove(e, "before_cursor_execute", record)